@@ -3,17 +3,185 @@
 批量并行生成脚本：
 - 从 data/processed/index.json 挑选前N个模板（可按过滤条件）
 - 并行调用 generate_model.py 生成模型
+- 调度：naive（索引顺序，共享队列）或 affinity（按模板分组 + 成本估算 + 工作窃取，见 batch_planner.py）；
+  报告中始终给出朴素顺序的吞吐对比（成本模型估算；--baseline-run 时为实际执行一遍朴素顺序的实测值）
+- 共享内存解码缓存：批次内各 worker 共享已解码的模板纹理（train/texture_shm.py），批次结束统一释放
+- diffusers 纹理后端（TEXTURE_BACKEND=diffusers/diffusers_batch）：执行前把每个 worker 队列中的纹理任务写成一个任务清单，
+  每个 worker 一次 infer_texture_model --backend diffusers_batch --jobs-file 调用（管线每 worker 只加载一次），
+  对应任务再以 --texture-mode pregenerated 运行；--tiny 使用微型本地管线在 CPU 上端到端检查
+- --tile-store：批次结束后将各输出模型的纹理分块去重入库（train/texture_store.py），模型目录只保留清单
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 import json
 import argparse
+import os
+import shutil
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+import tempfile
+import time
 
+from batch_planner import (
+    BatchJob,
+    assign_groups,
+    build_groups,
+    estimate_template_cost,
+    job_cost,
+    naive_queues,
+    run_plan,
+    simulate_plan,
+)
 
-def run_job(args_list):
-    return subprocess.run(args_list, capture_output=True, text=True)
+sys.path.append(str(Path(__file__).parent.parent / "train"))
+from texture_shm import SharedTextureCache
+from texture_store import TileStore, pack_model
+
+
+DIFFUSERS_BACKENDS = ("diffusers", "diffusers_batch")
+
+
+def run_job(job: BatchJob, pregenerated=frozenset()):
+    """pregenerated 中的任务纹理已由 --jobs-file 批处理写出，改用 --texture-mode pregenerated"""
+    cmd = job.cmd
+    if job.out_name in pregenerated:
+        cmd = list(cmd)
+        cmd[cmd.index("--texture-mode") + 1] = "pregenerated"
+    env = {**os.environ, **job.env} if job.env else None
+    return subprocess.run(cmd, capture_output=True, text=True, env=env)
+
+
+def worker_jobs(queues, shared, workers: int) -> list:
+    """按计划顺序列出每个 worker 的任务；共享队列（朴素顺序）按领取顺序轮流分给各 worker"""
+    if shared:
+        jobs = [j for g in queues[0] for j in g.jobs]
+        return [jobs[w::workers] for w in range(workers)]
+    return [[j for g in q for j in g.jobs] for q in queues]
+
+
+def pregenerate_textures(queues, shared, templates: dict, args) -> tuple:
+    """每个 worker 的 diffusers 纹理任务合并为一次 --jobs-file 调用并行执行；返回 (已生成的 out_name 集合, 统计)。
+    某个 worker 的调用失败时，其任务回退为逐模型生成"""
+    workdir = Path(tempfile.mkdtemp(prefix="l2d_jobs_"))
+    base_seed = os.environ.get("TEXTURE_SEED", "0")
+
+    def run(wid, jobs):
+        entries = [{
+            "template_model_dir": templates[j.template_id]["model_path"],
+            "textures": j.textures,
+            "out_dir": str(Path("outputs") / j.out_name),
+            "seed": int(j.env.get("TEXTURE_SEED", base_seed)),
+        } for j in jobs]
+        jobs_file = workdir / f"worker_{wid:02d}.json"
+        jobs_file.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+        cmd = [
+            "python",
+            str(Path(__file__).parent.parent / "train" / "infer_texture_model.py"),
+            "--backend",
+            "diffusers_batch",
+            "--jobs-file",
+            str(jobs_file),
+        ]
+        return jobs, subprocess.run(cmd, capture_output=True, text=True)
+
+    t0 = time.perf_counter()
+    lists = [jobs for jobs in worker_jobs(queues, shared, args.workers) if jobs]
+    done, calls = set(), []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(lists))) as pool:
+            for jobs, proc in pool.map(lambda item: run(*item), enumerate(lists)):
+                row = {"models": len(jobs), "returncode": proc.returncode}
+                if proc.returncode == 0:
+                    done.update(j.out_name for j in jobs)
+                    row.update({k: v for k, v in json.loads(proc.stdout).items() if k in ("images", "batches", "images_per_sec")})
+                else:
+                    print(f"纹理批处理失败（{len(jobs)} 个模型回退为逐模型生成）: {proc.stderr.strip()[-500:]}", file=sys.stderr)
+                calls.append(row)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return done, {"calls": calls, "elapsed_seconds": time.perf_counter() - t0}
+
+
+def build_jobs(models, args) -> list:
+    jobs = []
+    for m in models:
+        mid = m["model_id"]
+        pixels, asset_bytes = estimate_template_cost(m)
+        for k in range(max(1, args.variants_per_template)):
+            out_name = f"{args.out_prefix}{mid}" if args.variants_per_template <= 1 else f"{args.out_prefix}{mid}_v{k:02d}"
+            cmd = [
+                "python",
+                str(Path(__file__).parent / "generate_model.py"),
+                "--output-name",
+                out_name,
+                "--template-strategy",
+                "specified",
+                "--template-id",
+                mid,
+                "--texture-mode",
+                args.texture_mode,
+                "--motion-mode",
+                args.motion_mode,
+                "--expression-mode",
+                args.expression_mode,
+                "--physics-mode",
+                args.physics_mode,
+            ]
+            jobs.append(BatchJob(
+                template_id=mid,
+                out_name=out_name,
+                cmd=cmd,
+                textures=list(m.get("textures", [])),
+                cost=job_cost(pixels, asset_bytes),
+                # 纹理种子由源内容派生，变体之间需以不同基础种子区分
+                env={"TEXTURE_SEED": str(k)} if args.variants_per_template > 1 else {},
+            ))
+    return jobs
+
+
+def make_plan(jobs, args):
+    if args.schedule == "naive":
+        return naive_queues(jobs, args.workers), True
+    return assign_groups(build_groups(jobs, args.workers), args.workers), False
+
+
+def execute_plan(queues, shared, args, cache_kwargs, templates=None):
+    """执行一次计划；每次执行使用独立的共享解码缓存，返回 (结果, 报告)。
+    templates 非空时先做每 worker 一次的 diffusers 纹理批处理，耗时计入吞吐"""
+    prepass = None
+    pregenerated = frozenset()
+    if templates is not None:
+        done, prepass = pregenerate_textures(queues, shared, templates, args)
+        pregenerated = frozenset(done)
+    shm_cache = None
+    if args.shm_cache_mb > 0:
+        # 子进程（generate_model -> infer_texture_model）继承环境变量，附着同一注册表
+        shm_cache = SharedTextureCache(Path(tempfile.mkdtemp(prefix="l2d_shm_")), args.shm_cache_mb << 20)
+        os.environ["TEXTURE_SHM_DIR"] = str(shm_cache.root)
+        # 预算已按 /dev/shm 可用空间收紧，子进程沿用同一上限
+        budget_mb = shm_cache.budget_bytes >> 20
+        if budget_mb < args.shm_cache_mb:
+            print(f"共享解码缓存预算受 /dev/shm 可用空间限制: {args.shm_cache_mb}MB -> {budget_mb}MB", file=sys.stderr)
+        os.environ["TEXTURE_SHM_BUDGET_MB"] = str(budget_mb)
+    try:
+        results, report = run_plan(queues, partial(run_job, pregenerated=pregenerated), shared=shared, **cache_kwargs)
+    finally:
+        if shm_cache is not None:
+            shm_stats = shm_cache.cleanup()
+            shutil.rmtree(shm_cache.root, ignore_errors=True)
+            os.environ.pop("TEXTURE_SHM_DIR", None)
+    if shm_cache is not None and shm_stats:
+        # 实测命中：附着已解码段为命中，首次解码为未命中
+        lookups = shm_stats.get("attaches", 0) + shm_stats.get("decodes", 0)
+        shm_stats["hit_rate"] = shm_stats.get("attaches", 0) / lookups if lookups else 0.0
+        report["shared_decode_cache"] = shm_stats
+    if prepass is not None:
+        report["texture_prepass"] = prepass
+        report["elapsed_seconds"] += prepass["elapsed_seconds"]
+        report["throughput_jobs_per_sec"] = report["jobs"] / report["elapsed_seconds"] if report["elapsed_seconds"] > 0 else 0.0
+    return results, report
 
 
 def main():
@@ -26,51 +194,102 @@ def main():
     ap.add_argument("--motion-mode", default="ai_generated")
     ap.add_argument("--expression-mode", default="ai_generated")
     ap.add_argument("--physics-mode", default="ai_generated")
+    ap.add_argument("--variants-per-template", type=int, default=1, help="每个模板生成的变体数")
+    ap.add_argument("--schedule", choices=["naive", "affinity"], default="affinity", help="调度策略")
+    ap.add_argument("--template-cache", type=int, default=2, help="模拟的每 worker 模板缓存容量（仅用于局部性统计）")
+    ap.add_argument("--texture-cache", type=int, default=8, help="模拟的每 worker 解码纹理缓存容量（仅用于局部性统计）")
+    ap.add_argument("--baseline-run", action="store_true",
+                    help="先按朴素顺序实际执行一遍以实测对比吞吐（输出会被计划执行覆盖；对比时勿设置 TEXTURE_CACHE_DIR）")
+    ap.add_argument("--compare", action="store_true", help="打印 naive 与 affinity 计划的离线模拟对比")
+    ap.add_argument("--dry-run", action="store_true", help="仅规划/模拟，不执行")
+    ap.add_argument("--shm-cache-mb", type=int, default=1024, help="共享内存解码缓存预算（MB），0 表示关闭")
+    ap.add_argument("--tile-store", default=None, help="分块去重存储目录：批次结束后打包各输出模型的纹理（导出前需 unpack）")
+    ap.add_argument("--report", default="reports/batch_schedule_report.json")
+    ap.add_argument("--tiny", action="store_true", help="diffusers 纹理后端使用微型本地管线（CPU 端到端检查，不下载权重）")
     args = ap.parse_args()
+    if args.tiny:
+        # infer_texture_model 的 --tiny 默认读取该环境变量，批处理与逐模型生成均生效
+        os.environ["DIFFUSERS_TINY"] = "1"
 
     data = json.loads(Path(args.index).read_text(encoding="utf-8"))
     models = data.get("models", [])[: args.count]
+    jobs = build_jobs(models, args)
 
-    jobs = []
-    for m in models:
-        mid = m["model_id"]
-        out_name = f"{args.out_prefix}{mid}"
-        cmd = [
-            "python",
-            str(Path(__file__).parent / "generate_model.py"),
-            "--output-name",
-            out_name,
-            "--template-strategy",
-            "specified",
-            "--template-id",
-            mid,
-            "--texture-mode",
-            args.texture_mode,
-            "--motion-mode",
-            args.motion_mode,
-            "--expression-mode",
-            args.expression_mode,
-            "--physics-mode",
-            args.physics_mode,
-        ]
-        jobs.append(cmd)
+    cache_kwargs = {"template_capacity": args.template_cache, "texture_capacity": args.texture_cache}
+    if args.compare or args.dry_run:
+        sim = {
+            "naive": simulate_plan(naive_queues(jobs, args.workers), shared=True, **cache_kwargs),
+            "affinity": simulate_plan(assign_groups(build_groups(jobs, args.workers), args.workers), **cache_kwargs),
+        }
+        print(json.dumps({"simulation": sim}, ensure_ascii=False, indent=2))
+        if args.dry_run:
+            return
 
-    results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futs = [ex.submit(run_job, j) for j in jobs]
-        for fu in as_completed(futs):
-            results.append(fu.result())
+    templates = None
+    if args.texture_mode == "ai_generated" and os.environ.get("TEXTURE_BACKEND", "jitter") in DIFFUSERS_BACKENDS:
+        templates = {m["model_id"]: m for m in models}
+    queues, shared = make_plan(jobs, args)
+    baseline = None
+    if args.baseline_run and not shared:
+        _, baseline = execute_plan(naive_queues(jobs, args.workers), True, args, cache_kwargs, templates)
+    est_naive = simulate_plan(naive_queues(jobs, args.workers), shared=True, **cache_kwargs)
+    est_plan = simulate_plan(queues, shared=shared, **cache_kwargs)
+    results, report = execute_plan(queues, shared, args, cache_kwargs, templates)
+    report["schedule"] = args.schedule
+    planned = report["throughput_jobs_per_sec"]
+    if shared:
+        # 本次即按朴素顺序执行
+        naive = {"throughput_jobs_per_sec": planned, "source": "measured"}
+    elif baseline is not None:
+        naive = {"throughput_jobs_per_sec": baseline["throughput_jobs_per_sec"], "source": "measured",
+                 "elapsed_seconds": baseline["elapsed_seconds"]}
+        if "shared_decode_cache" in baseline:
+            naive["shared_decode_cache"] = baseline["shared_decode_cache"]
+    else:
+        # 按成本模型的预计完工时间之比把实测吞吐折算为朴素顺序的估算吞吐
+        ratio = est_plan["estimated_makespan"] / est_naive["estimated_makespan"] if est_naive["estimated_makespan"] else 1.0
+        naive = {"throughput_jobs_per_sec": planned * ratio, "source": "estimated"}
+    report["naive_order"] = naive
+    report["speedup_vs_naive"] = planned / naive["throughput_jobs_per_sec"] if naive["throughput_jobs_per_sec"] else None
+    if args.tile_store:
+        store = TileStore(Path(args.tile_store))
+        packed = [pack_model(Path("outputs") / job.out_name, store) for job in jobs
+                  if (Path("outputs") / job.out_name).is_dir()]
+        report["tile_store"] = {
+            "models": len(packed),
+            "png_bytes": sum(r["png_bytes"] for r in packed),
+            "stored_bytes": sum(r["new_bytes"] + r["manifest_bytes"] for r in packed),
+            **store.stats(),
+        }
 
     ok = sum(1 for r in results if r.returncode == 0)
     fail = len(results) - ok
     print(f"完成批量生成：成功 {ok}，失败 {fail}")
+    naive = report["naive_order"]
+    print(f"调度: {args.schedule}  吞吐: {report['throughput_jobs_per_sec']:.3f} 任务/秒  "
+          f"朴素顺序: {naive['throughput_jobs_per_sec']:.3f} 任务/秒（{'实测' if naive['source'] == 'measured' else '估算'}）")
+    loc = report["simulated_locality"]
+    print(f"调度局部性（模拟 LRU，非实测缓存）: 模板 {loc['template_hit_rate']:.1%}  纹理 {loc['texture_hit_rate']:.1%}")
+    if "shared_decode_cache" in report:
+        s = report["shared_decode_cache"]
+        print(f"共享解码缓存（实测）: 命中率 {s['hit_rate']:.1%}，解码 {s.get('decodes', 0)} 次，"
+              f"附着 {s.get('attaches', 0)} 次，回退 {s.get('fallbacks', 0)} 次")
+    if "texture_prepass" in report:
+        s = report["texture_prepass"]
+        print(f"纹理批处理: {len(s['calls'])} 次 --jobs-file 调用，{sum(c.get('images', 0) for c in s['calls'])} 张，"
+              f"{s['elapsed_seconds']:.1f} 秒")
+    if "tile_store" in report:
+        s = report["tile_store"]
+        print(f"分块去重存储: {s['models']} 个模型, PNG {s['png_bytes']:,} bytes -> 新增存储 {s['stored_bytes']:,} bytes")
     for r in results:
         if r.returncode != 0:
             print("--- 失败任务输出 ---")
             print(r.stderr)
 
+    out = Path(args.report)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
 
 if __name__ == "__main__":
     main()
-
-
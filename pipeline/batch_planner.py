@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+批量任务规划器（模板亲和调度）：
+- 按模板对任务分组，并根据估算成本（纹理像素数、资产字节数）切分组大小
+- 以 LPT（最长任务优先）将任务组分配给各 worker，运行时空闲 worker 从其他队列尾部“窃取”任务组
+- 同一模板的任务尽量在同一 worker 上连续执行，使模板/解码纹理缓存保持命中
+- 统计端到端吞吐量并与朴素顺序（索引顺序）对比；每个任务是独立子进程，worker 内并无常驻缓存，
+  模板/纹理“命中率”只是按执行顺序模拟的 LRU 局部性指标（simulated_*），实测命中见共享解码缓存统计
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# 成本模型系数：每像素与每字节的相对成本，以及每个任务的固定开销（进程启动/索引读取等）
+PIXEL_COST = 1.0
+BYTE_COST = 0.05
+JOB_OVERHEAD = 2.0e6
+
+
+@dataclass
+class BatchJob:
+    """单个生成任务"""
+    template_id: str
+    out_name: str
+    cmd: List[str]
+    textures: List[str] = field(default_factory=list)
+    cost: float = 0.0
+    env: Dict[str, str] = field(default_factory=dict)  # 追加到子进程的环境变量（如变体种子）
+
+
+@dataclass
+class JobGroup:
+    """同模板的一组连续任务（调度与窃取的最小单位）"""
+    template_id: str
+    jobs: List[BatchJob]
+
+    @property
+    def cost(self) -> float:
+        return sum(j.cost for j in self.jobs)
+
+
+@dataclass
+class WorkerStats:
+    """单个 worker 的执行统计"""
+    worker_id: int
+    executed: List[str] = field(default_factory=list)
+    stolen_groups: int = 0
+    busy_seconds: float = 0.0
+
+
+def _parse_resolution(res: Optional[str]) -> int:
+    try:
+        w, h = str(res).lower().split("x")
+        return int(w) * int(h)
+    except Exception:
+        return 1024 * 1024
+
+
+def estimate_template_cost(model: Dict[str, Any]) -> Tuple[int, int]:
+    """估算模板成本：返回 (纹理像素总数, 资产字节总数)。
+    优先读取纹理文件头与文件大小；数据集不在本地时退回索引中的 texture_resolution。
+    """
+    base = Path(model.get("model_path", ""))
+    textures = model.get("textures", [])
+    pixels = 0
+    asset_bytes = 0
+    for tex in textures:
+        p = base / tex
+        try:
+            from PIL import Image
+            with Image.open(p) as img:
+                pixels += img.width * img.height
+            asset_bytes += p.stat().st_size
+        except Exception:
+            pixels += _parse_resolution(model.get("texture_resolution"))
+    for rel in (model.get("moc3_path"), model.get("physics_path"), model.get("pose_path")):
+        if not rel:
+            continue
+        try:
+            asset_bytes += (base / rel).stat().st_size
+        except OSError:
+            pass
+    return pixels, asset_bytes
+
+
+def job_cost(pixels: int, asset_bytes: int) -> float:
+    return JOB_OVERHEAD + PIXEL_COST * pixels + BYTE_COST * asset_bytes
+
+
+def build_groups(jobs: Sequence[BatchJob], workers: int, chunks_per_worker: int = 2) -> List[JobGroup]:
+    """按模板分组；过大的组按目标成本切块，避免单一模板拖慢整体（保持块内连续以维持局部性）"""
+    by_template: "OrderedDict[str, List[BatchJob]]" = OrderedDict()
+    for j in jobs:
+        by_template.setdefault(j.template_id, []).append(j)
+
+    total = sum(j.cost for j in jobs)
+    target = total / max(1, workers * chunks_per_worker) if total > 0 else float("inf")
+
+    groups: List[JobGroup] = []
+    for tid, tjobs in by_template.items():
+        chunk: List[BatchJob] = []
+        acc = 0.0
+        for j in tjobs:
+            if chunk and acc + j.cost > target:
+                groups.append(JobGroup(tid, chunk))
+                chunk, acc = [], 0.0
+            chunk.append(j)
+            acc += j.cost
+        if chunk:
+            groups.append(JobGroup(tid, chunk))
+    return groups
+
+
+def assign_groups(groups: Sequence[JobGroup], workers: int) -> List[Deque[JobGroup]]:
+    """LPT 贪心分配：按成本降序，将组分配给当前负载最小的 worker；
+    同一模板的后续切块优先落在已持有该模板的 worker（负载差在一组以内时）"""
+    queues: List[Deque[JobGroup]] = [deque() for _ in range(max(1, workers))]
+    loads = [0.0] * len(queues)
+    owner: Dict[str, int] = {}
+    for g in sorted(groups, key=lambda g: g.cost, reverse=True):
+        wid = min(range(len(queues)), key=lambda i: loads[i])
+        prev = owner.get(g.template_id)
+        if prev is not None and loads[prev] - loads[wid] <= g.cost:
+            wid = prev
+        queues[wid].append(g)
+        loads[wid] += g.cost
+        owner.setdefault(g.template_id, wid)
+    return queues
+
+
+def naive_queues(jobs: Sequence[BatchJob], workers: int) -> List[Deque[JobGroup]]:
+    """朴素顺序：所有任务按索引顺序放入单一共享队列，由空闲 worker 依次领取（与原 ThreadPoolExecutor 行为一致）"""
+    queues: List[Deque[JobGroup]] = [deque() for _ in range(max(1, workers))]
+    queues[0].extend(JobGroup(j.template_id, [j]) for j in jobs)
+    return queues
+
+
+class _LRU:
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.items: "OrderedDict[str, None]" = OrderedDict()
+
+    def touch(self, key: str) -> bool:
+        hit = key in self.items
+        if hit:
+            self.items.move_to_end(key)
+        else:
+            self.items[key] = None
+            if len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+        return hit
+
+
+def cache_hit_rates(sequences: Sequence[Sequence[BatchJob]],
+                    template_capacity: int = 2,
+                    texture_capacity: int = 8) -> Dict[str, Any]:
+    """按 worker 的执行序列计算模板缓存与解码纹理缓存（均为 LRU）的命中率"""
+    t_hits = t_total = x_hits = x_total = 0
+    for seq in sequences:
+        t_cache = _LRU(template_capacity)
+        x_cache = _LRU(texture_capacity)
+        for j in seq:
+            t_total += 1
+            t_hits += t_cache.touch(j.template_id)
+            for tex in j.textures:
+                x_total += 1
+                x_hits += x_cache.touch(f"{j.template_id}/{tex}")
+    return {
+        "template_lookups": t_total,
+        "template_hits": t_hits,
+        "template_hit_rate": (t_hits / t_total) if t_total else 0.0,
+        "texture_lookups": x_total,
+        "texture_hits": x_hits,
+        "texture_hit_rate": (x_hits / x_total) if x_total else 0.0,
+    }
+
+
+def simulate_plan(queues: Sequence[Deque[JobGroup]], shared: bool = False, **cache_kwargs) -> Dict[str, Any]:
+    """以估算成本离线模拟执行（含窃取），返回预计完工时间与缓存命中率"""
+    qs = [deque(q) for q in queues]
+    clock = [0.0] * len(qs)
+    idle = [False] * len(qs)
+    seqs: List[List[BatchJob]] = [[] for _ in qs]
+    while any(qs) and not all(idle):
+        wid = min((i for i in range(len(qs)) if not idle[i]), key=lambda i: clock[i])
+        group = _next_group(qs, wid, shared)
+        if group is None:
+            idle[wid] = True
+            continue
+        for j in group.jobs:
+            clock[wid] += j.cost
+            seqs[wid].append(j)
+    stats = cache_hit_rates(seqs, **cache_kwargs)
+    stats["estimated_makespan"] = max(clock) if clock else 0.0
+    return stats
+
+
+def _next_group(queues: List[Deque[JobGroup]], wid: int, shared: bool = False) -> Optional[JobGroup]:
+    """取下一个任务组：共享队列模式从队首领取；否则先消费自己的队列，空闲时从负载最重的队列尾部窃取"""
+    if shared:
+        return queues[0].popleft() if queues[0] else None
+    if queues[wid]:
+        return queues[wid].popleft()
+    victim = max(range(len(queues)), key=lambda i: sum(g.cost for g in queues[i]))
+    if queues[victim]:
+        return queues[victim].pop()
+    return None
+
+
+def run_plan(queues: List[Deque[JobGroup]],
+             run_fn: Callable[[BatchJob], Any],
+             shared: bool = False,
+             template_capacity: int = 2,
+             texture_capacity: int = 8) -> Tuple[List[Any], Dict[str, Any]]:
+    """按计划并行执行：每个 worker 一个线程，优先消费自己的队列，空闲时窃取。
+    shared=True 时所有 worker 共用 queues[0]（朴素顺序）。返回 (结果列表, 报告)。"""
+    lock = threading.Lock()
+    results: List[Any] = []
+    stats = [WorkerStats(i) for i in range(len(queues))]
+    seqs: List[List[BatchJob]] = [[] for _ in queues]
+
+    def worker(wid: int) -> None:
+        while True:
+            with lock:
+                own = shared or bool(queues[wid])
+                group = _next_group(queues, wid, shared)
+            if group is None:
+                return
+            if not own:
+                stats[wid].stolen_groups += 1
+            for job in group.jobs:
+                t0 = time.perf_counter()
+                res = run_fn(job)
+                stats[wid].busy_seconds += time.perf_counter() - t0
+                with lock:
+                    results.append(res)
+                    seqs[wid].append(job)
+                    stats[wid].executed.append(job.out_name)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(len(queues))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    report: Dict[str, Any] = {
+        # 子进程之间不共享进程内缓存：以下为按实际执行顺序模拟的 per-worker LRU，仅反映调度局部性
+        "simulated_locality": cache_hit_rates(seqs, template_capacity, texture_capacity),
+        "jobs": len(results),
+        "elapsed_seconds": elapsed,
+        "throughput_jobs_per_sec": (len(results) / elapsed) if elapsed > 0 else 0.0,
+        "workers": [
+            {
+                "worker_id": s.worker_id,
+                "jobs": len(s.executed),
+                "stolen_groups": s.stolen_groups,
+                "busy_seconds": s.busy_seconds,
+            }
+            for s in stats
+        ],
+    }
+    return results, report
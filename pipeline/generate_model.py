@@ -5,16 +5,21 @@ Live2D模型端到端生成脚本
 
 目前为MVP版本，实现基础的模型复制和打包流程
 后续可扩展为真正的AI生成纹理和动作
+
+--variants K：一次运行产出 K 个变体（<name>_v00 ...）。模板纹理只解码一次并批量计算 K 套纹理，
+动作/表情/物理等未修改资产只生成一次，其余变体以硬链接共享，并按组验证。
 """
 
 import json
+import re
+import shutil
 import sys
 import random
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 import logging
 import argparse
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 # 添加scripts目录到路径以便导入
 sys.path.append(str(Path(__file__).parent.parent / "scripts"))
@@ -23,6 +28,9 @@ from build_model_json import build_model_from_template, ModelBuildConfig, build_
 import sys
 import os
 from validate_model import validate_single_model
+from build_texture_pyramid import DEFAULT_LEVELS, build_texture_pyramid
+from optimize_textures import OptimizeConfig, optimize_models
+from generate_physics_json import TuneConfig, tune_physics
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,11 +43,13 @@ class GenerationConfig:
     template_model_id: Optional[str] = None
     output_model_name: str = "generated_model"
     output_dir: str = "outputs"
-    texture_generation_mode: str = "copy"  # copy, placeholder, ai_generated
+    texture_generation_mode: str = "copy"  # copy, placeholder, ai_generated, pregenerated
     motion_generation_mode: str = "copy"  # copy, none, ai_generated
     expression_generation_mode: str = "copy"  # copy, none, ai_generated
-    physics_generation_mode: str = "copy"  # copy, ai_generated
+    physics_generation_mode: str = "copy"  # copy, ai_generated, tuned
     enable_validation: bool = True
+    preview_levels: List[int] = field(default_factory=lambda: list(DEFAULT_LEVELS))  # 网页预览纹理层级，空列表则跳过
+    texture_optimize: str = "none"  # none, lossless, quantize（输出纹理 PNG 优化）
     texture_style: Optional[str] = None  # 未来用于AI生成
     character_traits: Optional[Dict[str, Any]] = None  # 未来用于AI生成
 
@@ -92,8 +102,9 @@ def select_template_model(index_data: Dict, config: GenerationConfig) -> Dict:
     else:
         raise ValueError(f"不支持的模板选择策略: {config.template_selection_strategy}")
 
-def generate_textures(template_model: Dict, config: GenerationConfig, output_path: Path) -> List[str]:
-    """生成纹理文件"""
+def generate_textures(template_model: Dict, config: GenerationConfig, output_path: Path,
+                      seed: Optional[int] = None) -> List[str]:
+    """生成纹理文件（seed 为 AI 纹理后端的基础种子，默认读取 TEXTURE_SEED）"""
     template_textures = template_model.get('textures', [])
     
     if config.texture_generation_mode == "copy":
@@ -134,13 +145,152 @@ def generate_textures(template_model: Dict, config: GenerationConfig, output_pat
             "--backend",
             os.environ.get("TEXTURE_BACKEND", "jitter"),
         ]
+        if seed is not None:
+            cmd += ["--seed", str(seed)]
         out = check_output(cmd).decode("utf-8").strip().splitlines()
         logger.info(f"AI纹理生成：生成 {len(out)} 个纹理")
         return out
     
+    elif config.texture_generation_mode == "pregenerated":
+        # 纹理已由批处理（infer_texture_model --jobs-file）写入输出目录，命名同 texture_jobs_for_model
+        new_textures = [f"textures_ai/texture_{i:02d}.png" for i in range(len(template_textures))]
+        missing = [rel for rel in new_textures if not (output_path / rel).exists()]
+        if missing:
+            raise FileNotFoundError(f"预生成纹理缺失: {missing}")
+        logger.info(f"预生成模式: 使用 {len(new_textures)} 个已生成纹理")
+        return new_textures
+    
     else:
         raise ValueError(f"不支持的纹理生成模式: {config.texture_generation_mode}")
 
+def generate_texture_variants(template_model: Dict, config: GenerationConfig, output_paths: List[Path]) -> List[str]:
+    """K 个变体的纹理：jitter 类后端一次调用批量生成（变体 k 的基础种子为 TEXTURE_SEED+k），其余逐变体生成"""
+    base_seed = int(os.environ.get("TEXTURE_SEED", "0"))
+    backend = os.environ.get("TEXTURE_BACKEND", "jitter")
+    if config.texture_generation_mode == "ai_generated" and backend in ("jitter", "jitter_numpy"):
+        from subprocess import check_output
+        cmd = [
+            sys.executable,
+            str(Path(__file__).parent.parent / "train" / "infer_texture_model.py"),
+            "--template-model-dir",
+            str(template_model["model_path"]),
+            "--textures",
+            *template_model.get("textures", []),
+            "--backend",
+            backend,
+            "--seed",
+            str(base_seed),
+            "--variant-out-dirs",
+            *[str(p) for p in output_paths],
+            # 预览层级随纹理一并写出，纹理金字塔阶段据 mtime 判定为最新而直接复用
+            "--preview-levels",
+            *[str(s) for s in config.preview_levels],
+        ]
+        out = check_output(cmd).decode("utf-8").strip().splitlines()
+        logger.info(f"AI纹理生成（批量变体）：{len(output_paths)} 个变体 x {len(out)} 个纹理")
+        return out
+    rels: List[str] = []
+    for k, path in enumerate(output_paths):
+        rels = generate_textures(template_model, config, path, seed=base_seed + k)
+    return rels
+
+
+# 纹理金字塔目录（textures_512/ 等），属于各变体私有
+_PYRAMID_DIR = re.compile(r"^textures_\d+$")
+
+
+def link_shared_assets(src_dir: Path, dst_dir: Path, private: List[str]) -> int:
+    """将 src_dir 中除变体私有文件（纹理、model3.json、预览产物）外的文件硬链接到 dst_dir；返回链接数"""
+    from build_texture_pyramid import MANIFEST_NAME
+    private_set = set(private)
+    linked = 0
+    for f in src_dir.rglob("*"):
+        if not f.is_file():
+            continue
+        rel = f.relative_to(src_dir)
+        if (rel.as_posix() in private_set or f.name.endswith(".model3.json") or f.name == MANIFEST_NAME
+                or _PYRAMID_DIR.match(rel.parts[0])):
+            continue
+        dst = dst_dir / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.exists():
+            dst.unlink()
+        try:
+            os.link(f, dst)
+        except OSError:
+            shutil.copy2(f, dst)
+        linked += 1
+    return linked
+
+
+def link_missing_textures(src_dir: Path, dst_dir: Path, textures: List[str]) -> int:
+    """变体目录中没有自己生成的纹理时（如 copy 模式）与首个变体共享同一文件；返回链接数"""
+    linked = 0
+    for rel in textures:
+        src, dst = src_dir / rel, dst_dir / rel
+        if dst.exists() or not src.exists():
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        linked += 1
+    return linked
+
+
+def validate_variant_group(paths: List[Path], textures: List[str]) -> List[bool]:
+    """按组验证：首个变体完整验证（共享资产随之验证），其余变体只检查私有的 model3.json 与纹理（存在、可解码、尺寸一致）；
+    任一变体缺少纹理时抛出 RuntimeError"""
+    from PIL import Image
+    first = validate_single_model(paths[0])
+    if not first.is_valid:
+        logger.warning(f"⚠️  {paths[0].name} 验证失败: {len(first.errors)} 个错误")
+        for error in first.errors[:3]:
+            logger.warning(f"  - {error}")
+    ref_sizes = {}
+    for rel in textures:
+        try:
+            with Image.open(paths[0] / rel) as img:
+                ref_sizes[rel] = img.size
+        except Exception:
+            ref_sizes[rel] = None
+    results = [first.is_valid]
+    missing = {paths[0].name: [rel for rel in textures if not (paths[0] / rel).exists()]}
+    for path in paths[1:]:
+        errors = []
+        missing[path.name] = [rel for rel in textures if not (path / rel).exists()]
+        if not (path / f"{path.name}.model3.json").exists():
+            errors.append("缺少 model3.json")
+        for rel in textures:
+            try:
+                with Image.open(path / rel) as img:
+                    size = img.size
+                    img.verify()
+                if size != ref_sizes[rel]:
+                    errors.append(f"纹理尺寸不一致: {rel} {size} != {ref_sizes[rel]}")
+            except Exception as e:
+                errors.append(f"纹理不可读: {rel} ({e})")
+        for error in errors[:3]:
+            logger.warning(f"  - {path.name}: {error}")
+        results.append(first.is_valid and not errors)
+    logger.info(f"变体组验证: {sum(results)}/{len(results)} 通过")
+    missing = {name: rels for name, rels in missing.items() if rels}
+    if missing:
+        raise RuntimeError(f"变体缺少纹理文件: {missing}")
+    return results
+
+
+def optimize_output_textures(paths: List[Path], config: GenerationConfig) -> None:
+    """输出纹理（含预览层级）的 PNG 优化，失败不影响主产物"""
+    if config.texture_optimize == "none":
+        return
+    try:
+        optimize_models(paths, OptimizeConfig(quantize=config.texture_optimize == "quantize"))
+    except Exception as e:
+        logger.warning(f"纹理优化失败: {e}")
+
+
 def generate_motions(template_model: Dict, config: GenerationConfig, output_path: Path) -> Optional[Dict]:
     """生成动作文件"""
     if config.motion_generation_mode == "copy":
@@ -200,20 +350,44 @@ def generate_expressions(template_model: Dict, config: GenerationConfig, output_
         raise ValueError(f"不支持的表情生成模式: {config.expression_generation_mode}")
 
 
+def resolve_template_physics(template_model: Dict) -> Optional[str]:
+    """模板 model3.json 中 FileReferences.Physics 指向的物理文件（相对模板目录）"""
+    template_model_dir = Path(template_model['model_path'])
+    model3_path = template_model.get('model3_json_path')
+    if model3_path and Path(model3_path).exists():
+        model3_path = Path(model3_path)
+    else:
+        candidates = [p for p in template_model_dir.glob("*.model3.json") if ".preview_" not in p.name]
+        if not candidates:
+            return None
+        model3_path = candidates[0]
+    with open(model3_path, 'r', encoding='utf-8') as f:
+        physics_rel = json.load(f).get('FileReferences', {}).get('Physics')
+    if not physics_rel or not (template_model_dir / physics_rel).exists():
+        return None
+    return physics_rel
+
 def generate_physics(template_model: Dict, config: GenerationConfig, output_path: Path) -> Optional[str]:
     if config.physics_generation_mode == "copy":
         return None
-    elif config.physics_generation_mode == "ai_generated":
-        # 从模板 physics3.json 生成微调版本
-        from subprocess import check_call
-        file_refs = template_model.get('model3_json_path')  # not used
-        template_model_dir = Path(template_model['model_path'])
-        physics_rel = "model.physics3.json"
-        template_physics = template_model_dir / physics_rel
-        if not template_physics.exists():
+    elif config.physics_generation_mode in ("ai_generated", "tuned"):
+        physics_rel = resolve_template_physics(template_model)
+        if physics_rel is None:
             logger.warning("模板未包含 physics3.json，跳过AI物理生成")
             return None
+        template_physics = Path(template_model['model_path']) / physics_rel
         out_physics = output_path / physics_rel
+        out_physics.parent.mkdir(parents=True, exist_ok=True)
+        if config.physics_generation_mode == "tuned":
+            # 每个 setting 的扰动候选一次向量化模拟打分，写出最优候选
+            report = tune_physics(template_physics, out_physics,
+                                  TuneConfig(seed=int(os.environ.get("PHYSICS_SEED", "0"))))
+            unstable = sum(not item['after']['stable'] for item in report['settings'])
+            logger.info(f"物理参数搜索：{len(report['settings'])} 个设置，{report['candidates']} 个候选，"
+                        f"用时 {report['seconds']}s，未稳定 {unstable} 个")
+            return physics_rel
+        # 从模板 physics3.json 生成微调版本
+        from subprocess import check_call
         cmd = [
             sys.executable,
             str(Path(__file__).parent.parent / "scripts" / "generate_physics_json.py"),
@@ -222,7 +396,6 @@ def generate_physics(template_model: Dict, config: GenerationConfig, output_path
             "--scale",
             "1.05",
         ]
-        out_physics.parent.mkdir(parents=True, exist_ok=True)
         check_call(cmd)
         logger.info("AI物理生成：已生成 physics3.json")
         return physics_rel
@@ -274,6 +447,16 @@ def generate_model_end_to_end(config: GenerationConfig, index_file: Path) -> Pat
     # 7. 构建模型
     final_output_path = build_model_from_config(build_config)
     
+    # 7.1 网页预览用纹理金字塔（失败不影响主产物）
+    if config.preview_levels:
+        try:
+            build_texture_pyramid(final_output_path, config.preview_levels)
+        except Exception as e:
+            logger.warning(f"纹理金字塔生成失败: {e}")
+
+    # 7.2 输出纹理 PNG 优化（可选）
+    optimize_output_textures([final_output_path], config)
+
     # 8. 验证（可选）
     if config.enable_validation:
         logger.info("验证生成的模型...")
@@ -288,6 +471,59 @@ def generate_model_end_to_end(config: GenerationConfig, index_file: Path) -> Pat
     
     return final_output_path
 
+def generate_variants_end_to_end(config: GenerationConfig, index_file: Path, variants: int) -> List[Path]:
+    """单次运行生成 K 个变体：索引/模板选择一次，纹理批量生成，共享资产只生成并写出一次"""
+    logger.info(f"开始生成 {variants} 个变体: {config.output_model_name}_v00..v{variants - 1:02d}")
+    with open(index_file, 'r', encoding='utf-8') as f:
+        index_data = json.load(f)
+    template_model = select_template_model(index_data, config)
+    logger.info(f"选择的模板: {template_model['model_id']} ({template_model.get('character_name', 'Unknown')})")
+
+    names = [f"{config.output_model_name}_v{k:02d}" for k in range(variants)]
+    paths = [Path(config.output_dir) / name for name in names]
+    for path in paths:
+        path.mkdir(parents=True, exist_ok=True)
+
+    new_textures = generate_texture_variants(template_model, config, paths)
+    # 共享资产只在首个变体中生成
+    new_motions = generate_motions(template_model, config, paths[0])
+    new_expressions = generate_expressions(template_model, config, paths[0])
+    new_physics = generate_physics(template_model, config, paths[0])
+
+    first = build_model_from_config(ModelBuildConfig(
+        template_model_path=template_model['model_path'],
+        output_model_name=names[0],
+        output_dir=config.output_dir,
+        new_textures=new_textures,
+        new_motions=new_motions,
+        new_expressions=new_expressions,
+        new_physics_file=new_physics,
+        copy_moc3=True,
+        copy_physics=(new_physics is None),
+        copy_pose=True
+    ))
+    model3_text = (first / f"{names[0]}.model3.json").read_text(encoding="utf-8")
+    for name, path in zip(names[1:], paths[1:]):
+        # 纹理路径在各变体中相同，model3.json 内容一致，只是文件名不同
+        linked = link_shared_assets(first, path, new_textures)
+        linked += link_missing_textures(first, path, new_textures)
+        (path / f"{name}.model3.json").write_text(model3_text, encoding="utf-8")
+        (path / "model.model3.json").write_text(model3_text, encoding="utf-8")
+        logger.info(f"变体 {name}: 共享 {linked} 个资产文件")
+
+    if config.preview_levels:
+        for path in paths:
+            try:
+                build_texture_pyramid(path, config.preview_levels)
+            except Exception as e:
+                logger.warning(f"纹理金字塔生成失败 ({path.name}): {e}")
+    optimize_output_textures(paths, config)
+
+    if config.enable_validation:
+        validate_variant_group(paths, new_textures)
+    return paths
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='Live2D模型端到端生成')
@@ -301,8 +537,8 @@ def main():
                        default='random', help='模板选择策略')
     parser.add_argument('--template-id', help='指定模板ID (当策略为specified时)')
     parser.add_argument('--texture-mode', 
-                       choices=['copy', 'placeholder', 'ai_generated'], 
-                       default='copy', help='纹理生成模式')
+                       choices=['copy', 'placeholder', 'ai_generated', 'pregenerated'], 
+                       default='copy', help='纹理生成模式（pregenerated：使用批处理已写入 textures_ai/ 的纹理）')
     parser.add_argument('--motion-mode', 
                        choices=['copy', 'none', 'ai_generated'], 
                        default='copy', help='动作生成模式')
@@ -310,12 +546,19 @@ def main():
                        choices=['copy', 'none', 'ai_generated'], 
                        default='copy', help='表情生成模式')
     parser.add_argument('--physics-mode', 
-                       choices=['copy', 'ai_generated'], 
-                       default='copy', help='物理生成模式')
+                       choices=['copy', 'ai_generated', 'tuned'], 
+                       default='copy', help='物理生成模式（tuned：向量化稳定性模拟的参数搜索）')
     parser.add_argument('--no-validation', action='store_true', 
                        help='跳过验证步骤')
     parser.add_argument('--index-file', default='data/processed/index.json', 
                        help='索引文件路径')
+    parser.add_argument('--variants', type=int, default=1,
+                       help='单次运行生成的变体数（>1 时输出 <name>_v00 ...，共享未修改资产）')
+    parser.add_argument('--preview-levels', type=int, nargs='*', default=list(DEFAULT_LEVELS),
+                       help='网页预览纹理层级（长边像素），不带参数则不生成')
+    parser.add_argument('--optimize-textures', choices=['none', 'lossless', 'quantize'],
+                       default=os.environ.get('TEXTURE_OPTIMIZE', 'none'),
+                       help='输出纹理 PNG 优化：无损重编码，或额外尝试调色板量化（需通过 PSNR/SSIM 阈值）')
     
     args = parser.parse_args()
     
@@ -338,10 +581,19 @@ def main():
         motion_generation_mode=args.motion_mode,
         expression_generation_mode=args.expression_mode,
         physics_generation_mode=args.physics_mode,
-        enable_validation=not args.no_validation
+        enable_validation=not args.no_validation,
+        preview_levels=args.preview_levels,
+        texture_optimize=args.optimize_textures
     )
     
     try:
+        if args.variants > 1:
+            paths = generate_variants_end_to_end(config, index_file, args.variants)
+            print(f"\n🎉 {len(paths)} 个变体生成完成!")
+            for path in paths:
+                print(f"📁 {path}")
+            return
+
         # 生成模型
         output_path = generate_model_end_to_end(config, index_file)
         
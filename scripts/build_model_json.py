@@ -36,7 +36,7 @@ def copy_template_files(template_path: Path, output_path: Path, config: ModelBui
     output_path.mkdir(parents=True, exist_ok=True)
     
     # 读取模板model3.json
-    template_model3_files = list(template_path.glob("*.model3.json"))
+    template_model3_files = [p for p in template_path.glob("*.model3.json") if ".preview_" not in p.name]
     if not template_model3_files:
         raise FileNotFoundError(f"模板目录中未找到model3.json文件: {template_path}")
     
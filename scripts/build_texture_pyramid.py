@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+纹理金字塔（网页预览用）：
+- 为模型目录中 model3.json 引用的每张纹理写出降采样版本：textures_512/、textures_1024/ ...
+  （预乘 alpha 下的面积平均 BOX 重采样，避免透明区颜色渗入边缘；大层级逐级派生小层级，每张纹理只解码一次）
+- 为每个 model3.json 写出同目录的 <name>.preview_<size>.model3.json，仅替换 FileReferences.Textures
+- 写出 textures_preview.json 清单，web/preview.html 据此默认加载最轻的版本
+- 按纹理并行（进程池）；目标文件比源纹理新时跳过
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import logging
+import os
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEVELS = (512, 1024)
+MANIFEST_NAME = "textures_preview.json"
+PREVIEW_TAG = ".preview_"
+
+
+def is_preview_model3(path: Path) -> bool:
+    return PREVIEW_TAG in path.name
+
+
+def preview_model3_name(model3_name: str, size: int) -> str:
+    stem = model3_name[: -len(".model3.json")] if model3_name.endswith(".model3.json") else Path(model3_name).stem
+    return f"{stem}{PREVIEW_TAG}{size}.model3.json"
+
+
+def scaled_size(size: Tuple[int, int], target: int) -> Tuple[int, int]:
+    """长边缩放到 target，保持宽高比"""
+    w, h = size
+    scale = target / max(w, h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _up_to_date(src: Path, dst: Path) -> bool:
+    return dst.exists() and dst.stat().st_mtime_ns >= src.stat().st_mtime_ns
+
+
+def build_levels(src: str, targets: Sequence[Tuple[int, str]], compress_level: int = 6) -> Dict[str, int]:
+    """单张纹理：按层级从大到小逐级 BOX 降采样并写出；返回 {dst: 字节数}"""
+    src_path = Path(src)
+    todo = [(s, Path(d)) for s, d in sorted(targets, reverse=True)]
+    written: Dict[str, int] = {}
+    if all(_up_to_date(src_path, d) for _, d in todo):
+        return {str(d): d.stat().st_size for _, d in todo}
+    with Image.open(src_path) as img:
+        cur = img.convert("RGBA").convert("RGBa")
+    for size, dst in todo:
+        cur = cur.resize(scaled_size(cur.size, size), Image.BOX, reducing_gap=2.0)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".part")
+        cur.convert("RGBA").save(tmp, "PNG", compress_level=compress_level)
+        os.replace(tmp, dst)
+        written[str(dst)] = dst.stat().st_size
+    return written
+
+
+def _level_names(textures: List[str]) -> Dict[str, str]:
+    """纹理在 textures_<size>/ 下的文件名：basename 不冲突时直接使用，否则用展开的相对路径"""
+    names = [Path(t).name for t in textures]
+    if len(set(names)) == len(names):
+        return dict(zip(textures, names))
+    return {t: t.replace("/", "__") for t in textures}
+
+
+def build_texture_pyramid(model_dir: Path, levels: Sequence[int] = DEFAULT_LEVELS, workers: Optional[int] = None,
+                          compress_level: int = 6) -> Dict:
+    model_dir = Path(model_dir)
+    model3_files = sorted(p for p in model_dir.glob("*.model3.json") if not is_preview_model3(p))
+    if not model3_files:
+        raise FileNotFoundError(f"模型目录中未找到model3.json文件: {model_dir}")
+    docs = {p.name: json.loads(p.read_text(encoding="utf-8")) for p in model3_files}
+    textures: List[str] = []
+    for doc in docs.values():
+        for t in doc.get("FileReferences", {}).get("Textures", []):
+            if t not in textures:
+                textures.append(t)
+
+    names = _level_names(textures)
+    sizes: Dict[str, Tuple[int, int]] = {}
+    for t in textures:
+        with Image.open(model_dir / t) as img:
+            sizes[t] = img.size
+
+    # 每张纹理需要的层级（层级不小于原图长边时直接引用原图）
+    levels = sorted(set(int(s) for s in levels))
+    mapping: Dict[int, Dict[str, str]] = {s: {} for s in levels}
+    tasks: List[Tuple[str, List[Tuple[int, str]]]] = []
+    for t in textures:
+        targets = []
+        for s in levels:
+            if s < max(sizes[t]):
+                rel = f"textures_{s}/{names[t]}"
+                mapping[s][t] = rel
+                targets.append((s, str(model_dir / rel)))
+            else:
+                mapping[s][t] = t
+        if targets:
+            tasks.append((str(model_dir / t), targets))
+
+    written: Dict[str, int] = {}
+    if workers == 1 or len(tasks) <= 1:
+        for src, targets in tasks:
+            written.update(build_levels(src, targets, compress_level))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_levels, src, targets, compress_level) for src, targets in tasks]
+            for fut in futures:
+                written.update(fut.result())
+
+    manifest = {
+        "levels": [],
+        "original": {"texture_bytes": sum((model_dir / t).stat().st_size for t in textures)},
+    }
+    for s in levels:
+        files = {}
+        for name, doc in docs.items():
+            preview = json.loads(json.dumps(doc))
+            refs = preview.setdefault("FileReferences", {})
+            refs["Textures"] = [mapping[s][t] for t in refs.get("Textures", [])]
+            out_name = preview_model3_name(name, s)
+            with open(model_dir / out_name, "w", encoding="utf-8") as f:
+                json.dump(preview, f, indent=2, ensure_ascii=False)
+            files[name] = out_name
+        manifest["levels"].append({
+            "size": s,
+            "files": files,
+            "texture_bytes": sum((model_dir / rel).stat().st_size for rel in mapping[s].values()),
+        })
+    with open(model_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    logger.info(f"纹理金字塔: {len(tasks)} 张纹理, 写出 {len(written)} 个降采样文件, 层级 {levels}")
+    return manifest
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ap = argparse.ArgumentParser(description="为网页预览生成多分辨率纹理与 preview model3.json")
+    ap.add_argument("model_dirs", nargs="+", help="模型输出目录（可多个）")
+    ap.add_argument("--levels", type=int, nargs="+", default=list(DEFAULT_LEVELS), help="长边尺寸层级")
+    ap.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 数）")
+    ap.add_argument("--png-compress-level", type=int, default=6)
+    args = ap.parse_args()
+    for d in args.model_dirs:
+        manifest = build_texture_pyramid(Path(d), args.levels, args.workers, args.png_compress_level)
+        print(json.dumps({"model_dir": d, **manifest}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+motion3 曲线编译（关键帧精简）：
+- 输入：逐帧采样的信号（程序化生成/模型采样），或已有 motion3.json（按 fps 网格 + 每个原始段内均匀采样点重新求值）
+- 第一步 Ramer–Douglas–Peucker：以竖直误差（参数值单位）找出折线近似所需的最少关键点，满足误差容限；
+  多条曲线拼接后逐层向量化分割
+- 第二步贝塞尔合并：从每个关键点起贪心地向后延伸（倍增试探 + 二分），只要一段三次贝塞尔（控制点时间固定在 1/3、2/3，
+  值由最小二乘求得）对区间内全部采样点的误差仍在容限内就继续合并；只跨一个关键点时输出线性段。
+  各曲线同步推进，每轮所有曲线的候选区间一次批量拟合（np.add.reduceat 分段求和）
+- 控制点时间取三等分点时 x(s) 关于 s 线性，贝塞尔在 AreBeziersRestricted 两种解释下求值一致，因此输出标记为 true
+  （保留了原文件中非受限贝塞尔曲线时除外）
+- 误差容限 = max(--tolerance, --rel-tolerance x 曲线取值范围)；Meta 的 CurveCount / TotalSegmentCount /
+  TotalPointCount 按输出重新计算；报告字节数与段数的前后对比
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import sys
+
+import numpy as np
+
+LINEAR, BEZIER, STEPPED, INVERSE_STEPPED = 0, 1, 2, 3
+# 每种段类型包含的点数（线性/阶梯 1 个终点，贝塞尔 2 个控制点 + 终点）
+SEGMENT_POINTS = {LINEAR: 1, BEZIER: 3, STEPPED: 1, INVERSE_STEPPED: 1}
+DIGITS = 4
+# 重新编译已有曲线时每个原始段内额外的均匀采样数（短于一帧的段也要被误差检查覆盖）
+SEGMENT_SAMPLES = 8
+# 长曲线（如整段音频的口型）按此采样数切块后与其他曲线一起同步拟合，块边界为强制关键点
+PIECE_SAMPLES = 2048
+
+
+@dataclass
+class CurveFitConfig:
+    tolerance: float = 0.01
+    rel_tolerance: float = 0.002
+    fps: float = 30.0
+    beziers: bool = True
+
+
+def _span_index(a: np.ndarray, n: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """多个区间 [a, a+n) 拼接后的采样下标与每个区间在拼接数组中的起点"""
+    start = np.cumsum(n) - n
+    return np.arange(int(n.sum())) - np.repeat(start - a, n), start
+
+
+def rdp_batch(t: np.ndarray, v: np.ndarray, first: np.ndarray, last: np.ndarray, tol: np.ndarray) -> np.ndarray:
+    """多条曲线（t/v 拼接，第 c 条占 [first[c], last[c]]）一起做 RDP：每一层把所有待分割区间一次向量化处理，
+    区间内到首尾连线竖直距离的最大值超过 tol[c] 时在最远点处分割；返回关键点掩码"""
+    keep = np.zeros(len(t), dtype=bool)
+    keep[first] = keep[last] = True
+    a, b, c = first, last, np.arange(len(first))
+    while True:
+        live = b - a >= 2
+        a, b, c = a[live], b[live], c[live]
+        if not len(a):
+            return keep
+        n = b - a - 1
+        idx, start = _span_index(a + 1, n)
+        ar, br = np.repeat(a, n), np.repeat(b, n)
+        span = t[br] - t[ar]
+        u = np.divide(t[idx] - t[ar], span, out=np.zeros_like(span), where=span > 0)
+        err = np.abs(v[idx] - v[ar] - u * (v[br] - v[ar]))
+        peak = np.maximum.reduceat(err, start)
+        hit = np.nonzero(err == np.repeat(peak, n))[0]
+        owner = np.repeat(np.arange(len(n)), n)[hit]
+        far = idx[hit[np.unique(owner, return_index=True)[1]]]
+        split = peak > tol[c]
+        m = far[split]
+        keep[m] = True
+        a = np.concatenate([a[split], m])
+        b = np.concatenate([m, b[split]])
+        c = np.concatenate([c[split], c[split]])
+
+
+def fit_spans(t: np.ndarray, v: np.ndarray, a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """批量贝塞尔拟合：每个区间 [a, b] 端点固定、控制点时间在三等分点，最小二乘求两个控制值（2x2 正规方程闭式解）；
+    返回 (c1v, c2v, 最大误差)"""
+    n = b - a + 1
+    idx, start = _span_index(a, n)
+    ar, br = np.repeat(a, n), np.repeat(b, n)
+    s = (t[idx] - t[ar]) / (t[br] - t[ar])
+    r = 1.0 - s
+    b1, b2 = 3 * r * r * s, 3 * r * s * s
+    rhs = v[idx] - r ** 3 * v[ar] - s ** 3 * v[br]
+    s11, s12, s22 = (np.add.reduceat(x, start) for x in (b1 * b1, b1 * b2, b2 * b2))
+    y1, y2 = np.add.reduceat(b1 * rhs, start), np.add.reduceat(b2 * rhs, start)
+    det = s11 * s22 - s12 * s12
+    full = det > 1e-12 * np.maximum(s11 * s22, 1e-300)
+    safe = np.where(full, det, 1.0)
+    # 内部采样点不足以确定两个控制值时取 c1 = c2
+    bb = s11 + 2 * s12 + s22
+    same = np.divide(y1 + y2, bb, out=np.zeros_like(bb), where=bb > 0)
+    c1 = np.where(full, (y1 * s22 - y2 * s12) / safe, same)
+    c2 = np.where(full, (y2 * s11 - y1 * s12) / safe, same)
+    err = np.abs(b1 * np.repeat(c1, n) + b2 * np.repeat(c2, n) - rhs)
+    return c1, c2, np.maximum.reduceat(err, start)
+
+
+def fit_curves(samples: Sequence[Tuple[Sequence[float], Sequence[float], float]], beziers: bool = True,
+               piece: int = PIECE_SAMPLES) -> List[List[float]]:
+    """[(时刻, 值, 容限), ...] -> 每条曲线的 motion3 Segments（最少的线性/贝塞尔段，逐采样点误差 <= 容限）。
+    超过 piece 个采样的曲线切成共享端点的块一起拟合后拼接"""
+    parts: List[Tuple[np.ndarray, np.ndarray, float]] = []
+    owner: List[int] = []
+    for c, (t, v, tol) in enumerate(samples):
+        t = np.asarray(t, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        for a in range(0, max(len(t) - 1, 1), piece):
+            parts.append((t[a:a + piece + 1], v[a:a + piece + 1], tol))
+            owner.append(c)
+    out: List[List[float]] = [[] for _ in samples]
+    for c, seg in zip(owner, _fit_batch(parts, beziers)):
+        out[c].extend(seg if not out[c] else seg[2:])
+    return out
+
+
+def _fit_batch(samples: Sequence[Tuple[np.ndarray, np.ndarray, float]], beziers: bool) -> List[List[float]]:
+    """所有曲线同步推进：每一轮每条曲线只试一个候选终点（倍增试探，失败后二分），本轮全部候选一次批量拟合"""
+    ts = [x[0] for x in samples]
+    vs = [x[1] for x in samples]
+    if not ts:
+        return []
+    lens = np.array([len(x) for x in ts])
+    t, v = np.concatenate(ts), np.concatenate(vs)
+    first = np.cumsum(lens) - lens
+    tol = np.array([x[2] for x in samples], dtype=np.float64)
+    keep = rdp_batch(t, v, first, first + lens - 1, tol)
+    keys = np.nonzero(keep)[0]
+    kfirst = np.searchsorted(keys, first)
+    klast = np.searchsorted(keys, first + lens - 1)
+    owner = np.arange(len(ts))
+    rows: List[np.ndarray] = []
+    if not beziers:
+        ka = np.arange(len(keys) - 1)
+        ka = ka[~np.isin(ka, klast)]
+        rows.append(np.stack([np.searchsorted(kfirst, ka, side="right") - 1.0, ka, ka + 1,
+                              np.zeros(len(ka)), np.zeros(len(ka)), np.zeros(len(ka))], axis=1))
+    else:
+        i = kfirst.copy()
+        good, step = i + 1, np.ones_like(i)
+        lo, hi = np.zeros_like(i), np.zeros_like(i)
+        bisect = np.zeros(len(i), dtype=bool)
+        has = np.zeros(len(i), dtype=bool)
+        c1s, c2s = np.zeros(len(i)), np.zeros(len(i))
+        active = i < klast
+        while active.any():
+            done = active & np.where(bisect, hi - lo <= 1, good >= klast)
+            if done.any():
+                j = np.where(bisect, lo, good)
+                rows.append(np.stack([owner[done], i[done], j[done], has[done], c1s[done], c2s[done]], axis=1))
+                i = np.where(done, j, i)
+                good = np.where(done, i + 1, good)
+                step[done], bisect[done], has[done] = 1, False, False
+                active = i < klast
+                continue
+            cur = np.nonzero(active)[0]
+            j = np.where(bisect, (lo + hi) // 2, np.minimum(good + step, klast))[cur]
+            c1, c2, err = fit_spans(t, v, keys[i[cur]], keys[j])
+            ok = err <= tol[cur]
+            g = ~bisect[cur]
+            upd = cur[ok]
+            c1s[upd], c2s[upd], has[upd] = c1[ok], c2[ok], True
+            gok, gbad, bok, bbad = cur[g & ok], cur[g & ~ok], cur[~g & ok], cur[~g & ~ok]
+            good[gok], step[gok] = j[g & ok], step[gok] * 2
+            lo[gbad], hi[gbad], bisect[gbad] = good[gbad], j[g & ~ok], True
+            lo[bok] = j[~g & ok]
+            hi[bbad] = j[~g & ~ok]
+    table = np.concatenate(rows) if rows else np.zeros((0, 6))
+    table = table[np.lexsort((table[:, 1], table[:, 0]))]
+    ka, kb = keys[table[:, 1].astype(int)], keys[table[:, 2].astype(int)]
+    span = t[kb] - t[ka]
+    cols = np.round(np.stack([t[ka] + span / 3, table[:, 4], t[ka] + 2 * span / 3, table[:, 5], t[kb], v[kb]],
+                             axis=1), DIGITS).tolist()
+    kinds = table[:, 3].astype(bool).tolist()
+    curve_of = table[:, 0].astype(int).tolist()
+    out = [[round(float(t[f]), DIGITS), round(float(v[f]), DIGITS)] for f in first]
+    for c, bz, row in zip(curve_of, kinds, cols):
+        if bz:
+            out[c].extend([BEZIER] + row)
+        else:
+            out[c].extend([LINEAR, row[4], row[5]])
+    return out
+
+
+def fit_curve(t: Sequence[float], v: Sequence[float], tol: float, beziers: bool = True) -> List[float]:
+    """单条采样信号 -> motion3 Segments"""
+    return fit_curves([(t, v, tol)], beziers)[0]
+
+
+def curve_tolerance(v: np.ndarray, cfg: CurveFitConfig) -> float:
+    return max(cfg.tolerance, cfg.rel_tolerance * float(np.ptp(v)) if len(v) else 0.0)
+
+
+def segment_stats(seg: Sequence[float]) -> Tuple[int, int, bool]:
+    """(段数, 点数(含起点), 是否含贝塞尔段)"""
+    segments, points, has_bezier = 0, 1 if len(seg) >= 2 else 0, False
+    i = 2
+    while i < len(seg):
+        kind = int(seg[i])
+        n = SEGMENT_POINTS.get(kind)
+        if n is None:
+            break
+        segments += 1
+        points += n
+        has_bezier |= kind == BEZIER
+        i += 1 + 2 * n
+    return segments, points, has_bezier
+
+
+def update_meta(motion: Dict) -> Dict:
+    """按曲线重新计算 Meta 中的计数"""
+    segs = [segment_stats(c.get("Segments", [])) for c in motion.get("Curves", [])]
+    meta = motion.setdefault("Meta", {})
+    meta["CurveCount"] = len(segs)
+    meta["TotalSegmentCount"] = sum(s for s, _, _ in segs)
+    meta["TotalPointCount"] = sum(p for _, p, _ in segs)
+    meta.setdefault("UserDataCount", len(motion.get("UserData", [])))
+    meta.setdefault("TotalUserDataSize", sum(len(u.get("Value", "")) for u in motion.get("UserData", [])))
+    return motion
+
+
+def curves_from_samples(samples: Sequence[Tuple[str, str, Sequence[float], Sequence[float]]],
+                        cfg: Optional[CurveFitConfig] = None) -> List[Dict]:
+    """[(Target, Id, 时刻, 值), ...] -> 编译后的 Curves"""
+    cfg = cfg or CurveFitConfig()
+    values = [np.asarray(v, dtype=np.float64) for _, _, _, v in samples]
+    segs = fit_curves([(t, v, curve_tolerance(v, cfg)) for (_, _, t, _), v in zip(samples, values)], cfg.beziers)
+    return [{"Target": target, "Id": pid, "Segments": seg} for (target, pid, _, _), seg in zip(samples, segs)]
+
+
+def _motion_curves_module():
+    sys.path.append(str(Path(__file__).parent.parent / "train"))
+    import motion_curves
+    return motion_curves
+
+
+def compile_motion(motion: Dict, cfg: Optional[CurveFitConfig] = None) -> Tuple[Dict, Dict]:
+    """重新编译已有 motion3：每条曲线在 fps 网格 + 原始段内采样点上求值后拟合，新结果段数更少时替换；返回 (motion, 报告)"""
+    cfg = cfg or CurveFitConfig()
+    mc = _motion_curves_module()
+    meta = motion.get("Meta", {})
+    restricted = bool(meta.get("AreBeziersRestricted", False))
+    duration = float(meta.get("Duration", 0.0))
+    kept_unrestricted = False
+    before = after = 0
+    todo: List[Tuple[Dict, np.ndarray, np.ndarray]] = []
+    for c in motion.get("Curves", []):
+        old = c.get("Segments", [])
+        n_old, _, old_bezier = segment_stats(old)
+        before += n_old
+        curve = mc.parse_segments(old)
+        if n_old == 0 or np.isin(curve["type"], (STEPPED, INVERSE_STEPPED)).any():
+            # 阶梯段的跳变无法用连续段表达，原样保留
+            after += n_old
+            kept_unrestricted |= old_bezier and not restricted
+            continue
+        end = max(duration, float(curve["t1"][-1]))
+        inner = curve["t0"][:, None] + (curve["t1"] - curve["t0"])[:, None] * np.linspace(0, 1, SEGMENT_SAMPLES + 1)
+        grid = mc.frame_times(end, max(cfg.fps, float(meta.get("Fps", 0) or 0)))
+        t = np.unique(np.concatenate([grid, inner.ravel()]))
+        t = t[(t >= 0) & (t <= end)]
+        todo.append((c, t, mc.sample_curve(curve, t, restricted)))
+    fitted = fit_curves([(t, v, curve_tolerance(v, cfg)) for _, t, v in todo], cfg.beziers)
+    for (c, _, _), new in zip(todo, fitted):
+        old = c["Segments"]
+        n_old, _, old_bezier = segment_stats(old)
+        if len(new) < len(old):
+            c["Segments"] = new
+            after += segment_stats(new)[0]
+        else:
+            after += n_old
+            kept_unrestricted |= old_bezier and not restricted
+    meta["AreBeziersRestricted"] = not kept_unrestricted
+    motion["Meta"] = meta
+    update_meta(motion)
+    return motion, {"segments_before": before, "segments_after": after}
+
+
+def dump_motion(motion: Dict, indent: Optional[int] = 2) -> str:
+    return json.dumps(motion, ensure_ascii=False, indent=indent)
+
+
+def source_indent(text: str) -> Optional[int]:
+    """源 JSON 的缩进宽度（单行紧凑格式返回 None）"""
+    lines = text.strip().splitlines()
+    if len(lines) < 2:
+        return None
+    return len(lines[1]) - len(lines[1].lstrip(" ")) or None
+
+
+def compile_file(src: Path, dst: Optional[Path] = None, cfg: Optional[CurveFitConfig] = None,
+                 compact: bool = False) -> Dict:
+    """编译单个文件（默认沿用源文件的缩进风格）"""
+    text = src.read_text(encoding="utf-8")
+    motion, report = compile_motion(json.loads(text), cfg)
+    out = dump_motion(motion, None if compact else source_indent(text))
+    dst = dst or src
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.write_text(out, encoding="utf-8")
+    return {"path": str(dst), "bytes_before": len(text.encode("utf-8")), "bytes_after": len(out.encode("utf-8")),
+            **report}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="motion3 曲线精简编译（RDP + 贝塞尔拟合）")
+    ap.add_argument("paths", nargs="+", help="motion3.json 文件或目录（递归）")
+    ap.add_argument("--out-dir", default=None, help="输出目录（默认原地覆盖）")
+    ap.add_argument("--tolerance", type=float, default=CurveFitConfig.tolerance, help="绝对误差容限（参数值单位）")
+    ap.add_argument("--rel-tolerance", type=float, default=CurveFitConfig.rel_tolerance, help="相对曲线取值范围的误差容限")
+    ap.add_argument("--fps", type=float, default=CurveFitConfig.fps, help="重新求值的采样帧率")
+    ap.add_argument("--linear-only", action="store_true", help="只输出线性段")
+    ap.add_argument("--compact", action="store_true", help="不缩进输出 JSON（默认沿用源文件风格）")
+    args = ap.parse_args()
+
+    cfg = CurveFitConfig(args.tolerance, args.rel_tolerance, args.fps, not args.linear_only)
+    files: List[Tuple[Path, Path]] = []
+    for p in map(Path, args.paths):
+        srcs = sorted(p.rglob("*.motion3.json")) if p.is_dir() else [p]
+        for s in srcs:
+            rel = s.relative_to(p) if p.is_dir() else Path(s.name)
+            files.append((s, Path(args.out_dir) / rel if args.out_dir else s))
+    rows = [compile_file(s, d, cfg, args.compact) for s, d in files]
+    total = {k: sum(r[k] for r in rows) for k in ("bytes_before", "bytes_after", "segments_before", "segments_after")}
+    print(json.dumps({"files": len(rows), **total,
+                      "bytes_saved_ratio": 1 - total["bytes_after"] / total["bytes_before"] if rows else 0.0,
+                      "segments_saved_ratio": (1 - total["segments_after"] / total["segments_before"]
+                                               if total["segments_before"] else 0.0),
+                      "details": rows}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+音频驱动的口型动作生成：
+- 按块流式读取本地 WAV（PCM 8/16/24/32 位，多声道取均值），整段音频不进内存；不足一帧的尾部样本带入下一块
+- 每 1/fps 秒一帧：RMS 能量与 300-5000Hz 频谱质心（避开基频）（Hann 窗 rfft），逐块向量化计算；只保留逐帧特征（1 小时约 10 万帧）
+- 开口度：dB 相对全段 95 分位做 --range-db 动态范围映射到 [0, 1]；口形：质心高（i/e）-> +1 咧嘴，低（o/u）-> -1 嘟嘴，
+  闭口时回到 0；两者用 --smooth 秒的 Hann 核做无相位延迟的平滑
+- ParamMouthOpenY / ParamMouthForm 曲线经 compile_motion_curves 拟合为少量关键帧，写出 motion3 并登记到 model3.json
+  （Motions 的 LipSync 分组、可选 Sound 字段，以及 Groups 中的 LipSync 参数组）
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import json
+import os
+import shutil
+import time
+import wave
+
+import numpy as np
+
+from compile_motion_curves import fit_curves, update_meta
+
+LIPSYNC_GROUP = "LipSync"
+CHUNK_SECONDS = 10.0
+CENTROID_BAND = (300.0, 5000.0)
+# 质心 -> 口形的线性映射区间（Hz）
+FORM_CENTROID = (600.0, 2200.0)
+
+
+@dataclass
+class LipSyncConfig:
+    fps: float = 30.0
+    range_db: float = 30.0
+    smooth: float = 0.08
+    open_tolerance: float = 0.02
+    form_tolerance: float = 0.05
+    open_id: str = "ParamMouthOpenY"
+    form_id: str = "ParamMouthForm"
+    chunk_seconds: float = CHUNK_SECONDS
+
+
+def _pcm_to_float(raw: bytes, width: int, channels: int) -> np.ndarray:
+    """PCM 字节 -> float32 单声道 [-1, 1]"""
+    if width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        x = (np.where(v >= 1 << 23, v - (1 << 24), v)).astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"不支持的采样位宽: {width * 8} bit")
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    return x
+
+
+def iter_wav_chunks(path: Path, chunk_seconds: float = CHUNK_SECONDS) -> Iterator[Tuple[np.ndarray, int]]:
+    """逐块产出 (float32 单声道样本, 采样率)"""
+    with wave.open(str(path), "rb") as w:
+        sr, width, channels = w.getframerate(), w.getsampwidth(), w.getnchannels()
+        frames = max(1, int(sr * chunk_seconds))
+        while True:
+            raw = w.readframes(frames)
+            if not raw:
+                break
+            yield _pcm_to_float(raw, width, channels), sr
+
+
+def frame_features(path: Path, fps: float, chunk_seconds: float = CHUNK_SECONDS) -> Dict:
+    """逐帧 RMS 与频谱质心：{"rms", "centroid", "sample_rate", "hop", "samples"}"""
+    rms: List[np.ndarray] = []
+    centroid: List[np.ndarray] = []
+    carry = np.zeros(0, dtype=np.float32)
+    sr = hop = 0
+    window = freqs = band = None
+    total = 0
+    for x, sr in iter_wav_chunks(path, chunk_seconds):
+        if window is None:
+            hop = max(1, int(round(sr / fps)))
+            window = np.hanning(hop).astype(np.float32)
+            freqs = np.fft.rfftfreq(hop, 1.0 / sr)
+            band = (freqs >= CENTROID_BAND[0]) & (freqs <= CENTROID_BAND[1])
+        total += len(x)
+        x = np.concatenate([carry, x]) if len(carry) else x
+        n = len(x) // hop
+        carry = x[n * hop:]
+        if not n:
+            continue
+        frames = x[:n * hop].reshape(n, hop)
+        rms.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        power = np.abs(np.fft.rfft(frames * window, axis=1))[:, band] ** 2
+        weight = power.sum(axis=1)
+        centroid.append(np.divide(power @ freqs[band], weight, out=np.zeros(n), where=weight > 0))
+    if len(carry):
+        rms.append(np.array([np.sqrt(np.mean(carry * carry))]))
+        centroid.append(np.zeros(1))
+    return {"rms": np.concatenate(rms) if rms else np.zeros(0), "centroid": np.concatenate(centroid) if centroid else
+            np.zeros(0), "sample_rate": sr, "hop": hop, "samples": total}
+
+
+def smooth(x: np.ndarray, width: int) -> np.ndarray:
+    """Hann 核零相位平滑（边缘按端点值延拓）"""
+    if width < 2 or len(x) < 2:
+        return x
+    k = np.hanning(width + 2)[1:-1]
+    k /= k.sum()
+    pad = width // 2
+    y = np.convolve(np.pad(x, (pad, width - 1 - pad), mode="edge"), k, mode="valid")
+    return y[:len(x)]
+
+
+def mouth_curves(feat: Dict, cfg: LipSyncConfig) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """逐帧特征 -> (时刻, 开口度 [0,1], 口形 [-1,1])"""
+    n = len(feat["rms"])
+    times = np.arange(n) * feat["hop"] / max(feat["sample_rate"], 1)
+    if not n:
+        return times, np.zeros(0), np.zeros(0)
+    db = 20 * np.log10(feat["rms"] + 1e-9)
+    voiced = db[db > -90]
+    ref = np.percentile(voiced, 95) if len(voiced) else 0.0
+    width = int(round(cfg.smooth * cfg.fps))
+    mouth_open = np.clip((smooth(db, width) - (ref - cfg.range_db)) / cfg.range_db, 0.0, 1.0)
+    lo, hi = FORM_CENTROID
+    form = 2 * np.clip((feat["centroid"] - lo) / (hi - lo), 0.0, 1.0) - 1
+    form = smooth(form, width) * np.minimum(mouth_open * 4, 1.0)
+    return times, mouth_open, form
+
+
+def lipsync_motion(path: Path, cfg: Optional[LipSyncConfig] = None) -> Tuple[Dict, Dict]:
+    """WAV -> (motion3 字典, 统计)"""
+    cfg = cfg or LipSyncConfig()
+    feat = frame_features(path, cfg.fps, cfg.chunk_seconds)
+    times, mouth_open, form = mouth_curves(feat, cfg)
+    duration = feat["samples"] / max(feat["sample_rate"], 1)
+    curves = []
+    if len(times):
+        segs = fit_curves([(times, mouth_open, cfg.open_tolerance), (times, form, cfg.form_tolerance)])
+        curves = [{"Target": "Parameter", "Id": cfg.open_id, "Segments": segs[0]},
+                  {"Target": "Parameter", "Id": cfg.form_id, "Segments": segs[1]}]
+    motion = update_meta({
+        "Version": 3,
+        "Meta": {"Duration": round(duration, 4), "Fps": float(cfg.fps), "Loop": False, "AreBeziersRestricted": True,
+                 "UserDataCount": 0, "TotalUserDataSize": 0},
+        "Curves": curves,
+    })
+    return motion, {"audio": str(path), "duration": duration, "sample_rate": feat["sample_rate"],
+                    "frames": len(times), "segments": motion["Meta"]["TotalSegmentCount"]}
+
+
+def model3_files(model_dir: Path) -> List[Path]:
+    return sorted(p for p in model_dir.glob("*.model3.json") if ".preview_" not in p.name)
+
+
+def ensure_lipsync_group(model3: Dict, ids: Sequence[str]) -> None:
+    """Groups 中的 LipSync 参数组包含 ids（SDK 据此把口型值写到这些参数）"""
+    groups = model3.setdefault("Groups", [])
+    group = next((g for g in groups if g.get("Target") == "Parameter" and g.get("Name") == LIPSYNC_GROUP), None)
+    if group is None:
+        group = {"Target": "Parameter", "Name": LIPSYNC_GROUP, "Ids": []}
+        groups.append(group)
+    group["Ids"] = list(group.get("Ids", [])) + [i for i in ids if i not in group.get("Ids", [])]
+
+
+def register_motions(model_dir: Path, items: List[Dict[str, str]], ids: Sequence[str]) -> List[Path]:
+    """把口型动作登记到目录下所有 model3.json（按 File 去重），返回更新的文件"""
+    updated = []
+    for path in model3_files(model_dir):
+        data = json.loads(path.read_text(encoding="utf-8"))
+        refs = data.setdefault("FileReferences", {})
+        motions = refs.get("Motions") if isinstance(refs.get("Motions"), dict) else {}
+        group = motions.setdefault(LIPSYNC_GROUP, [])
+        known = {m.get("File") for m in group if isinstance(m, dict)}
+        group.extend(m for m in items if m["File"] not in known)
+        refs["Motions"] = motions
+        ensure_lipsync_group(data, ids)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.part")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+        updated.append(path)
+    return updated
+
+
+def generate_lipsync(audio: Sequence[Path], model_dir: Path, cfg: Optional[LipSyncConfig] = None,
+                     copy_audio: bool = False) -> Tuple[Dict[str, List[Dict[str, str]]], List[Dict]]:
+    """为每个 WAV 写出 <model_dir>/mtn/lipsync_<stem>.motion3.json；返回 ({"LipSync": [...]}, 统计)。
+    copy_audio 时把音频复制到 <model_dir>/sounds/ 并写入 Sound 字段（音频已在模型目录内时直接引用）"""
+    cfg = cfg or LipSyncConfig()
+    mtn = model_dir / "mtn"
+    mtn.mkdir(parents=True, exist_ok=True)
+    items: List[Dict[str, str]] = []
+    stats: List[Dict] = []
+    for src in map(Path, audio):
+        t0 = time.perf_counter()
+        motion, info = lipsync_motion(src, cfg)
+        name = f"lipsync_{src.stem}"
+        (mtn / f"{name}.motion3.json").write_text(json.dumps(motion, ensure_ascii=False), encoding="utf-8")
+        item = {"File": f"mtn/{name}.motion3.json", "Name": name}
+        sound = src.resolve()
+        if copy_audio:
+            (model_dir / "sounds").mkdir(exist_ok=True)
+            sound = model_dir / "sounds" / src.name
+            if sound.resolve() != src.resolve():
+                shutil.copyfile(src, sound)
+        try:
+            item["Sound"] = sound.resolve().relative_to(model_dir.resolve()).as_posix()
+        except ValueError:
+            pass
+        items.append(item)
+        stats.append({**info, "motion": item["File"], "seconds": time.perf_counter() - t0})
+    return {LIPSYNC_GROUP: items}, stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="音频驱动的口型动作生成（流式 WAV -> motion3）")
+    ap.add_argument("audio", nargs="+", help="WAV 文件")
+    ap.add_argument("--model-dir", required=True, help="模型目录（写入 mtn/ 并更新其中的 model3.json）")
+    ap.add_argument("--fps", type=float, default=LipSyncConfig.fps)
+    ap.add_argument("--range-db", type=float, default=LipSyncConfig.range_db, help="开口度映射的动态范围（dB）")
+    ap.add_argument("--smooth", type=float, default=LipSyncConfig.smooth, help="平滑核宽度（秒）")
+    ap.add_argument("--open-tolerance", type=float, default=LipSyncConfig.open_tolerance)
+    ap.add_argument("--form-tolerance", type=float, default=LipSyncConfig.form_tolerance)
+    ap.add_argument("--open-id", default=LipSyncConfig.open_id)
+    ap.add_argument("--form-id", default=LipSyncConfig.form_id)
+    ap.add_argument("--copy-audio", action="store_true", help="复制音频到 sounds/ 并写入 Sound 字段")
+    ap.add_argument("--no-register", action="store_true", help="只写出动作，不修改 model3.json")
+    args = ap.parse_args()
+
+    cfg = LipSyncConfig(args.fps, args.range_db, args.smooth, args.open_tolerance, args.form_tolerance,
+                        args.open_id, args.form_id)
+    model_dir = Path(args.model_dir)
+    motions, stats = generate_lipsync([Path(a) for a in args.audio], model_dir, cfg, args.copy_audio)
+    updated = [] if args.no_register else register_motions(model_dir, motions[LIPSYNC_GROUP], [cfg.open_id])
+    print(json.dumps({"motions": stats, "model3": [str(p) for p in updated]}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,23 +6,25 @@
 - 点头/摇头（短促缓动）
 - 眨眼（稀疏脉冲）
 
-输出符合 Cubism Motion3 结构的 JSON。
+输出符合 Cubism Motion3 结构的 JSON。逐帧采样的曲线默认经 compile_motion_curves 编译为少量贝塞尔/线性段
+（--tolerance/--rel-tolerance 控制误差，--raw 保留逐帧线性段），Meta 计数按输出重新计算。
 """
 
-import json
 from pathlib import Path
 from typing import List, Dict, Any
 import math
 import argparse
 
+from compile_motion_curves import CurveFitConfig, compile_motion, dump_motion, update_meta
 
-def bezier_segments_from_keypoints(points: List[tuple]) -> List[float]:
-    """用线性片段编码Segments（1, t, v），起点为(t0,v0)。这里简化为线性段。"""
+
+def linear_segments_from_keypoints(points: List[tuple]) -> List[float]:
+    """用线性片段编码Segments（0, t, v），起点为(t0,v0)。类型 1 是贝塞尔段（需 6 个值），不能用于线性点。"""
     if not points:
         return []
     seg: List[float] = [float(points[0][0]), float(points[0][1])]
     for t, v in points[1:]:
-        seg.extend([1.0, float(t), float(v)])
+        seg.extend([0, float(t), float(v)])
     return seg
 
 
@@ -37,12 +39,12 @@ def generate_idle(duration: float, fps: float = 30.0) -> List[Dict[str, Any]]:
             t = i / fps
             v = amp * math.sin(2 * math.pi * t / duration)
             keypoints.append((t, v))
-        curves.append({"Target": "Parameter", "Id": pid, "Segments": bezier_segments_from_keypoints(keypoints)})
+        curves.append({"Target": "Parameter", "Id": pid, "Segments": linear_segments_from_keypoints(keypoints)})
 
     # EyeLOpen/EyeROpen 轻微变化
     for pid in ("ParamEyeLOpen", "ParamEyeROpen"):
         points = [(0.0, 1.0), (duration * 0.5, 0.9), (duration, 1.0)]
-        curves.append({"Target": "Parameter", "Id": pid, "Segments": bezier_segments_from_keypoints(points)})
+        curves.append({"Target": "Parameter", "Id": pid, "Segments": linear_segments_from_keypoints(points)})
     return curves
 
 
@@ -51,7 +53,7 @@ def generate_nod(duration: float) -> List[Dict[str, Any]]:
     curves = []
     points = [(0.0, 0.0), (duration * 0.25, -10.0), (duration * 0.5, 0.0), (duration * 0.75, 6.0), (duration, 0.0)]
     for pid in ("ParamAngleX", "ParamAngleY", "ParamAngleZ"):
-        curves.append({"Target": "Parameter", "Id": pid, "Segments": bezier_segments_from_keypoints(points)})
+        curves.append({"Target": "Parameter", "Id": pid, "Segments": linear_segments_from_keypoints(points)})
     return curves
 
 
@@ -64,22 +66,22 @@ def generate_blink(duration: float, repeats: int = 2) -> List[Dict[str, Any]]:
             t0 = (i + 0.25) * duration / repeats
             seg_points.extend([(t0, 0.2), (t0 + duration * 0.05, 1.0)])
         seg_points.append((duration, 1.0))
-        curves.append({"Target": "Parameter", "Id": pid, "Segments": bezier_segments_from_keypoints(seg_points)})
+        curves.append({"Target": "Parameter", "Id": pid, "Segments": linear_segments_from_keypoints(seg_points)})
     return curves
 
 
 def build_motion(curves: List[Dict[str, Any]], duration: float, fps: float, loop: bool) -> Dict[str, Any]:
-    return {
+    motion = {
         "Version": 3,
         "Meta": {
             "Duration": float(duration),
             "Fps": float(fps),
             "Loop": bool(loop),
-            "AreBeziersRestricted": False,
-            "CurveCount": len(curves),
+            "AreBeziersRestricted": True,
         },
         "Curves": curves,
     }
+    return update_meta(motion)
 
 
 def main():
@@ -89,6 +91,9 @@ def main():
     ap.add_argument("--duration", type=float, default=2.0)
     ap.add_argument("--fps", type=float, default=30.0)
     ap.add_argument("--loop", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=CurveFitConfig.tolerance, help="曲线编译绝对误差容限")
+    ap.add_argument("--rel-tolerance", type=float, default=CurveFitConfig.rel_tolerance, help="相对取值范围的误差容限")
+    ap.add_argument("--raw", action="store_true", help="不编译曲线，保留逐帧线性段")
     args = ap.parse_args()
 
     if args.type == "idle":
@@ -99,10 +104,15 @@ def main():
         curves = generate_blink(args.duration)
 
     motion = build_motion(curves, args.duration, args.fps, args.loop)
+    raw_bytes, raw_segments = len(dump_motion(motion).encode("utf-8")), motion["Meta"]["TotalSegmentCount"]
+    if not args.raw:
+        motion, _ = compile_motion(motion, CurveFitConfig(args.tolerance, args.rel_tolerance, args.fps))
+    text = dump_motion(motion)
     out = Path(args.output)
     out.parent.mkdir(parents=True, exist_ok=True)
-    out.write_text(json.dumps(motion, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"生成动作: {out}")
+    out.write_text(text, encoding="utf-8")
+    print(f"生成动作: {out}（段数 {raw_segments} -> {motion['Meta']['TotalSegmentCount']}，"
+          f"字节 {raw_bytes} -> {len(text.encode('utf-8'))}）")
 
 
 if __name__ == "__main__":
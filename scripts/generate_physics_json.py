@@ -2,15 +2,43 @@
 """
 程序化生成 physics3.json（占位）：
 从模板 physics3.json 读取结构，微调部分参数（如输出、回弹等），用于占位AI物理生成。
+--check 时用 simulate_physics 模拟模板与结果，模板中稳定、结果中不稳定的 setting 视为退化，拒绝写出。
+--tune 时改为参数搜索：每个 setting 对 Mobility/Delay/Acceleration 与输出 Scale 采样一组对数尺度扰动候选，
+全部 setting × 候选一次向量化模拟打分（不稳定淘汰；活泼度减去稳定时间/抖动/饱和/偏离模板的惩罚），
+按轮收缩到当前最优，写出每个 setting 的最优候选（模板本身始终在候选中）。
 """
 
+from dataclasses import dataclass, field
 import json
+import sys
+import time
 from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
 import argparse
 
+import numpy as np
 
-def tweak_physics(template: Path, out: Path, scale: float = 1.0):
+from simulate_physics import MAXIMUM_WEIGHT, PhysicsBatch, SimConfig, check_physics, evaluate, load_ranges
+
+# 搜索的每 setting 缩放因子：粒子 Mobility/Delay/Acceleration 与输出 Scale
+TUNED_FIELDS = ("Mobility", "Delay", "Acceleration", "Scale")
+
+
+@dataclass
+class TuneConfig:
+    population: int = 48
+    rounds: int = 2
+    spread: float = 0.25  # 首轮对数扰动标准差，之后每轮减半
+    target_amplitude: float = 0.6  # 活泼度按输出幅度计，超过目标不再加分
+    deviation_weight: float = 0.3
+    seed: int = 0
+    sim: SimConfig = field(default_factory=SimConfig)
+
+
+def tweak_physics(template: Path, out: Path, scale: float = 1.0, check: bool = False) -> list:
+    """返回 --check 发现的退化 setting（非空时不写出）"""
     data = json.loads(template.read_text(encoding="utf-8"))
+    base = json.loads(json.dumps(data)) if check else None
     # 简单策略：对 EffectiveMass/Delay/Output/Particles 等字段做轻微缩放
     def _scale(v):
         try:
@@ -18,18 +46,121 @@ def tweak_physics(template: Path, out: Path, scale: float = 1.0):
         except Exception:
             return v
 
+    def _is_number(v):
+        # bool 是 int 的子类，Reflect 等布尔字段不参与缩放
+        return isinstance(v, (float, int)) and not isinstance(v, bool)
+
+    # physics3 的字段为 Output/Vertices（兼容旧占位文件中的 Outputs/Particles）
     for setting in data.get("PhysicsSettings", []):
-        for output in setting.get("Outputs", []):
-            for k in ("Scale", "Weight", "Reflect" ):
-                if k in output and isinstance(output[k], (float, int)):
+        for output in setting.get("Output", setting.get("Outputs", [])):
+            for k in ("Scale", "Weight"):
+                if k in output and _is_number(output[k]):
                     output[k] = _scale(output[k])
-        for particle in setting.get("Particles", []):
+            # SDK 按 MaximumWeight=100 归一化，超出无意义
+            if _is_number(output.get("Weight")):
+                output["Weight"] = min(output["Weight"], MAXIMUM_WEIGHT)
+        for particle in setting.get("Vertices", setting.get("Particles", [])):
             for k in ("Mobility", "Delay", "Acceleration", "Radius"):
-                if k in particle and isinstance(particle[k], (float, int)):
+                if k in particle and _is_number(particle[k]):
                     particle[k] = _scale(particle[k])
 
+    if check:
+        before, after = check_physics([base]), check_physics([data])
+        regressions = [b for a, b in zip(before, after) if a["stable"] and not b["stable"]]
+        if regressions:
+            return regressions
+
     out.parent.mkdir(parents=True, exist_ok=True)
     out.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return []
+
+
+def _capped_mobility(mobility: np.ndarray, factor: np.ndarray) -> np.ndarray:
+    # Mobility > 1 时速度逐帧放大，缩放结果不超过 max(模板值, 1)
+    return np.minimum(mobility * factor, np.maximum(mobility, 1.0))
+
+
+def apply_factors(batch: PhysicsBatch, factors: np.ndarray) -> PhysicsBatch:
+    """factors: (len(batch), 4) 各 setting 的缩放因子（顺序同 TUNED_FIELDS），原地修改并返回"""
+    batch.mobility = _capped_mobility(batch.mobility, factors[:, :1])
+    batch.delay = batch.delay * factors[:, 1:2]
+    batch.acceleration = batch.acceleration * factors[:, 2:3]
+    batch.out_scale = batch.out_scale * factors[:, 3:4]
+    return batch
+
+
+def physics_score(metrics: Dict[str, np.ndarray], z: np.ndarray, cfg: TuneConfig) -> np.ndarray:
+    """候选得分（越大越好），z 为对数缩放因子 (N, 4)；不稳定候选为 -inf"""
+    sim = cfg.sim
+    with np.errstate(invalid="ignore"):
+        lively = np.minimum(metrics["amplitude"], cfg.target_amplitude) / cfg.target_amplitude
+        score = (lively
+                 - 0.5 * metrics["settle_time"] / sim.settle_limit
+                 - 0.5 * metrics["jitter"] / sim.jitter_limit
+                 - metrics["saturation"] / sim.saturation_limit
+                 - cfg.deviation_weight * np.abs(z).mean(axis=1))
+    return np.where(metrics["stable"], score, -np.inf)
+
+
+def search_factors(batch: PhysicsBatch, cfg: TuneConfig,
+                   ranges: Optional[Dict[str, Sequence[float]]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """每个 setting 的最优缩放因子 (S, 4) 与得分 (S,)；每轮 S × population 个候选一次模拟"""
+    S, K = len(batch), max(cfg.population, 1)
+    rng = np.random.default_rng(cfg.seed)
+    center = np.zeros((S, len(TUNED_FIELDS)))
+    best_z, best_score = center.copy(), np.full(S, -np.inf)
+    sigma = cfg.spread
+    index = np.repeat(np.arange(S), K)
+    for _ in range(max(cfg.rounds, 1)):
+        z = center[:, None, :] + rng.normal(0.0, sigma, (S, K, len(TUNED_FIELDS)))
+        z[:, 0] = center  # 首轮即模板本身，之后为当前最优
+        flat = z.reshape(S * K, -1)
+        metrics = evaluate(apply_factors(batch.take(index), np.exp(flat)), cfg.sim, ranges)
+        score = physics_score(metrics, flat, cfg).reshape(S, K)
+        k = score.argmax(axis=1)
+        better = score[np.arange(S), k] > best_score
+        best_z[better] = z[better, k[better]]
+        best_score[better] = score[better, k[better]]
+        center = best_z.copy()
+        sigma *= 0.5
+    return np.exp(best_z), best_score
+
+
+def tune_physics(template: Path, out: Path, cfg: Optional[TuneConfig] = None,
+                 ranges: Optional[Dict[str, Sequence[float]]] = None) -> Dict:
+    """参数搜索后写出 physics3.json，返回每个 setting 的因子与前后稳定性"""
+    cfg = cfg or TuneConfig()
+    t0 = time.perf_counter()
+    data = json.loads(template.read_text(encoding="utf-8"))
+    before = check_physics([data], cfg.sim, ranges)
+    batch = PhysicsBatch.from_physics([data], cfg.sim.fps)
+    factors, scores = search_factors(batch, cfg, ranges) if len(batch) else (np.ones((0, 4)), np.zeros(0))
+
+    for setting, f in zip(data.get("PhysicsSettings", []), factors):
+        for vertex in setting.get("Vertices", [])[1:]:
+            if isinstance(vertex.get("Mobility"), (float, int)):
+                vertex["Mobility"] = round(float(_capped_mobility(np.float64(vertex["Mobility"]), f[0])), 4)
+            for k, v in (("Delay", f[1]), ("Acceleration", f[2])):
+                if isinstance(vertex.get(k), (float, int)):
+                    vertex[k] = round(vertex[k] * float(v), 4)
+        for output in setting.get("Output", []):
+            if isinstance(output.get("Scale"), (float, int)):
+                output["Scale"] = round(output["Scale"] * float(f[3]), 4)
+
+    after = check_physics([data], cfg.sim, ranges)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return {
+        "settings": [{
+            "setting": b["setting"].split(":", 1)[1],
+            "factors": {k: round(float(v), 3) for k, v in zip(TUNED_FIELDS, f)},
+            "score": None if not np.isfinite(sc) else round(float(sc), 3),
+            "before": {k: b[k] for k in ("stable", "amplitude", "settle_time")},
+            "after": {k: a[k] for k in ("stable", "amplitude", "settle_time")},
+        } for b, a, f, sc in zip(before, after, factors, scores)],
+        "candidates": len(batch) * max(cfg.population, 1) * max(cfg.rounds, 1),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
 
 
 def main():
@@ -37,9 +168,25 @@ def main():
     ap.add_argument("template", help="模板 physics3.json")
     ap.add_argument("output", help="输出 physics3.json")
     ap.add_argument("--scale", type=float, default=1.05)
+    ap.add_argument("--check", action="store_true", help="模拟校验，出现退化的 setting 时拒绝写出")
+    ap.add_argument("--tune", action="store_true", help="向量化参数搜索替代固定缩放")
+    ap.add_argument("--population", type=int, default=TuneConfig.population, help="每个 setting 每轮候选数")
+    ap.add_argument("--rounds", type=int, default=TuneConfig.rounds, help="搜索轮数")
+    ap.add_argument("--seed", type=int, default=TuneConfig.seed)
+    ap.add_argument("--param-ranges", default=None, help="参数量程 JSON：{Id: [最小, 默认, 最大]}")
     args = ap.parse_args()
 
-    tweak_physics(Path(args.template), Path(args.output), args.scale)
+    if args.tune:
+        cfg = TuneConfig(population=args.population, rounds=args.rounds, seed=args.seed)
+        report = tune_physics(Path(args.template), Path(args.output), cfg, load_ranges(args.param_ranges))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    regressions = tweak_physics(Path(args.template), Path(args.output), args.scale, args.check)
+    if regressions:
+        for item in regressions:
+            print(f"物理退化: {item['setting'].split(':', 1)[1]} {'，'.join(item['reasons'])}", file=sys.stderr)
+        sys.exit(1)
     print(f"生成物理: {args.output}")
 
 
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+生成纹理的输出优化（减小模型体积与网页预览传输量）：
+- 无损重编码：PNG optimize（压缩级别 9）；alpha 全不透明时存为 RGB；颜色数 <=256 时按颜色表逐像素映射为精确调色板（解码校验一致）
+- 可选调色板量化（--quantize）：RGBA 八叉树量化为 <=N 色调色板（带 alpha），
+  仅当与未量化图像的 PSNR/SSIM（evaluate_quality.py 的 compute_psnr/compute_ssim，按预乘 alpha 的可见颜色计算）
+  均不低于阈值时采用
+- 每个文件取通过校验的最小结果，只有比现文件小时才替换（临时文件 + os.replace：若原文件是纹理缓存的硬链接，缓存条目不受影响）；
+  替换后保留原 mtime，纹理金字塔等按 mtime 判定的下游不会因此重建
+- 覆盖模型目录下各 model3.json（含预览版本）引用的纹理；按文件并行（进程池），输出每个模型节省的字节数
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import io
+import json
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OptimizeConfig:
+    quantize: bool = False
+    colors: int = 256
+    min_psnr: float = 40.0
+    min_ssim: float = 0.98
+
+
+def _encode(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def _visible_bgr(rgba: np.ndarray) -> np.ndarray:
+    """预乘 alpha 后的可见颜色（BGR 顺序，供 cv2 灰度转换）：透明像素的 RGB 不影响显示，不计入误差"""
+    a = rgba[..., 3:4].astype(np.uint16)
+    return np.ascontiguousarray((rgba[..., 2::-1].astype(np.uint16) * a // 255).astype(np.uint8))
+
+
+def exact_palette(img: Image.Image, rgba: np.ndarray) -> Optional[Image.Image]:
+    """颜色数 <=256 时按 getcolors() 的颜色表逐像素精确映射为 P 模式（调色板含 alpha，存为 tRNS）"""
+    colors = img.getcolors(256)
+    if colors is None:
+        return None
+    table = np.array([c for _, c in colors], dtype=np.uint8).reshape(-1, 4)
+    packed = table.view("<u4").ravel()
+    order = np.argsort(packed)
+    pixels = np.ascontiguousarray(rgba).view("<u4")[..., 0]
+    index = order[np.searchsorted(packed[order], pixels)].astype(np.uint8)
+    pal = Image.fromarray(index, "P")
+    pal.putpalette(table.tobytes(), rawmode="RGBA")
+    return pal
+
+
+def quantized_quality(orig: np.ndarray, quant: np.ndarray) -> Tuple[float, float]:
+    """(PSNR, SSIM)：PSNR 取可见颜色与 alpha 两者的较小值"""
+    from evaluate_quality import compute_psnr, compute_ssim
+    a, b = _visible_bgr(orig), _visible_bgr(quant)
+    psnr = min(compute_psnr(a, b), compute_psnr(orig[..., 3], quant[..., 3]))
+    return float(psnr), compute_ssim(a, b)
+
+
+def optimize_png(path: str, cfg: OptimizeConfig) -> Dict:
+    """优化单个 PNG；返回 {path, mode, bytes_before, bytes_after, psnr?, ssim?}"""
+    p = Path(path)
+    st = p.stat()
+    with Image.open(p) as img:
+        img = img.convert("RGBA")
+    rgba = np.asarray(img)
+    row: Dict = {"path": str(p), "mode": "kept", "bytes_before": st.st_size, "bytes_after": st.st_size}
+
+    candidates: List[Tuple[str, bytes]] = []
+    if (rgba[..., 3] == 255).all():
+        candidates.append(("rgb", _encode(img.convert("RGB"))))
+    else:
+        candidates.append(("rgba", _encode(img)))
+    pal = exact_palette(img, rgba)
+    if pal is not None:
+        # 颜色数不超过 256：调色板无损；解码校验逐像素一致后才作为候选
+        data = _encode(pal)
+        with Image.open(io.BytesIO(data)) as check:
+            if np.array_equal(np.asarray(check.convert("RGBA")), rgba):
+                candidates.append(("palette_exact", data))
+    elif cfg.quantize:
+        quant = img.quantize(colors=cfg.colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        data = _encode(quant)
+        if len(data) < min(len(c[1]) for c in candidates):
+            psnr, ssim = quantized_quality(rgba, np.asarray(quant.convert("RGBA")))
+            row.update(psnr=psnr, ssim=ssim)
+            if psnr >= cfg.min_psnr and ssim >= cfg.min_ssim:
+                candidates.append(("quantized", data))
+
+    mode, data = min(candidates, key=lambda c: len(c[1]))
+    if len(data) < st.st_size:
+        tmp = p.with_name(p.name + ".opt.part")
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+        os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns))
+        row.update(mode=mode, bytes_after=len(data))
+    return row
+
+
+def model_textures(model_dir: Path) -> List[Path]:
+    """模型目录下所有 model3.json（含 .preview_ 版本）引用的纹理，去重"""
+    seen: Dict[Path, None] = {}
+    for m in sorted(model_dir.glob("*.model3.json")):
+        doc = json.loads(m.read_text(encoding="utf-8"))
+        for t in doc.get("FileReferences", {}).get("Textures", []):
+            p = (model_dir / t).resolve()
+            if p.suffix.lower() == ".png" and p.exists():
+                seen.setdefault(p, None)
+    return list(seen)
+
+
+def optimize_models(model_dirs: Sequence[Path], cfg: Optional[OptimizeConfig] = None,
+                    workers: Optional[int] = None) -> List[Dict]:
+    """按文件并行优化多个模型目录的纹理；返回每个模型的汇总（含逐文件明细）"""
+    cfg = cfg or OptimizeConfig()
+    tasks = [(Path(d), p) for d in model_dirs for p in model_textures(Path(d))]
+    if workers == 1 or len(tasks) <= 1:
+        rows = [optimize_png(str(p), cfg) for _, p in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(optimize_png, [str(p) for _, p in tasks], [cfg] * len(tasks)))
+
+    reports: List[Dict] = []
+    for d in model_dirs:
+        files = [r for (md, _), r in zip(tasks, rows) if md == Path(d)]
+        before = sum(r["bytes_before"] for r in files)
+        after = sum(r["bytes_after"] for r in files)
+        reports.append({
+            "model_dir": str(d),
+            "files": len(files),
+            "bytes_before": before,
+            "bytes_after": after,
+            "bytes_saved": before - after,
+            "saved_ratio": (before - after) / before if before else 0.0,
+            "details": files,
+        })
+        logger.info(f"纹理优化 {Path(d).name}: {len(files)} 个文件, {before:,} -> {after:,} bytes (节省 {before - after:,})")
+    return reports
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ap = argparse.ArgumentParser(description="生成纹理的 PNG 无损重编码与可选调色板量化")
+    ap.add_argument("model_dirs", nargs="+", help="模型输出目录（可多个）")
+    ap.add_argument("--quantize", action="store_true", help="尝试调色板量化（需通过 PSNR/SSIM 阈值）")
+    ap.add_argument("--colors", type=int, default=256, help="量化调色板颜色数（<=256）")
+    ap.add_argument("--min-psnr", type=float, default=40.0)
+    ap.add_argument("--min-ssim", type=float, default=0.98)
+    ap.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 数）")
+    ap.add_argument("--details", action="store_true", help="输出逐文件明细")
+    args = ap.parse_args()
+    cfg = OptimizeConfig(quantize=args.quantize, colors=args.colors, min_psnr=args.min_psnr, min_ssim=args.min_ssim)
+    reports = optimize_models([Path(d) for d in args.model_dirs], cfg, args.workers)
+    if not args.details:
+        for r in reports:
+            r.pop("details")
+    print(json.dumps({"config": asdict(cfg), "models": reports}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
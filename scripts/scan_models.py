@@ -64,7 +64,7 @@ def scan_single_model(model_dir: Path) -> Optional[ModelInfo]:
     model_id = model_dir.name
     
     # 查找model3.json文件
-    model3_json_files = list(model_dir.glob("*.model3.json"))
+    model3_json_files = [p for p in model_dir.glob("*.model3.json") if ".preview_" not in p.name]
     if not model3_json_files:
         logger.warning(f"模型 {model_id} 未找到 model3.json 文件")
         return None
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+physics3.json 向量化模拟与稳定性评估：
+- 按 Cubism SDK（CubismPhysics）语义：输入参数按 Normalization.Position/Angle 归一化（Reflect 取反、Weight 加权）
+  -> 根粒子平移与重力方向旋转 -> 粒子链按 Delay/Mobility/Acceleration/Radius 逐帧积分（空气阻力、移动阈值）
+  -> 输出 X/Y/Angle 乘 Scale，截断到参数量程后按 Weight 混合
+- 多个文件的全部 PhysicsSettings（以及参数扰动候选）× 多条输入轨迹展开为一个批次；每个时间步只对粒子下标循环，
+  其余全部是 (轨迹 × setting) 维的数组运算
+- 指标（输出按参数半量程归一化）：最大幅度、饱和比例（越界被截断的帧占比）、输入停止后的稳定时间、
+  抖动能量（逐帧方向反转的增量平方均值）与数值发散，据此给出每个 setting 的 stable 判定
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import time
+
+import numpy as np
+
+AIR_RESISTANCE = 5.0
+MAXIMUM_WEIGHT = 100.0
+MOVEMENT_THRESHOLD = 0.001
+DEFAULT_FPS = 30.0
+IO_TYPES = {"X": 0, "Y": 1, "Angle": 2}
+# 参数 Id 前缀 -> (最小, 默认, 最大)；真实量程在 moc3 中不可读，按 Cubism 标准参数约定，可用 --param-ranges 覆盖
+PARAM_RANGES = (
+    ("ParamBodyAngle", (-10.0, 0.0, 10.0)),
+    ("ParamAngle", (-30.0, 0.0, 30.0)),
+    ("ParamBreath", (0.0, 0.0, 1.0)),
+)
+DEFAULT_RANGE = (-1.0, 0.0, 1.0)
+STIMULI = ("step", "sway", "shake")
+# 标准刺激幅度（相对参数半量程），对应常见动作的转头幅度
+STIMULUS_AMPLITUDE = 0.5
+
+
+@dataclass
+class SimConfig:
+    fps: Optional[float] = None  # None -> Meta.Fps，缺省 30
+    duration: float = 4.0
+    settle_eps: float = 0.05
+    settle_limit: float = 1.5
+    jitter_limit: float = 2e-3
+    saturation_limit: float = 0.3
+
+
+def param_range(param_id: str, ranges: Optional[Dict[str, Sequence[float]]] = None) -> Tuple[float, float, float]:
+    if ranges and param_id in ranges:
+        lo, default, hi = ranges[param_id]
+        return float(lo), float(default), float(hi)
+    for prefix, rng in PARAM_RANGES:
+        if param_id.startswith(prefix):
+            return rng
+    return DEFAULT_RANGE
+
+
+def _pad(rows: List[List[float]], width: int, fill: float = 0.0) -> np.ndarray:
+    out = np.full((len(rows), max(width, 1)), fill, dtype=np.float64)
+    for i, row in enumerate(rows):
+        out[i, :len(row)] = row
+    return out
+
+
+def _norm(setting: Dict, key: str) -> List[float]:
+    n = setting.get("Normalization", {}).get(key, {})
+    return [float(n.get("Minimum", -10.0)), float(n.get("Default", 0.0)), float(n.get("Maximum", 10.0))]
+
+
+@dataclass
+class PhysicsBatch:
+    """PhysicsSettings 的扁平数组表示，S 个 setting，按最大粒子/输入/输出数补齐"""
+    labels: List[str]
+    params: List[str]
+    fps: float
+    vertex_count: np.ndarray  # (S,)
+    mobility: np.ndarray  # (S, V)
+    delay: np.ndarray
+    acceleration: np.ndarray
+    radius: np.ndarray
+    norm_position: np.ndarray  # (S, 3) 最小/默认/最大
+    norm_angle: np.ndarray
+    gravity: np.ndarray  # (S, 2)
+    wind: np.ndarray
+    in_param: np.ndarray  # (S, I) params 下标
+    in_type: np.ndarray
+    in_weight: np.ndarray
+    in_reflect: np.ndarray
+    in_mask: np.ndarray
+    out_param: np.ndarray  # (S, O)
+    out_vertex: np.ndarray
+    out_type: np.ndarray
+    out_scale: np.ndarray
+    out_weight: np.ndarray
+    out_reflect: np.ndarray
+    out_mask: np.ndarray
+
+    @classmethod
+    def from_physics(cls, physics: Sequence[Dict], fps: Optional[float] = None) -> "PhysicsBatch":
+        params: Dict[str, int] = {}
+        labels, verts, ins, outs, norms, forces = [], [], [], [], [], []
+        file_fps = None
+        for fi, data in enumerate(physics):
+            meta = data.get("Meta", {})
+            file_fps = file_fps or meta.get("Fps")
+            eff = meta.get("EffectiveForces", {})
+            g, w = eff.get("Gravity", {"X": 0, "Y": -1}), eff.get("Wind", {"X": 0, "Y": 0})
+            for si, setting in enumerate(data.get("PhysicsSettings", [])):
+                labels.append(f"{fi}:{setting.get('Id', f'PhysicsSetting{si + 1}')}")
+                verts.append([[float(v.get(k, 0.0)) for k in ("Mobility", "Delay", "Acceleration", "Radius")]
+                              for v in setting.get("Vertices", [])])
+                ins.append([(params.setdefault(i["Source"]["Id"], len(params)), IO_TYPES.get(i.get("Type"), 0),
+                             float(i.get("Weight", 0.0)), bool(i.get("Reflect", False)))
+                            for i in setting.get("Input", [])])
+                outs.append([(params.setdefault(o["Destination"]["Id"], len(params)), int(o.get("VertexIndex", 0)),
+                              IO_TYPES.get(o.get("Type"), 0), float(o.get("Scale", 1.0)), float(o.get("Weight", 0.0)),
+                              bool(o.get("Reflect", False)))
+                             for o in setting.get("Output", [])])
+                norms.append((_norm(setting, "Position"), _norm(setting, "Angle")))
+                forces.append(([float(g.get("X", 0)), float(g.get("Y", -1))], [float(w.get("X", 0)), float(w.get("Y", 0))]))
+        V = max((len(v) for v in verts), default=1)
+        I = max((len(i) for i in ins), default=1)
+        O = max((len(o) for o in outs), default=1)
+
+        def col(rows, j, width):
+            return _pad([[r[j] for r in row] for row in rows], width)
+
+        def mask(rows, width):
+            return _pad([[1.0] * len(row) for row in rows], width) > 0
+
+        return cls(
+            labels=labels, params=list(params), fps=float(fps or file_fps or DEFAULT_FPS),
+            vertex_count=np.array([len(v) for v in verts], dtype=np.int64),
+            mobility=col(verts, 0, V), delay=col(verts, 1, V), acceleration=col(verts, 2, V), radius=col(verts, 3, V),
+            norm_position=np.array([n[0] for n in norms]).reshape(-1, 3),
+            norm_angle=np.array([n[1] for n in norms]).reshape(-1, 3),
+            gravity=np.array([f[0] for f in forces]).reshape(-1, 2), wind=np.array([f[1] for f in forces]).reshape(-1, 2),
+            in_param=col(ins, 0, I).astype(np.int64), in_type=col(ins, 1, I).astype(np.int64),
+            in_weight=col(ins, 2, I), in_reflect=col(ins, 3, I) > 0, in_mask=mask(ins, I),
+            out_param=col(outs, 0, O).astype(np.int64), out_vertex=col(outs, 1, O).astype(np.int64),
+            out_type=col(outs, 2, O).astype(np.int64), out_scale=col(outs, 3, O), out_weight=col(outs, 4, O),
+            out_reflect=col(outs, 5, O) > 0, out_mask=mask(outs, O),
+        )
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def take(self, index: np.ndarray) -> "PhysicsBatch":
+        """按 setting 下标取子批次（可重复，用于展开扰动候选）"""
+        fields = {k: (v[index] if isinstance(v, np.ndarray) else v) for k, v in self.__dict__.items()}
+        fields["labels"] = [self.labels[i] for i in index]
+        return PhysicsBatch(**fields)
+
+
+def standard_traces(params: Sequence[str], fps: float, duration: float,
+                    ranges: Optional[Dict[str, Sequence[float]]] = None, amplitude: float = STIMULUS_AMPLITUDE) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """标准刺激（均为平滑运动）：前半段激励，后半段回到默认值静止，用于测稳定时间
+    - step：0.2s 缓动转到 amplitude 并保持，再 0.2s 缓动回到默认值
+    - sway：1Hz 摆动；shake：3Hz 快速摇动（半幅）
+    返回 (名称, 参数值 (C, T, P), 激励结束帧 (C,))"""
+    T = max(int(round(duration * fps)), 4)
+    t = np.arange(T) / fps
+    half = duration / 2
+    active = t < half
+    ramp = np.clip(np.minimum(t, half - t) / 0.2, 0.0, 1.0)
+    x = amplitude * np.stack([
+        0.5 - 0.5 * np.cos(np.pi * ramp),
+        np.sin(2 * np.pi * t) * active,
+        0.5 * np.sin(2 * np.pi * 3 * t) * active,
+    ])
+    rng = np.array([param_range(p, ranges) for p in params]).reshape(-1, 3)
+    lo, default, hi = rng[:, 0], rng[:, 1], rng[:, 2]
+    xs = x[:, :, None]
+    values = default + np.where(xs >= 0, xs * (hi - default), xs * (default - lo))
+    return list(STIMULI), values, np.full(len(STIMULI), int(np.ceil(half * fps)))
+
+
+def load_traces(path: Path, params: Sequence[str], fps: float,
+                ranges: Optional[Dict[str, Sequence[float]]] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """自定义轨迹 JSON：{"名称": {"ParamAngleX": [逐帧参数值, ...]}}（帧率与模拟一致），未给出的参数保持默认值"""
+    spec = json.loads(path.read_text(encoding="utf-8"))
+    T = max(len(v) for tr in spec.values() for v in tr.values())
+    default = np.array([param_range(p, ranges)[1] for p in params])
+    values = np.tile(default, (len(spec), T, 1))
+    for c, tr in enumerate(spec.values()):
+        for pid, seq in tr.items():
+            if pid in params:
+                seq = np.asarray(seq, dtype=np.float64)
+                values[c, :len(seq), params.index(pid)] = seq
+                values[c, len(seq):, params.index(pid)] = seq[-1]
+    changed = np.abs(values - values[:, -1:]).max(axis=2) > 0
+    release = np.where(changed.any(axis=1), T - np.argmax(changed[:, ::-1], axis=1), 0)
+    return list(spec), values, release
+
+
+def _direction_to_radian(fx, fy, tx, ty):
+    r = np.arctan2(ty, tx) - np.arctan2(fy, fx)
+    return (r + np.pi) % (2 * np.pi) - np.pi
+
+
+def simulate(batch: PhysicsBatch, traces: np.ndarray,
+             ranges: Optional[Dict[str, Sequence[float]]] = None) -> Dict[str, np.ndarray]:
+    """traces: (C, T, P) 参数值 -> {"value": (T, C, S, O) 输出参数值, "raw": 截断前的值, "finite": (C, S)}"""
+    C, T, _ = traces.shape
+    S, V = batch.mobility.shape
+    R = C * S
+    dt = 1.0 / batch.fps
+    rng = np.array([param_range(p, ranges) for p in batch.params]).reshape(-1, 3)
+
+    # 输入归一化（NormalizeParameterValue：以参数量程中点为界，两侧分别线性映射到 Normalization）
+    pmin = np.minimum(rng[batch.in_param, 0], rng[batch.in_param, 2])
+    pmax = np.maximum(rng[batch.in_param, 0], rng[batch.in_param, 2])
+    pmid = (pmin + pmax) / 2
+    is_angle = batch.in_type == IO_TYPES["Angle"]
+    norm = np.where(is_angle[..., None], batch.norm_angle[:, None], batch.norm_position[:, None])
+    nmin, nmid, nmax = np.minimum(norm[..., 0], norm[..., 2]), norm[..., 1], np.maximum(norm[..., 0], norm[..., 2])
+    v = np.clip(traces[:, :, batch.in_param], pmin, pmax) - pmid  # (C, T, S, I)
+    up = np.divide(nmax - nmid, pmax - pmid, out=np.zeros_like(pmid), where=pmax != pmid)
+    down = np.divide(nmin - nmid, pmin - pmid, out=np.zeros_like(pmid), where=pmin != pmid)
+    res = nmid + np.where(v > 0, v * up, 0.0) + np.where(v < 0, v * down, 0.0)
+    res = np.where(batch.in_reflect, res, -res) * (batch.in_weight / MAXIMUM_WEIGHT) * batch.in_mask
+    tx = (res * (batch.in_type == IO_TYPES["X"])).sum(axis=3)
+    ty = (res * (batch.in_type == IO_TYPES["Y"])).sum(axis=3)
+    angle = (res * is_angle).sum(axis=3)
+    # 与 SDK 一致：旋转时 Y 分量使用已更新的 X
+    ra = np.deg2rad(-angle)
+    tx = tx * np.cos(ra) - ty * np.sin(ra)
+    ty = tx * np.sin(ra) + ty * np.cos(ra)
+    tx, ty, angle = (a.transpose(1, 0, 2).reshape(T, R) for a in (tx, ty, angle))
+
+    def tile(a):
+        return np.tile(a, (C,) + (1,) * (a.ndim - 1))
+
+    mobility, delay, accel, radius = (tile(a) for a in (batch.mobility, batch.delay, batch.acceleration, batch.radius))
+    present = np.arange(V) < tile(batch.vertex_count)[:, None]
+    wind = tile(batch.wind)
+    threshold = MOVEMENT_THRESHOLD * tile(batch.norm_position[:, 2])
+    step_delay = delay * dt * 30.0
+    pos = np.zeros((R, V, 2))
+    pos[:, 1:, 1] = np.cumsum(radius[:, 1:] * present[:, 1:], axis=1)
+    vel = np.zeros((R, V, 2))
+    last_gx, last_gy = np.zeros(R), np.ones(R)
+    hist = np.empty((T, R, V, 2))
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        for k in range(T):
+            pos[:, 0, 0], pos[:, 0, 1] = tx[k], ty[k]
+            rad = np.deg2rad(angle[k])
+            gx, gy = np.sin(rad), np.cos(rad)
+            rot = _direction_to_radian(last_gx, last_gy, gx, gy) / AIR_RESISTANCE
+            cr, sr = np.cos(rot), np.sin(rot)
+            for i in range(1, V):
+                d = step_delay[:, i]
+                last = pos[:, i].copy()
+                dx = pos[:, i, 0] - pos[:, i - 1, 0]
+                dy = pos[:, i, 1] - pos[:, i - 1, 1]
+                dx = cr * dx - dy * sr
+                dy = sr * dx + dy * cr
+                px = pos[:, i - 1, 0] + dx + vel[:, i, 0] * d + (gx * accel[:, i] + wind[:, 0]) * d * d
+                py = pos[:, i - 1, 1] + dy + vel[:, i, 1] * d + (gy * accel[:, i] + wind[:, 1]) * d * d
+                nx, ny = px - pos[:, i - 1, 0], py - pos[:, i - 1, 1]
+                length = np.sqrt(nx * nx + ny * ny)
+                px = pos[:, i - 1, 0] + nx / length * radius[:, i]
+                py = pos[:, i - 1, 1] + ny / length * radius[:, i]
+                px = np.where(np.abs(px) < threshold, 0.0, px)
+                live = present[:, i]
+                moved = live & (d != 0)
+                vel[:, i, 0] = np.where(moved, (px - last[:, 0]) / np.where(d != 0, d, 1.0) * mobility[:, i], vel[:, i, 0])
+                vel[:, i, 1] = np.where(moved, (py - last[:, 1]) / np.where(d != 0, d, 1.0) * mobility[:, i], vel[:, i, 1])
+                pos[:, i, 0] = np.where(live, px, last[:, 0])
+                pos[:, i, 1] = np.where(live, py, last[:, 1])
+            last_gx, last_gy = gx, gy
+            hist[k] = pos
+
+        # 输出：VertexIndex 与前一粒子的相对位移；Angle 相对父段方向（首段相对重力反方向）
+        vi = np.clip(tile(batch.out_vertex), 1, V - 1)
+        valid = tile(batch.out_mask) & (tile(batch.out_vertex) >= 1) & (tile(batch.out_vertex) < tile(batch.vertex_count)[:, None])
+
+        def gather(idx):
+            return np.take_along_axis(hist, idx[None, :, :, None], axis=2)  # (T, R, O, 2)
+
+        cur, prev, prev2 = gather(vi), gather(vi - 1), gather(np.maximum(vi - 2, 0))
+        trans = cur - prev
+        gravity = tile(batch.gravity)
+        parent = np.where((vi >= 2)[None, :, :, None], prev - prev2, -gravity[None, :, None, :])
+        ang = _direction_to_radian(parent[..., 0], parent[..., 1], trans[..., 0], trans[..., 1])
+        otype = tile(batch.out_type)
+        raw = np.where(otype == IO_TYPES["X"], trans[..., 0], np.where(otype == IO_TYPES["Y"], trans[..., 1], ang))
+        raw = np.where(tile(batch.out_reflect), -raw, raw) * tile(batch.out_scale)
+        orng = rng[tile(batch.out_param)]
+        olo, odefault, ohi = orng[..., 0], orng[..., 1], orng[..., 2]
+        weight = np.minimum(tile(batch.out_weight) / MAXIMUM_WEIGHT, 1.0)
+        value = odefault * (1 - weight) + np.clip(raw, olo, ohi) * weight
+        value = np.where(valid, value, odefault)
+        raw = np.where(valid, raw, odefault)
+        finite = np.isfinite(hist).all(axis=(0, 2, 3)) & np.isfinite(value).all(axis=(0, 2))
+    O = value.shape[-1]
+    return {"value": value.reshape(T, C, S, O), "raw": raw.reshape(T, C, S, O),
+            "finite": finite.reshape(C, S), "valid": valid[:S]}
+
+
+def stability_metrics(batch: PhysicsBatch, sim: Dict[str, np.ndarray], release: np.ndarray, cfg: SimConfig,
+                      ranges: Optional[Dict[str, Sequence[float]]] = None) -> Dict[str, np.ndarray]:
+    """每个 setting（取所有轨迹与输出中的最差值）的稳定性指标，均为 (S,) 数组"""
+    value, raw, valid = sim["value"], sim["raw"], sim["valid"]
+    T = value.shape[0]
+    rng = np.array([param_range(p, ranges) for p in batch.params]).reshape(-1, 3)[batch.out_param]
+    half = np.maximum((rng[..., 2] - rng[..., 0]) / 2, 1e-9)
+    with np.errstate(invalid="ignore", over="ignore"):
+        y = (value - rng[..., 1]) / half  # (T, C, S, O)
+        amplitude = np.abs(y).max(axis=0)
+        saturation = ((raw < rng[..., 0]) | (raw > rng[..., 2])).mean(axis=0)
+        # 抖动：逐帧方向反转的能量（相邻两帧增量异号时取较小增量的平方），平滑摆动只在波峰处有极小贡献
+        dy = np.diff(y, axis=0)
+        flip = dy[1:] * dy[:-1] < 0
+        jitter = (np.where(flip, np.minimum(np.abs(dy[1:]), np.abs(dy[:-1])), 0.0) ** 2).mean(axis=0) if T > 2 \
+            else np.zeros_like(amplitude)
+        # 稳定时间：激励结束后最后一次偏离末尾 0.25s 均值超过 settle_eps 的时刻；偏离持续到末尾视为未稳定
+        guard = max(int(round(0.25 * batch.fps)), 2)
+        dev = np.abs(y - y[-guard:].mean(axis=0)) > cfg.settle_eps
+    frames = np.arange(T)[:, None, None, None]
+    after = frames >= release[None, :, None, None]
+    last = np.where(dev & after, frames, -1).max(axis=0)
+    settle = np.maximum(last + 1 - release[:, None, None], 0) / batch.fps
+    settle = np.where(last >= T - guard, np.inf, settle)
+    finite = sim["finite"]
+
+    def worst(a):
+        a = np.where(valid[None] & finite[..., None], a, 0.0)
+        return a.max(axis=(0, 2))
+
+    metrics = {
+        "finite": finite.all(axis=0),
+        "amplitude": worst(amplitude),
+        "saturation": worst(saturation),
+        "settle_time": worst(settle),
+        "jitter": worst(jitter),
+    }
+    metrics["stable"] = (metrics["finite"] & (metrics["settle_time"] <= cfg.settle_limit)
+                         & (metrics["jitter"] <= cfg.jitter_limit) & (metrics["saturation"] <= cfg.saturation_limit))
+    return metrics
+
+
+def evaluate(batch: PhysicsBatch, cfg: Optional[SimConfig] = None, ranges: Optional[Dict[str, Sequence[float]]] = None,
+             traces: Optional[Path] = None) -> Dict[str, np.ndarray]:
+    """整批 setting 一次模拟并计算指标"""
+    cfg = cfg or SimConfig()
+    if traces is not None:
+        _, values, release = load_traces(traces, batch.params, batch.fps, ranges)
+    else:
+        _, values, release = standard_traces(batch.params, batch.fps, cfg.duration, ranges)
+    return stability_metrics(batch, simulate(batch, values, ranges), release, cfg, ranges)
+
+
+def physics_report(batch: PhysicsBatch, metrics: Dict[str, np.ndarray], cfg: SimConfig) -> List[Dict]:
+    report = []
+    for s, label in enumerate(batch.labels):
+        reasons = []
+        if not metrics["finite"][s]:
+            reasons.append("数值发散")
+        else:
+            if metrics["settle_time"][s] > cfg.settle_limit:
+                reasons.append(f"停止后 {cfg.settle_limit}s 内未稳定")
+            if metrics["jitter"][s] > cfg.jitter_limit:
+                reasons.append("抖动能量过高")
+            if metrics["saturation"][s] > cfg.saturation_limit:
+                reasons.append("输出长时间越界饱和")
+        report.append({
+            "setting": label,
+            "stable": bool(metrics["stable"][s]),
+            "amplitude": round(float(metrics["amplitude"][s]), 4),
+            "saturation": round(float(metrics["saturation"][s]), 4),
+            "settle_time": None if not np.isfinite(metrics["settle_time"][s]) else round(float(metrics["settle_time"][s]), 3),
+            "jitter": float(f"{metrics['jitter'][s]:.3g}"),
+            "reasons": reasons,
+        })
+    return report
+
+
+def check_physics(physics: Sequence[Dict], cfg: Optional[SimConfig] = None,
+                  ranges: Optional[Dict[str, Sequence[float]]] = None, traces: Optional[Path] = None) -> List[Dict]:
+    """physics3 字典列表 -> 每个 setting 的稳定性报告"""
+    cfg = cfg or SimConfig()
+    batch = PhysicsBatch.from_physics(physics, cfg.fps)
+    if not len(batch):
+        return []
+    return physics_report(batch, evaluate(batch, cfg, ranges, traces), cfg)
+
+
+def load_ranges(path: Optional[str]) -> Optional[Dict[str, Sequence[float]]]:
+    """参数量程 JSON：{"ParamHairFront": [最小, 默认, 最大]}"""
+    return json.loads(Path(path).read_text(encoding="utf-8")) if path else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="physics3.json 向量化模拟与稳定性评估")
+    ap.add_argument("physics", nargs="+", help="physics3.json 文件")
+    ap.add_argument("--fps", type=float, default=None, help="模拟帧率（默认取 Meta.Fps，缺省 30）")
+    ap.add_argument("--duration", type=float, default=SimConfig.duration, help="标准刺激时长（秒，后半段静止）")
+    ap.add_argument("--traces", default=None, help="自定义输入轨迹 JSON（替代标准刺激）")
+    ap.add_argument("--param-ranges", default=None, help="参数量程 JSON：{Id: [最小, 默认, 最大]}")
+    ap.add_argument("--settle-limit", type=float, default=SimConfig.settle_limit, help="允许的稳定时间（秒）")
+    ap.add_argument("--jitter-limit", type=float, default=SimConfig.jitter_limit, help="允许的抖动能量")
+    ap.add_argument("--saturation-limit", type=float, default=SimConfig.saturation_limit, help="允许的饱和帧比例")
+    args = ap.parse_args()
+
+    cfg = SimConfig(args.fps, args.duration, SimConfig.settle_eps, args.settle_limit, args.jitter_limit,
+                    args.saturation_limit)
+    paths = [Path(p) for p in args.physics]
+    t0 = time.perf_counter()
+    physics = [json.loads(p.read_text(encoding="utf-8")) for p in paths]
+    report = check_physics(physics, cfg, load_ranges(args.param_ranges), Path(args.traces) if args.traces else None)
+    for item in report:
+        fi, sid = item["setting"].split(":", 1)
+        item["setting"] = f"{paths[int(fi)].name}:{sid}"
+    print(json.dumps({
+        "files": len(paths),
+        "settings": len(report),
+        "unstable": sum(not r["stable"] for r in report),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "report": report,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+批量程序化动作合成：
+- 输入一组 MotionSpec（类型 idle/nod/blink、时长、fps、幅度、种子、目标参数 Id、噪声强度、是否循环）
+- 同类型的动作在 [动作 x 参数 x 帧] 网格上一次性用 NumPy 计算（不足的帧/参数以掩码填充）：
+  idle = 基值 + 幅度 x (正弦 + 平滑噪声)；nod = 点头关键帧廓形（余弦插值）；blink = 闭眼脉冲（快速闭合、缓慢睁开）取最大值
+- 平滑噪声为若干整数周期谐波之和（相位/幅度由每个动作的 seed 决定），首尾相接，循环动作无跳变
+- 所有曲线经 compile_motion_curves 拟合为少量贝塞尔/线性段，一次调用写出全部 motion3.json
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import time
+
+import numpy as np
+
+from compile_motion_curves import CurveFitConfig, curves_from_samples, dump_motion, update_meta
+
+MOTION_TYPES = ("idle", "nod", "blink")
+DEFAULT_PARAMS = {
+    "idle": ["ParamAngleX", "ParamAngleY", "ParamAngleZ", "ParamEyeLOpen", "ParamEyeROpen"],
+    "nod": ["ParamAngleX", "ParamAngleY", "ParamAngleZ"],
+    "blink": ["ParamEyeLOpen", "ParamEyeROpen"],
+}
+# 参数 Id -> (基值, idle 摆幅, 点头幅度, 取值下限, 取值上限)；未知参数按 (0, 1, 1, -inf, inf)
+PARAM_PROFILES = {
+    "ParamAngleX": (0.0, 5.0, 10.0, -30.0, 30.0),
+    "ParamAngleY": (0.0, 3.0, 10.0, -30.0, 30.0),
+    "ParamAngleZ": (0.0, 2.0, 10.0, -30.0, 30.0),
+    "ParamBodyAngleX": (0.0, 2.0, 3.0, -10.0, 10.0),
+    "ParamBreath": (0.5, 0.5, 0.0, 0.0, 1.0),
+    "ParamEyeLOpen": (0.95, 0.05, 0.0, 0.0, 1.0),
+    "ParamEyeROpen": (0.95, 0.05, 0.0, 0.0, 1.0),
+}
+UNKNOWN_PROFILE = (0.0, 1.0, 1.0, -np.inf, np.inf)
+BLINK_PARAMS = ("ParamEyeLOpen", "ParamEyeROpen")
+# 点头廓形：归一化时间 -> 相对幅度
+NOD_KEYS = (np.array([0.0, 0.25, 0.5, 0.75, 1.0]), np.array([0.0, -1.0, 0.0, 0.6, 0.0]))
+NOISE_HARMONICS = 4
+BLINK_INTERVAL = 1.0
+BLINK_CLOSE = 0.05
+BLINK_OPEN = 0.1
+BLINK_DEPTH = 0.8
+
+
+@dataclass
+class MotionSpec:
+    type: str
+    duration: float = 2.0
+    fps: float = 30.0
+    amplitude: float = 1.0
+    seed: int = 0
+    params: Optional[List[str]] = None
+    noise: float = 0.2
+    loop: bool = False
+    name: Optional[str] = None
+
+    def param_ids(self) -> List[str]:
+        return list(self.params or DEFAULT_PARAMS[self.type])
+
+
+@dataclass
+class MotionGrid:
+    """同类型一批动作的采样网格：values (M, P, F)，times (M, F)，frames (M,)，params 为各动作的参数 Id"""
+    specs: List[MotionSpec]
+    params: List[List[str]]
+    times: np.ndarray
+    frames: np.ndarray
+    values: np.ndarray = field(repr=False)
+
+
+def _profiles(params: List[List[str]], width: int) -> np.ndarray:
+    """(M, P, 5) 参数廓形表，空位取未知廓形"""
+    out = np.tile(np.array(UNKNOWN_PROFILE), (len(params), width, 1))
+    for m, ids in enumerate(params):
+        for p, pid in enumerate(ids):
+            out[m, p] = PARAM_PROFILES.get(pid, UNKNOWN_PROFILE)
+    return out
+
+
+def smooth_noise(rngs: Sequence[np.random.Generator], width: int, phase: np.ndarray) -> np.ndarray:
+    """(M, P, F) 平滑噪声：整数周期谐波之和（幅度 ~ 1/k，归一化到单位峰值量级），phase 为 (M, F) 归一化时间"""
+    k = np.arange(1, NOISE_HARMONICS + 1)
+    amp = np.stack([r.uniform(0.5, 1.0, (width, NOISE_HARMONICS)) for r in rngs]) / k
+    amp /= amp.sum(axis=2, keepdims=True)
+    shift = np.stack([r.uniform(0, 2 * np.pi, (width, NOISE_HARMONICS)) for r in rngs])
+    # (M, P, K, F) 在谐波维求和
+    arg = 2 * np.pi * k[None, None, :, None] * phase[:, None, None, :] + shift[..., None]
+    return np.einsum("mpk,mpkf->mpf", amp, np.sin(arg))
+
+
+def build_grid(specs: Sequence[MotionSpec]) -> MotionGrid:
+    """同类型 specs -> 采样网格（values 尚未填充）"""
+    params = [s.param_ids() for s in specs]
+    frames = np.array([int(round(s.duration * s.fps)) + 1 for s in specs])
+    fps = np.array([s.fps for s in specs], dtype=np.float64)
+    dur = np.array([s.duration for s in specs], dtype=np.float64)
+    f = np.arange(frames.max(), dtype=np.float64)
+    times = np.minimum(f[None, :] / fps[:, None], dur[:, None])
+    width = max(len(p) for p in params)
+    return MotionGrid(list(specs), params, times, frames, np.zeros((len(specs), width, len(f))))
+
+
+def synthesize_grid(specs: Sequence[MotionSpec]) -> MotionGrid:
+    """计算一批同类型动作的全部曲线"""
+    kind = specs[0].type
+    grid = build_grid(specs)
+    m, width, _ = grid.values.shape
+    prof = _profiles(grid.params, width)
+    base, idle_amp, nod_amp, lo, hi = (prof[..., i, None] for i in range(5))
+    amplitude = np.array([s.amplitude for s in specs])[:, None, None]
+    noise_scale = np.array([s.noise for s in specs])[:, None, None]
+    dur = np.array([s.duration for s in specs])[:, None]
+    phase = grid.times / dur
+    rngs = [np.random.default_rng(s.seed) for s in specs]
+    noise = smooth_noise(rngs, width, phase)
+    if kind == "idle":
+        start = np.stack([r.uniform(0, 2 * np.pi, width) for r in rngs])[..., None]
+        wave = np.sin(2 * np.pi * phase[:, None, :] + start)
+        values = base + idle_amp * amplitude * (wave + noise_scale * noise)
+    elif kind == "nod":
+        # 关键帧间余弦缓动：按所在区间做 smoothstep 重映射
+        seg = np.clip(np.searchsorted(NOD_KEYS[0], phase, side="right") - 1, 0, len(NOD_KEYS[0]) - 2)
+        x0, x1 = NOD_KEYS[0][seg], NOD_KEYS[0][seg + 1]
+        y0, y1 = NOD_KEYS[1][seg], NOD_KEYS[1][seg + 1]
+        u = (phase - x0) / (x1 - x0)
+        shape = y0 + (y1 - y0) * (0.5 - 0.5 * np.cos(np.pi * u))
+        envelope = np.sin(np.pi * phase)[:, None, :]
+        values = base + nod_amp * amplitude * (shape[:, None, :] + noise_scale * envelope * noise)
+    elif kind == "blink":
+        count = np.maximum(1, np.round(dur[:, 0] / BLINK_INTERVAL).astype(int))
+        centers = np.full((m, count.max()), np.inf)
+        for i, (r, n) in enumerate(zip(rngs, count)):
+            slot = specs[i].duration / n
+            centers[i, :n] = (np.arange(n) + 0.25 + r.uniform(-0.15, 0.15, n)) * slot
+        d = grid.times[:, None, :] - centers[:, :, None]
+        pulse = np.where(d < 0, 1 + d / BLINK_CLOSE, 1 - d / BLINK_OPEN)
+        pulse = np.clip(pulse, 0.0, 1.0).max(axis=1)
+        is_eye = np.array([[pid in BLINK_PARAMS for pid in ids] + [False] * (width - len(ids))
+                           for ids in grid.params])[..., None]
+        closed = np.minimum(BLINK_DEPTH * amplitude, 1.0) * pulse[:, None, :]
+        values = np.where(is_eye, 1.0 - closed, base)
+    else:
+        raise ValueError(f"未知动作类型: {kind}")
+    grid.values = np.clip(values, lo, hi)
+    return grid
+
+
+def motions_from_grid(grid: MotionGrid, fit: Optional[CurveFitConfig] = None) -> List[Dict]:
+    """网格 -> motion3 字典列表（整批曲线一次拟合编译）"""
+    samples = []
+    for m, ids in enumerate(grid.params):
+        n = int(grid.frames[m])
+        samples.extend(("Parameter", pid, grid.times[m, :n], grid.values[m, p, :n]) for p, pid in enumerate(ids))
+    fitted = iter(curves_from_samples(samples, fit))
+    out = []
+    for m, spec in enumerate(grid.specs):
+        curves = [next(fitted) for _ in grid.params[m]]
+        out.append(update_meta({
+            "Version": 3,
+            "Meta": {"Duration": float(spec.duration), "Fps": float(spec.fps), "Loop": bool(spec.loop),
+                     "AreBeziersRestricted": True, "UserDataCount": 0, "TotalUserDataSize": 0},
+            "Curves": curves,
+        }))
+    return out
+
+
+def synthesize(specs: Sequence[MotionSpec], fit: Optional[CurveFitConfig] = None) -> List[Dict]:
+    """按类型分组批量计算，返回与 specs 同序的 motion3 字典"""
+    out: List[Optional[Dict]] = [None] * len(specs)
+    for kind in MOTION_TYPES:
+        idx = [i for i, s in enumerate(specs) if s.type == kind]
+        if idx:
+            for i, motion in zip(idx, motions_from_grid(synthesize_grid([specs[i] for i in idx]), fit)):
+                out[i] = motion
+    unknown = [s.type for s, m in zip(specs, out) if m is None]
+    if unknown:
+        raise ValueError(f"未知动作类型: {sorted(set(unknown))}")
+    return out
+
+
+def write_motions(specs: Sequence[MotionSpec], out_dir: Path, fit: Optional[CurveFitConfig] = None,
+                  indent: Optional[int] = None, prefix: str = "") -> List[Dict[str, str]]:
+    """合成并写出 <out_dir>/<name>.motion3.json，返回 [{"File", "Name"}]（File 相对 out_dir，前加 prefix）"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    items = []
+    for i, (spec, motion) in enumerate(zip(specs, synthesize(specs, fit))):
+        name = spec.name or f"{spec.type}_{i:05d}"
+        (out_dir / f"{name}.motion3.json").write_text(dump_motion(motion, indent), encoding="utf-8")
+        items.append({"File": f"{prefix}{name}.motion3.json", "Name": name})
+    return items
+
+
+def random_specs(count: int, types: Sequence[str], duration: Tuple[float, float], fps: float = 30.0,
+                 seed: int = 0) -> List[MotionSpec]:
+    """随机变体：类型轮换，时长/幅度均匀抽样，每个动作一个独立种子"""
+    rng = np.random.default_rng(seed)
+    specs = []
+    for i in range(count):
+        kind = types[i % len(types)]
+        specs.append(MotionSpec(kind, round(float(rng.uniform(*duration)), 3), fps,
+                                round(float(rng.uniform(0.6, 1.4)), 3), seed * 1_000_003 + i,
+                                loop=kind != "nod", name=f"{kind}_{i:05d}"))
+    return specs
+
+
+def load_specs(path: Path) -> List[MotionSpec]:
+    """JSON 列表：[{"type": "idle", "duration": 3, "amplitude": 1.2, "seed": 7, "params": [...]}, ...]"""
+    return [MotionSpec(**d) for d in json.loads(path.read_text(encoding="utf-8"))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="批量程序化动作合成（NumPy 网格 + 曲线编译）")
+    ap.add_argument("out_dir", help="输出目录")
+    ap.add_argument("--specs", default=None, help="MotionSpec JSON 列表；不指定时按 --count 随机生成")
+    ap.add_argument("--count", type=int, default=100)
+    ap.add_argument("--types", default="idle,blink", help="随机生成的类型（逗号分隔）")
+    ap.add_argument("--duration", type=float, nargs=2, default=(2.0, 6.0), metavar=("MIN", "MAX"))
+    ap.add_argument("--fps", type=float, default=30.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tolerance", type=float, default=CurveFitConfig.tolerance)
+    ap.add_argument("--rel-tolerance", type=float, default=CurveFitConfig.rel_tolerance)
+    ap.add_argument("--indent", type=int, default=None, help="JSON 缩进（默认紧凑）")
+    args = ap.parse_args()
+
+    if args.specs:
+        specs = load_specs(Path(args.specs))
+    else:
+        types = [t for t in args.types.split(",") if t]
+        specs = random_specs(args.count, types, tuple(args.duration), args.fps, args.seed)
+    fit = CurveFitConfig(args.tolerance, args.rel_tolerance, args.fps)
+    t0 = time.perf_counter()
+    items = write_motions(specs, Path(args.out_dir), fit, args.indent)
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({"motions": len(items), "seconds": round(elapsed, 3),
+                      "motions_per_second": round(len(items) / elapsed, 1) if elapsed > 0 else None},
+                     ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ import logging
 from PIL import Image
 import jsonschema
 
+from simulate_physics import check_physics
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -219,6 +221,28 @@ def validate_expression_files(expressions: List[Dict], base_path: Path) -> Tuple
     
     return file_checks, errors
 
+def validate_physics_file(physics_file: str, base_path: Path) -> Tuple[List[str], List[str]]:
+    """用标准刺激模拟physics3.json：数值发散记为错误，不稳定的setting记为警告"""
+    errors = []
+    warnings = []
+    try:
+        with open(base_path / physics_file, 'r', encoding='utf-8') as f:
+            physics_data = json.load(f)
+        report = check_physics([physics_data])
+    except Exception as e:
+        return [], [f"无法模拟物理文件 {physics_file}: {str(e)}"]
+    
+    for item in report:
+        setting_id = item['setting'].split(':', 1)[1]
+        if not item['stable']:
+            message = f"{physics_file}:{setting_id}（{'，'.join(item['reasons'])}）"
+            if '数值发散' in item['reasons']:
+                errors.append(f"物理模拟发散 {message}")
+            else:
+                warnings.append(f"物理设置不稳定 {message}")
+    
+    return errors, warnings
+
 def validate_parameter_consistency(model_data: Dict, base_path: Path) -> Tuple[Dict[str, Any], List[str], List[str]]:
     """验证参数一致性"""
     param_checks = {}
@@ -283,7 +307,7 @@ def validate_single_model(model_path: Path) -> ValidationResult:
     parameter_checks = {}
     
     # 查找model3.json文件
-    model3_files = list(model_path.glob("*.model3.json"))
+    model3_files = [p for p in model_path.glob("*.model3.json") if ".preview_" not in p.name]
     if not model3_files:
         return ValidationResult(
             model_id=model_id,
@@ -336,6 +360,10 @@ def validate_single_model(model_path: Path) -> ValidationResult:
             file_checks[physics_file] = physics_exists
             if not physics_exists:
                 errors.append(f"物理文件不存在: {physics_file}")
+            else:
+                physics_errors, physics_warnings = validate_physics_file(physics_file, model_path)
+                errors.extend(physics_errors)
+                warnings.extend(physics_warnings)
         
         # 验证姿势文件
         pose_file = file_refs.get('Pose')
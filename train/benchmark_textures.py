@@ -0,0 +1,288 @@
+"""
+纹理后端基准测试：
+- jitter：对比 PIL ImageEnhance 路径与 NumPy 融合路径的耗时，并检查输出在容差内等价
+- tiles：在独立子进程中测量整图路径与分块流式路径的峰值 RSS（不同图集尺寸下）
+- occupancy：alpha 占用分析得到的处理矩形数量与面积占比（即 img2img 计算量相对整图的比例）
+- recolor：LUT 编译/缓存加载/逐像素查表耗时，并与直接逐像素求值风格运算的结果对比
+- dedup：N 个生成模型（整图抖动 / 局部重绘混合）在分块去重存储与普通 PNG 下的存储字节对比
+默认使用合成图集（半透明背景 + 若干不透明色块），也可用 --src 指定真实纹理。
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import json
+import multiprocessing as mp
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from infer_texture_model import jitter_texture, jitter_texture_numpy, jitter_texture_tiled
+from texture_tiles import TileConfig
+from texture_occupancy import OccupancyConfig, occupied_rects, rects_fraction
+from texture_lut import apply_lut, apply_style, get_lut, load_style
+from texture_ops import apply_color_matrix, jitter_matrix, save_rgba_png
+from texture_store import TileStore, manifest_path
+
+
+def make_synthetic_atlas(size: int, seed: int = 0, coverage: int = 40) -> Image.Image:
+    """合成 Live2D 风格图集：透明背景上分布若干渐变色块"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[..., 0] = (255 * xx).astype(np.uint8)
+    rgba[..., 1] = (255 * yy).astype(np.uint8)
+    rgba[..., 2] = (255 * (1 - xx) * yy).astype(np.uint8)
+    mask = Image.new("L", (size, size), 0)
+    draw = ImageDraw.Draw(mask)
+    for _ in range(coverage):
+        cx, cy = rng.integers(0, size, 2)
+        rx, ry = rng.integers(size // 40, size // 8, 2)
+        draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=int(rng.integers(128, 256)))
+    rgba[..., 3] = np.asarray(mask)
+    return Image.fromarray(rgba, "RGBA")
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_jitter(sizes: List[int], src: Optional[Path], repeat: int, compress_level: int,
+                 sat: float = 1.1, bright: float = 1.05) -> List[Dict]:
+    rows: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = Path(tmp)
+        inputs = [(f"{src.name}", src)] if src else []
+        for size in ([] if src else sizes):
+            p = tmpdir / f"atlas_{size}.png"
+            make_synthetic_atlas(size).save(p, "PNG")
+            inputs.append((f"{size}x{size}", p))
+        for label, p in inputs:
+            out_pil = tmpdir / f"{p.stem}_pil.png"
+            out_np = tmpdir / f"{p.stem}_np.png"
+            t_pil = _timed(lambda: jitter_texture(p, out_pil, sat=sat, bright=bright), repeat)
+            t_np = _timed(lambda: jitter_texture_numpy(p, out_np, sat=sat, bright=bright, compress_level=compress_level), repeat)
+            ref = np.asarray(Image.open(out_pil).convert("RGBA")).astype(np.int16)
+            got = np.asarray(Image.open(out_np).convert("RGBA")).astype(np.int16)
+            src_alpha = np.asarray(Image.open(p).convert("RGBA"))[..., 3]
+            opaque = src_alpha != 0
+            diff = np.abs(ref[..., :3] - got[..., :3])[opaque]
+            rows.append({
+                "input": label,
+                "pil_seconds": t_pil,
+                "numpy_seconds": t_np,
+                "speedup": t_pil / t_np if t_np > 0 else 0.0,
+                "max_abs_diff": int(diff.max()) if diff.size else 0,
+                "mean_abs_diff": float(diff.mean()) if diff.size else 0.0,
+                "alpha_exact": bool((got[..., 3] == src_alpha).all()),
+                "numpy_png_bytes": out_np.stat().st_size,
+            })
+    return rows
+
+
+def _peak_rss_bytes() -> int:
+    """当前进程峰值 RSS：优先读取 /proc/self/status 的 VmHWM（exec 后重置，不继承父进程峰值）"""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _peak_rss_child(mode: str, src: str, dst: str, tile_size: int, budget: int, q) -> None:
+    t0 = time.perf_counter()
+    if mode == "tiled":
+        jitter_texture_tiled(Path(src), Path(dst), sat=1.1, bright=1.05,
+                             tile_cfg=TileConfig(tile_size=tile_size, memory_budget=budget))
+    elif mode == "numpy":
+        jitter_texture_numpy(Path(src), Path(dst), sat=1.1, bright=1.05)
+    else:
+        jitter_texture(Path(src), Path(dst), sat=1.1, bright=1.05)
+    q.put((_peak_rss_bytes(), time.perf_counter() - t0))
+
+
+def bench_tiles(sizes: List[int], tile_size: int, budget_mb: int) -> List[Dict]:
+    ctx = mp.get_context("spawn")
+    rows: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = Path(tmp)
+        q = ctx.Queue()
+        for size in sizes:
+            p = tmpdir / f"atlas_{size}.png"
+            make_synthetic_atlas(size).save(p, "PNG")
+            row: Dict = {"input": f"{size}x{size}"}
+            for mode in ("pil", "numpy", "tiled"):
+                proc = ctx.Process(target=_peak_rss_child,
+                                   args=(mode, str(p), str(tmpdir / f"out_{mode}.png"), tile_size, budget_mb << 20, q))
+                proc.start()
+                rss, secs = q.get()
+                proc.join()
+                row[f"{mode}_peak_rss_mb"] = round(rss / (1 << 20), 1)
+                row[f"{mode}_seconds"] = secs
+            rows.append(row)
+    return rows
+
+
+def bench_occupancy(sizes: List[int], srcs: List[Path], coverage: int, cfg: OccupancyConfig) -> List[Dict]:
+    inputs = [(p.name, np.asarray(Image.open(p).convert("RGBA"))[..., 3]) for p in srcs]
+    inputs += [(f"{s}x{s}", np.asarray(make_synthetic_atlas(s, coverage=coverage))[..., 3]) for s in ([] if srcs else sizes)]
+    rows: List[Dict] = []
+    for label, alpha in inputs:
+        t0 = time.perf_counter()
+        rects = occupied_rects(alpha, cfg)
+        rows.append({
+            "input": label,
+            "rects": len(rects),
+            "opaque_fraction": float((alpha != 0).mean()),
+            "processed_fraction": rects_fraction(rects, alpha.shape[1], alpha.shape[0]),
+            "analysis_seconds": time.perf_counter() - t0,
+        })
+    return rows
+
+
+def bench_recolor(sizes: List[int], styles: List[str], repeat: int) -> List[Dict]:
+    rows: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        atlases = {s: np.asarray(make_synthetic_atlas(s)) for s in sizes}
+        for name in styles:
+            spec = load_style(name)
+            t0 = time.perf_counter()
+            get_lut(spec, Path(tmp))
+            t_compile = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            lut = get_lut(spec, Path(tmp))
+            t_load = time.perf_counter() - t0
+            for size, atlas in atlases.items():
+                buf = atlas.copy()
+                t_apply = _timed(lambda: (np.copyto(buf, atlas), apply_lut(buf, lut)), repeat)
+                # 参考：直接对不透明像素逐个求值风格运算
+                opaque = atlas[..., 3] != 0
+                ref = apply_style(atlas[..., :3][opaque], spec).astype(np.int16)
+                diff = np.abs(buf[..., :3][opaque].astype(np.int16) - ref)
+                rows.append({
+                    "style": name,
+                    "input": f"{size}x{size}",
+                    "compile_seconds": t_compile,
+                    "cached_load_seconds": t_load,
+                    "apply_seconds": t_apply,
+                    "max_abs_diff": int(diff.max()) if diff.size else 0,
+                    "alpha_exact": bool((buf[..., 3] == atlas[..., 3]).all()),
+                    "transparent_exact": bool((buf[~opaque] == atlas[~opaque]).all()),
+                })
+    return rows
+
+
+def bench_dedup(count: int, size: int, tile_size: int, partial_fraction: float, coverage: int = 12, seed: int = 0) -> Dict:
+    """模板入库后依次生成 count 个模型纹理：partial 为只对以某个不透明像素为中心、边长 size/4 的区域做色彩变换（局部重绘），
+    其余整图抖动"""
+    rng = np.random.default_rng(seed)
+    template = np.asarray(make_synthetic_atlas(size, seed=seed, coverage=coverage))
+    ys, xs = np.nonzero(template[..., 3])
+    half = size // 8
+    totals = {"jitter": [0, 0, 0], "partial": [0, 0, 0]}  # 模型数, PNG 字节, 新增存储字节（对象 + 清单）
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmpdir = Path(tmp)
+        store = TileStore(tmpdir / "store", tile_size)
+        tpl = tmpdir / "template.png"
+        save_rgba_png(template, tpl)
+        template_bytes = store.ingest(tpl)["new_bytes"]
+        out = tmpdir / "texture_00.png"
+        for _ in range(count):
+            rgba = template.copy()
+            m = jitter_matrix(float(rng.uniform(0.9, 1.1)), float(rng.uniform(0.85, 1.15)), float(rng.uniform(-0.05, 0.05)))
+            kind = "partial" if rng.random() < partial_fraction else "jitter"
+            if kind == "partial":
+                i = int(rng.integers(len(ys)))
+                y0, x0 = max(0, int(ys[i]) - half), max(0, int(xs[i]) - half)
+                apply_color_matrix(rgba[y0:y0 + 2 * half, x0:x0 + 2 * half], m)
+            else:
+                apply_color_matrix(rgba, m)
+            save_rgba_png(rgba, out)
+            manifest = store.ingest(out)
+            manifest_bytes = len(json.dumps({k: manifest[k] for k in ("version", "width", "height", "tile", "tiles")},
+                                            separators=(",", ":")))
+            row = totals[kind]
+            row[0] += 1
+            row[1] += out.stat().st_size
+            row[2] += manifest["new_bytes"] + manifest_bytes
+        stats = store.stats()
+        # 抽查重建无损
+        probe = tmpdir / "probe.png"
+        store.restore(manifest, probe)
+        exact = bool((np.asarray(Image.open(probe)) == np.asarray(Image.open(out))).all())
+
+    png = sum(r[1] for r in totals.values())
+    stored = sum(r[2] for r in totals.values())
+    return {
+        "models": count,
+        "atlas": f"{size}x{size}",
+        "tile": tile_size,
+        "template_bytes_in_store": template_bytes,
+        "plain_png_bytes": png,
+        "tile_store_bytes": stored,
+        "store_objects": stats["objects"],
+        "saved_ratio": 1 - stored / png if png else 0.0,
+        "by_kind": {k: {"models": r[0], "plain_png_bytes": r[1], "tile_store_bytes": r[2],
+                        "saved_ratio": 1 - r[2] / r[1] if r[1] else 0.0} for k, r in totals.items()},
+        "restore_exact": exact,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    j = sub.add_parser("jitter", help="PIL vs NumPy 抖动后端")
+    j.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096])
+    j.add_argument("--src", help="使用真实纹理代替合成图集")
+    j.add_argument("--repeat", type=int, default=3)
+    j.add_argument("--png-compress-level", type=int, default=6)
+    t = sub.add_parser("tiles", help="整图 vs 分块流式的峰值 RSS")
+    t.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    t.add_argument("--tile-size", type=int, default=512)
+    t.add_argument("--memory-budget-mb", type=int, default=256)
+    o = sub.add_parser("occupancy", help="不透明区域矩形与处理面积占比")
+    o.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096])
+    o.add_argument("--src", nargs="*", default=[], help="真实纹理（可多个）")
+    o.add_argument("--coverage", type=int, default=12, help="合成图集的色块数量")
+    o.add_argument("--max-rects", type=int, default=8)
+    o.add_argument("--margin", type=int, default=16)
+    r = sub.add_parser("recolor", help="LUT 重着色：编译/加载/查表耗时与精度")
+    r.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096])
+    r.add_argument("--styles", nargs="+", default=["warm", "noir", "hue_shift_60"], help="预设名或风格 JSON 路径")
+    r.add_argument("--repeat", type=int, default=3)
+    d = sub.add_parser("dedup", help="分块去重存储 vs 普通 PNG 的存储字节")
+    d.add_argument("--count", type=int, default=1000, help="生成模型数")
+    d.add_argument("--size", type=int, default=1024)
+    d.add_argument("--tile-size", type=int, default=128)
+    d.add_argument("--partial-fraction", type=float, default=0.5, help="局部重绘模型的比例")
+    d.add_argument("--coverage", type=int, default=12, help="合成图集的色块数量")
+    args = ap.parse_args()
+
+    if args.cmd == "dedup":
+        print(json.dumps(bench_dedup(args.count, args.size, args.tile_size, args.partial_fraction, args.coverage), ensure_ascii=False, indent=2))
+    elif args.cmd == "recolor":
+        print(json.dumps(bench_recolor(args.sizes, args.styles, args.repeat), ensure_ascii=False, indent=2))
+    elif args.cmd == "occupancy":
+        cfg = OccupancyConfig(max_rects=args.max_rects, margin=args.margin)
+        print(json.dumps(bench_occupancy(args.sizes, [Path(p) for p in args.src], args.coverage, cfg), ensure_ascii=False, indent=2))
+    elif args.cmd == "tiles":
+        print(json.dumps(bench_tiles(args.sizes, args.tile_size, args.memory_budget_mb), ensure_ascii=False, indent=2))
+    elif args.cmd == "jitter":
+        rows = bench_jitter(args.sizes, Path(args.src) if args.src else None, args.repeat, args.png_compress_level)
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,31 @@
 """
-数据集占位模块：
-提供 Live2D 纹理切片与掩膜读取的骨架，供后续AI训练使用。
-当前实现返回原始贴图路径列表，训练阶段由调用方读取。
+数据集模块：
+- load_texture_manifest：读取 index.json，返回原始贴图路径列表
+- build 命令：将清单中的全部纹理一次性解码为内存映射的 uint8 RGBA 分片（shard_XXX.u8）+ 偏移索引（shards.json）
+- patches 命令 / build_patch_index：按 stride 网格做向量化块求和得到不透明像素计数，再用积分图求每个 patch 窗口的
+  不透明占比，超过阈值的 patch 左上角坐标按纹理存为紧凑的 int32 (y, x) 数组（patches_*.i32 + 偏移 JSON），
+  并报告朴素随机裁剪与索引采样的有效样本率
+- TextureCropDataset：PyTorch Dataset，从 patch 索引中 O(1) 抽取有效 patch，直接从内存映射切出（只拷贝该区域）并缩放，
+  训练时不再解码 PNG；分片在各 DataLoader worker 中按需打开（不随 Dataset 序列化），多 worker 共享页缓存
+- bench 命令：加载器吞吐（样本/秒），与每步解码 PNG 的朴素加载对比
 """
 
-from pathlib import Path
-from typing import List, Dict
+from pathlib import Path, PurePosixPath, PureWindowsPath
+from typing import Dict, List, Optional, Sequence
+import argparse
 import json
+import time
+
+import numpy as np
+from PIL import Image
+
+from texture_tiles import PngBandReader
+
+SHARD_INDEX = "shards.json"
+SHARD_BYTES = 1 << 30
+# 纹理在分片内的起始偏移对齐（字节）
+ALIGN = 4096
+PATCH_STRIDE = 32
 
 
 def load_texture_manifest(index_file: Path) -> List[Dict]:
@@ -22,3 +41,334 @@ def load_texture_manifest(index_file: Path) -> List[Dict]:
     return textures
 
 
+def local_path(path: str, root: Optional[Path] = None) -> Path:
+    """索引/清单中的路径（可能是 Windows 风格的 live2d_v4\\100100）转为本机路径；相对路径相对 root 解析"""
+    pure = PureWindowsPath(path) if "\\" in path else PurePosixPath(path)
+    local = Path(*pure.parts)
+    if root is not None and not pure.is_absolute():
+        local = Path(root) / local
+    return local
+
+
+def manifest_entry(path: str, root: Optional[Path] = None) -> Dict:
+    """清单路径（可能是 Windows 风格的 ...\\<model_id>\\model.1024\\texture_00.png）-> {model_id, texture, path}；
+    相对路径相对 root 解析"""
+    pure = PureWindowsPath(path) if "\\" in path else PurePosixPath(path)
+    return {"model_id": pure.parent.parent.name, "texture": f"{pure.parent.name}/{pure.name}",
+            "path": str(local_path(path, root))}
+
+
+def load_split_manifest(manifest_file: Path, split: str = "train", root: Optional[Path] = None) -> List[Dict]:
+    """读取 train_texture_lora.py 生成的 {"train": [...], "val": [...]} 清单"""
+    data = json.loads(manifest_file.read_text(encoding="utf-8"))
+    return [manifest_entry(p, root) for p in data.get(split, [])]
+
+
+def opaque_counts(alpha: np.ndarray, stride: int) -> np.ndarray:
+    """完整 stride x stride 块内的不透明像素数（块求和：reshape 后按轴累加），形状 (H//stride, W//stride)"""
+    gh, gw = alpha.shape[0] // stride, alpha.shape[1] // stride
+    opaque = alpha[:gh * stride, :gw * stride] != 0
+    return opaque.reshape(gh, stride, gw, stride).sum(axis=(1, 3), dtype=np.int32)
+
+
+def window_sums(counts: np.ndarray, k: int) -> np.ndarray:
+    """k x k 块窗口之和（积分图），形状 (gh-k+1, gw-k+1)"""
+    sat = np.zeros((counts.shape[0] + 1, counts.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(counts, axis=0), axis=1, out=sat[1:, 1:])
+    return sat[k:, k:] - sat[:-k, k:] - sat[k:, :-k] + sat[:-k, :-k]
+
+
+def patch_coords(alpha: np.ndarray, patch: int, stride: int = PATCH_STRIDE, min_alpha: float = 0.5) -> np.ndarray:
+    """不透明占比 >= min_alpha 的 patch x patch 窗口（左上角按 stride 对齐）的 (y, x)，int32 (N, 2)"""
+    k = patch // stride
+    counts = opaque_counts(alpha, stride)
+    if k < 1 or counts.shape[0] < k or counts.shape[1] < k:
+        return np.zeros((0, 2), dtype=np.int32)
+    ys, xs = np.nonzero(window_sums(counts, k) >= min_alpha * patch * patch)
+    return (np.stack([ys, xs], axis=1) * stride).astype(np.int32)
+
+
+def build_shards(textures: List[Dict], out_dir: Path, shard_bytes: int = SHARD_BYTES) -> Dict:
+    """按头信息规划布局后逐张流式解码到分片内存映射；返回索引"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    entries: List[Dict] = []
+    shard_sizes: List[int] = []
+    for t in textures:
+        try:
+            with Image.open(t["path"]) as img:
+                w, h = img.size
+        except Exception as e:
+            print(f"跳过无法读取的纹理: {t['path']} ({e})")
+            continue
+        nbytes = w * h * 4
+        if not shard_sizes or (shard_sizes[-1] > 0 and shard_sizes[-1] + nbytes > shard_bytes):
+            shard_sizes.append(0)
+        offset = shard_sizes[-1]
+        entries.append({**t, "shard": len(shard_sizes) - 1, "offset": offset, "height": h, "width": w})
+        shard_sizes[-1] = -(-(offset + nbytes) // ALIGN) * ALIGN
+
+    shards = [f"shard_{i:03d}.u8" for i in range(len(shard_sizes))]
+    maps = [np.memmap(out_dir / name, dtype=np.uint8, mode="w+", shape=(max(size, 1),))
+            for name, size in zip(shards, shard_sizes)]
+    for e in entries:
+        h, w = e["height"], e["width"]
+        view = maps[e["shard"]][e["offset"]:e["offset"] + h * w * 4].reshape(h, w, 4)
+        with PngBandReader(Path(e["path"])) as reader:
+            for y in range(0, h, 256):
+                reader.read_into(view[y:y + 256])
+    for m in maps:
+        m.flush()
+    index = {"version": 1, "shards": shards, "textures": entries}
+    (out_dir / SHARD_INDEX).write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    return index
+
+
+def _open_shards(shard_dir: Path, index: Dict) -> List[np.memmap]:
+    return [np.memmap(shard_dir / name, dtype=np.uint8, mode="r") for name in index["shards"]]
+
+
+def _texture_view(maps: List[np.memmap], e: Dict) -> np.ndarray:
+    h, w = e["height"], e["width"]
+    return maps[e["shard"]][e["offset"]:e["offset"] + h * w * 4].reshape(h, w, 4)
+
+
+def patch_index_name(patch: int, stride: int, min_alpha: float) -> str:
+    return f"patches_p{patch}_s{stride}_a{int(round(min_alpha * 100))}"
+
+
+def build_patch_index(shard_dir: Path, patch: int = 512, stride: int = PATCH_STRIDE, min_alpha: float = 0.5) -> Dict:
+    """为分片中每张纹理计算有效 patch 坐标，写出 <name>.i32（全部纹理的 (y, x) 依次拼接）与 <name>.json（每张纹理的偏移/数量/patch 边长）。
+    小于 patch 的纹理使用 min(H, W) 向下对齐到 stride 的边长。"""
+    shard_dir = Path(shard_dir)
+    index = json.loads((shard_dir / SHARD_INDEX).read_text(encoding="utf-8"))
+    maps = _open_shards(shard_dir, index)
+    coords: List[np.ndarray] = []
+    textures: List[Dict] = []
+    offset = 0
+    for e in index["textures"]:
+        p = min(patch, e["height"] // stride * stride, e["width"] // stride * stride)
+        c = patch_coords(_texture_view(maps, e)[..., 3], p, stride, min_alpha)
+        textures.append({"offset": offset, "count": len(c), "patch": p})
+        coords.append(c)
+        offset += len(c)
+    name = patch_index_name(patch, stride, min_alpha)
+    (np.concatenate(coords) if coords else np.zeros((0, 2), np.int32)).astype(np.int32).tofile(shard_dir / f"{name}.i32")
+    meta = {"patch": patch, "stride": stride, "min_alpha": min_alpha, "total": offset, "textures": textures}
+    (shard_dir / f"{name}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    return meta
+
+
+def load_patch_index(shard_dir: Path, patch: int = 512, stride: int = PATCH_STRIDE, min_alpha: float = 0.5,
+                     rebuild: bool = False):
+    """返回 (meta, coords int32 (N, 2))；索引缺失或早于 shards.json 时重建"""
+    shard_dir = Path(shard_dir)
+    name = patch_index_name(patch, stride, min_alpha)
+    meta_path = shard_dir / f"{name}.json"
+    if rebuild or not meta_path.exists() or meta_path.stat().st_mtime_ns < (shard_dir / SHARD_INDEX).stat().st_mtime_ns:
+        build_patch_index(shard_dir, patch, stride, min_alpha)
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    coords = np.fromfile(shard_dir / f"{name}.i32", dtype=np.int32).reshape(-1, 2)
+    return meta, coords
+
+
+def patch_yield(shard_dir: Path, patch: int = 512, stride: int = PATCH_STRIDE, min_alpha: float = 0.5,
+                samples: int = 2000, seed: int = 0) -> Dict:
+    """有效样本率：朴素随机裁剪（均匀选纹理与位置） vs 从 patch 索引抽样；均用像素级积分图精确计算不透明占比"""
+    shard_dir = Path(shard_dir)
+    index = json.loads((shard_dir / SHARD_INDEX).read_text(encoding="utf-8"))
+    t0 = time.perf_counter()
+    meta, coords = load_patch_index(shard_dir, patch, stride, min_alpha, rebuild=True)
+    build_seconds = time.perf_counter() - t0
+    maps = _open_shards(shard_dir, index)
+    rng = np.random.default_rng(seed)
+    owners = np.repeat(np.arange(len(meta["textures"]), dtype=np.int32), [t["count"] for t in meta["textures"]])
+
+    naive_tex = rng.integers(len(index["textures"]), size=samples)
+    picked = rng.integers(len(coords), size=samples) if len(coords) else np.zeros(0, np.int64)
+    hits = {"naive": 0, "indexed": 0}
+    for i, e in enumerate(index["textures"]):
+        p = meta["textures"][i]["patch"]
+        if p <= 0:
+            continue
+        alpha = _texture_view(maps, e)[..., 3]
+        sat = np.zeros((alpha.shape[0] + 1, alpha.shape[1] + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(alpha != 0, axis=0, dtype=np.int32), axis=1, out=sat[1:, 1:])
+
+        def ok(ys, xs):
+            s = sat[ys + p, xs + p] - sat[ys, xs + p] - sat[ys + p, xs] + sat[ys, xs]
+            return int((s >= min_alpha * p * p).sum())
+
+        n = int((naive_tex == i).sum())
+        hits["naive"] += ok(rng.integers(e["height"] - p + 1, size=n), rng.integers(e["width"] - p + 1, size=n))
+        mine = picked[owners[picked] == i]
+        hits["indexed"] += ok(coords[mine, 0], coords[mine, 1])
+    return {
+        "textures": len(index["textures"]),
+        "patch": patch,
+        "stride": stride,
+        "min_alpha": min_alpha,
+        "useful_patches": meta["total"],
+        "index_bytes": meta["total"] * 8,
+        "build_seconds": build_seconds,
+        "naive_yield": hits["naive"] / samples,
+        "indexed_yield": hits["indexed"] / samples if len(coords) else 0.0,
+    }
+
+
+def maybe_import_torch():
+    try:
+        import torch
+        from torch.utils.data import Dataset
+        return torch, Dataset
+    except Exception:
+        return None, object
+
+
+torch, _Dataset = maybe_import_torch()
+
+
+class TextureCropDataset(_Dataset):
+    """从分片中采样 alpha 过滤的裁剪：
+    - 从 patch 索引（不透明占比 >= min_alpha 的 crop x crop 窗口）中均匀抽取一个：坐标与所属纹理均为 O(1) 数组查找
+    - 只拷贝该窗口并缩放到 size；返回 {"pixel_values": (3,size,size) float32 [-1,1], "mask": (1,size,size) [0,1]}
+    - 每个样本的随机数由 (seed, epoch, idx) 决定，可复现；set_epoch 切换轮次"""
+
+    def __init__(self, shard_dir: Path, crop: int = 512, size: int = 256, min_alpha: float = 0.5,
+                 stride: int = PATCH_STRIDE, samples_per_epoch: int = 10000, seed: int = 0):
+        self.shard_dir = Path(shard_dir)
+        self.index = json.loads((self.shard_dir / SHARD_INDEX).read_text(encoding="utf-8"))
+        self.crop, self.size = crop, size
+        self.samples_per_epoch = samples_per_epoch
+        self.seed, self.epoch = seed, 0
+        meta, self._coords = load_patch_index(self.shard_dir, crop, stride, min_alpha)
+        if len(self._coords) == 0:
+            raise ValueError(f"没有满足 min_alpha={min_alpha} 的 {crop}px patch: {self.shard_dir}")
+        counts = [t["count"] for t in meta["textures"]]
+        self._owners = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        self._patch = np.array([t["patch"] for t in meta["textures"]], dtype=np.int32)
+        self._maps: Dict[int, np.memmap] = {}
+
+    def __getstate__(self):
+        # DataLoader worker 各自打开内存映射（np.memmap 序列化会拷贝整个分片）
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.samples_per_epoch
+
+    def texture(self, i: int) -> np.ndarray:
+        """第 i 张纹理的 (H,W,4) 只读内存映射视图"""
+        e = self.index["textures"][i]
+        shard = e["shard"]
+        if shard not in self._maps:
+            self._maps[shard] = np.memmap(self.shard_dir / self.index["shards"][shard], dtype=np.uint8, mode="r")
+        h, w = e["height"], e["width"]
+        return self._maps[shard][e["offset"]:e["offset"] + h * w * 4].reshape(h, w, 4)
+
+    def sample(self, idx: int) -> np.ndarray:
+        """(size,size,4) uint8 裁剪"""
+        rng = np.random.default_rng([self.seed, self.epoch, idx])
+        k = int(rng.integers(len(self._coords)))
+        t = int(self._owners[k])
+        tex = self.texture(t)
+        crop = int(self._patch[t])
+        y0, x0 = int(self._coords[k, 0]), int(self._coords[k, 1])
+        patch = np.ascontiguousarray(tex[y0:y0 + crop, x0:x0 + crop])
+        if crop != self.size:
+            img = Image.fromarray(patch, "RGBA")
+            factor = crop // self.size
+            if factor >= 2:
+                # 整数倍部分用盒式 reduce（比抗锯齿 resize 快约 2.5 倍），余下部分再双线性
+                img = img.reduce(factor)
+            if img.size != (self.size, self.size):
+                img = img.resize((self.size, self.size), Image.BILINEAR)
+            patch = np.asarray(img)
+        return patch
+
+    def __getitem__(self, idx: int):
+        patch = torch.from_numpy(np.ascontiguousarray(self.sample(idx).transpose(2, 0, 1)))
+        rgba = patch.float().div_(255.0)
+        return {"pixel_values": rgba[:3].mul(2.0).sub_(1.0), "mask": rgba[3:]}
+
+
+class PngCropDataset(TextureCropDataset):
+    """基准用对照：采样逻辑相同，但每个样本都重新解码整张 PNG"""
+
+    def texture(self, i: int) -> np.ndarray:
+        with Image.open(self.index["textures"][i]["path"]) as img:
+            return np.asarray(img.convert("RGBA"))
+
+
+def bench_loader(shard_dir: Path, workers: Sequence[int], batch_size: int, batches: int,
+                 crop: int, size: int, baseline: bool = True) -> List[Dict]:
+    from torch.utils.data import DataLoader
+    rows: List[Dict] = []
+    variants = [("memmap", TextureCropDataset)] + ([("png_decode", PngCropDataset)] if baseline else [])
+    for label, cls in variants:
+        for nw in workers:
+            ds = cls(shard_dir, crop=crop, size=size, samples_per_epoch=batch_size * (batches + 2))
+            loader = DataLoader(ds, batch_size=batch_size, num_workers=nw, shuffle=False,
+                                persistent_workers=False, prefetch_factor=4 if nw else None)
+            it = iter(loader)
+            next(it)  # 预热（worker 启动）
+            t0 = time.perf_counter()
+            n = 0
+            for _ in range(batches):
+                n += next(it)["pixel_values"].shape[0]
+            secs = time.perf_counter() - t0
+            rows.append({"loader": label, "workers": nw, "batch_size": batch_size,
+                         "samples_per_sec": n / secs if secs > 0 else 0.0})
+            del it, loader
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="纹理训练数据：内存映射分片与加载器基准")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="解码清单中的纹理到内存映射分片")
+    b.add_argument("--index", default="data/processed/index.json", help="index.json（与 --manifest 二选一）")
+    b.add_argument("--manifest", help="train_texture_lora.py 生成的清单")
+    b.add_argument("--split", default="train")
+    b.add_argument("--root", default=None, help="清单中相对路径的根目录（数据集根）")
+    b.add_argument("--out", default="data/texture_shards")
+    b.add_argument("--shard-mb", type=int, default=SHARD_BYTES >> 20)
+    pt = sub.add_parser("patches", help="构建 patch 索引并报告有效样本率")
+    pt.add_argument("--shards", default="data/texture_shards")
+    pt.add_argument("--patch", type=int, default=512)
+    pt.add_argument("--stride", type=int, default=PATCH_STRIDE)
+    pt.add_argument("--min-alpha", type=float, default=0.5, help="patch 内不透明像素占比阈值")
+    pt.add_argument("--samples", type=int, default=2000, help="估计有效样本率的抽样数")
+    r = sub.add_parser("bench", help="加载器吞吐（样本/秒）")
+    r.add_argument("--shards", default="data/texture_shards")
+    r.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    r.add_argument("--batch-size", type=int, default=8)
+    r.add_argument("--batches", type=int, default=50)
+    r.add_argument("--crop", type=int, default=512)
+    r.add_argument("--size", type=int, default=256)
+    r.add_argument("--no-baseline", action="store_true", help="不测每步解码 PNG 的对照")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        textures = load_split_manifest(Path(args.manifest), args.split, Path(args.root) if args.root else None) if args.manifest \
+            else load_texture_manifest(Path(args.index))
+        t0 = time.perf_counter()
+        index = build_shards(textures, Path(args.out), args.shard_mb << 20)
+        total = sum(e["height"] * e["width"] * 4 for e in index["textures"])
+        print(json.dumps({"textures": len(index["textures"]), "shards": len(index["shards"]),
+                          "bytes": total, "seconds": time.perf_counter() - t0}, ensure_ascii=False, indent=2))
+    elif args.cmd == "patches":
+        print(json.dumps(patch_yield(Path(args.shards), args.patch, args.stride, args.min_alpha, args.samples),
+                         ensure_ascii=False, indent=2))
+    else:
+        rows = bench_loader(Path(args.shards), args.workers, args.batch_size, args.batches, args.crop, args.size,
+                            baseline=not args.no_baseline)
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,122 @@
 """
-动作推理占位：
-调用程序化生成器生成基础 idle/nod/blink 动作，返回可并入的Motions结构。
+动作推理：
+- 用 scripts/synthesize_motions 批量合成基础 idle/nod/blink 动作，返回可并入的Motions结构。
+- 设置 MOTION_MODEL_PATH（或 --checkpoint）指向 train_motion_model.py train 的检查点时，额外从 GRU 模型自回归采样
+  --count 个新动作（Generated 分组）：每帧从预测的高斯分布中按 --temperature 采样，反归一化并限制在数据集取值范围内，
+  写出为 motion3 JSON（逐帧值经 scripts/compile_motion_curves 拟合为少量贝塞尔/线性段）
 """
 
 from pathlib import Path
-import subprocess
+import argparse
 import json
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple
 import os
+import sys
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "scripts"))
+from compile_motion_curves import CurveFitConfig, curves_from_samples, update_meta
+from synthesize_motions import MotionSpec, write_motions
 
 
 def generate_basic_motions(out_dir: Path) -> Dict[str, List[Dict[str, str]]]:
-    out_dir.mkdir(parents=True, exist_ok=True)
+    """基础 idle/nod/blink 动作：同进程一次批量合成写入 <out_dir>/mtn"""
     motions_dir = out_dir / "mtn"
-    motions_dir.mkdir(parents=True, exist_ok=True)
+    specs = [
+        MotionSpec("idle", 3.0, loop=True, name="auto_idle"),
+        MotionSpec("nod", 1.2, name="auto_nod"),
+        MotionSpec("blink", 2.0, loop=True, name="auto_blink"),
+    ]
+    return {"Auto": write_motions(specs, motions_dir, indent=2, prefix="mtn/")}
+
+
+def load_motion_model(path: Path):
+    """加载检查点，返回 (模型, 检查点字典)"""
+    import torch
+    from train_motion_model import MotionGRU
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    model = MotionGRU(**state["config"])
+    model.load_state_dict(state["model"])
+    model.eval()
+    return model, state
+
+
+def default_params(state: Dict) -> List[str]:
+    """默认动画参数：训练集中出现频率最高的 K 个参数，K 为每个动作平均动画的参数数"""
+    freq = np.asarray(state["param_freq"])
+    k = max(1, int(round(freq.sum())))
+    return [state["params"][j] for j in sorted(np.argsort(-freq, kind="stable")[:k])]
+
 
-    motion_map = {
-        "Auto": [
-            ("auto_idle", "idle", 3.0, True),
-            ("auto_nod", "nod", 1.2, False),
-            ("auto_blink", "blink", 2.0, True),
-        ]
-    }
-
-    results: Dict[str, List[Dict[str, str]]] = {}
-    for group, items in motion_map.items():
-        group_list: List[Dict[str, str]] = []
-        for name, mtype, duration, loop in items:
-            target = motions_dir / f"{name}.motion3.json"
-            cmd = [
-                "python",
-                str(Path(__file__).parent.parent / "scripts" / "generate_motion_json.py"),
-                str(target),
-                mtype,
-                "--duration",
-                str(duration),
-            ]
-            if loop:
-                cmd.append("--loop")
-            # 抑制子进程输出，避免污染上层stdout
-            with open(os.devnull, 'wb') as devnull:
-                subprocess.check_call(cmd, stdout=devnull, stderr=devnull)
-            group_list.append({"File": f"mtn/{name}.motion3.json", "Name": name})
-        results[group] = group_list
-    return results
+def sample_motion(model, state: Dict, duration: float, params: Optional[Sequence[str]] = None, seed: int = 0,
+                  temperature: float = 0.7) -> Tuple[List[str], np.ndarray]:
+    """自回归采样：返回 (参数 Id 列表, (frames, len(ids)) 反归一化后的值)"""
+    import torch
+    ids = [p for p in (params or default_params(state)) if p in state["params"]]
+    cols = np.array([state["params"].index(p) for p in ids], dtype=np.int64)
+    frames = int(round(duration * state["fps"])) + 1
+    mask = torch.zeros(1, 1, len(state["params"]))
+    mask[0, 0, cols] = 1.0
+    gen = torch.Generator().manual_seed(seed)
+    x = torch.zeros(1, 1, len(state["params"]))
+    out = np.zeros((frames, len(state["params"])), dtype=np.float32)
+    h = None
+    with torch.no_grad():
+        for t in range(1, frames):
+            mu, logvar, h = model.step(x, mask, h)
+            x = (mu + temperature * torch.exp(0.5 * logvar) * torch.randn(mu.shape, generator=gen)) * mask
+            out[t] = x[0, 0].numpy()
+    values = out[:, cols] * state["std"][cols] + state["mean"][cols]
+    values = np.clip(values, state["min"][cols], state["max"][cols])
+    return ids, values.astype(np.float32)
+
+
+def motion3_from_frames(ids: Sequence[str], values: np.ndarray, fps: float, loop: bool = False,
+                        fit: Optional[CurveFitConfig] = None) -> Dict:
+    """逐帧值 -> motion3（在误差容限内拟合为最少的贝塞尔/线性段）"""
+    duration = (len(values) - 1) / fps
+    times = np.arange(len(values)) / fps
+    curves = curves_from_samples([("Parameter", pid, times, values[:, j]) for j, pid in enumerate(ids)], fit)
+    return update_meta({
+        "Version": 3,
+        "Meta": {"Duration": duration, "Fps": float(fps), "Loop": bool(loop), "AreBeziersRestricted": True,
+                 "UserDataCount": 0, "TotalUserDataSize": 0},
+        "Curves": curves,
+    })
+
+
+def generate_model_motions(out_dir: Path, checkpoint: Path, count: int = 3, duration: Optional[float] = None,
+                           seed: int = 0, temperature: float = 0.7) -> Dict[str, List[Dict[str, str]]]:
+    """从 GRU 模型采样 count 个动作写入 <out_dir>/mtn/gen_XXX.motion3.json，返回 {"Generated": [...]}"""
+    model, state = load_motion_model(checkpoint)
+    motions_dir = out_dir / "mtn"
+    motions_dir.mkdir(parents=True, exist_ok=True)
+    items: List[Dict[str, str]] = []
+    for k in range(count):
+        ids, values = sample_motion(model, state, duration or state["median_duration"], seed=seed + k,
+                                    temperature=temperature)
+        name = f"gen_{k:03d}"
+        motion = motion3_from_frames(ids, values, state["fps"])
+        (motions_dir / f"{name}.motion3.json").write_text(json.dumps(motion, ensure_ascii=False), encoding="utf-8")
+        items.append({"File": f"mtn/{name}.motion3.json", "Name": name})
+    return {"Generated": items}
 
 
 if __name__ == "__main__":
-    import sys
-    out = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("outputs/tmp")
+    ap = argparse.ArgumentParser(description="生成基础动作（可选：从 GRU 动作模型采样）")
+    ap.add_argument("out", nargs="?", default="outputs/tmp")
+    ap.add_argument("--checkpoint", default=os.environ.get("MOTION_MODEL_PATH"), help="train_motion_model.py 检查点")
+    ap.add_argument("--count", type=int, default=int(os.environ.get("MOTION_SAMPLE_COUNT", "3")))
+    ap.add_argument("--duration", type=float, default=None, help="采样时长（秒，默认训练集中位时长）")
+    ap.add_argument("--temperature", type=float, default=float(os.environ.get("MOTION_TEMPERATURE", "0.7")))
+    ap.add_argument("--seed", type=int, default=int(os.environ.get("MOTION_SEED", "0")))
+    args = ap.parse_args()
+    out = Path(args.out)
     motions = generate_basic_motions(out)
+    if args.checkpoint and Path(args.checkpoint).exists():
+        motions.update(generate_model_motions(out, Path(args.checkpoint), args.count, args.duration, args.seed,
+                                              args.temperature))
     # 固定UTF-8字节输出，避免Windows控制台编码影响
     sys.stdout.buffer.write(json.dumps(motions, ensure_ascii=False, indent=2).encode('utf-8'))
     sys.stdout.buffer.flush()
-
-
@@ -1,34 +1,222 @@
 """
 AI纹理生成推理：
-支持两种模式：
+支持以下模式：
 1) jitter（默认，占位）：亮度/饱和度微扰
+   jitter_numpy：同上的 NumPy 融合实现（亮度/饱和度/色相单遍处理，仅不透明像素，alpha 不变）
+   --tiled：jitter_numpy/diffusers 改用分块流式引擎（texture_tiles.py），内存受 --memory-budget-mb 约束
+   --crop-opaque：按 alpha 占用分析（texture_occupancy.py）只处理不透明区域的少量矩形，再合成回整图
+   --variant-out-dirs：一次解码，按行块批量计算 K 个变体（第 k 个使用基础种子 seed+k）并流式写出到各目录
+   recolor：按 --style（预设名或 JSON）编译 3D 颜色 LUT（texture_lut.py，磁盘缓存），每个不透明像素一次查表
+所有后端的随机性均由 --seed 与源纹理内容派生（可复现）；--cache-dir 启用内容寻址缓存（texture_cache.py），
+相同源纹理 + 相同参数/种子/模型的结果以硬链接复用。
+批处理下设置 TEXTURE_SHM_DIR 时，模板纹理经共享内存解码缓存（texture_shm.py）读取，同一纹理每批只解码一次。
 2) diffusers：调用 Stable Diffusion/Diffusers img2img，并可加载 LoRA（若可用）
+3) diffusers_batch：同上，但每个进程只加载一次管线，并将（可跨多个模型的）纹理按分辨率分组为 micro-batch；
+   --jobs-file 一次处理多个模型（批量生成时每个 worker 一次调用，见 pipeline/batch_generate.py）
+--tiny：diffusers/diffusers_batch 改用随机初始化的微型 img2img 管线（train_diffusers_lora 的微型 VAE/UNet/文本编码器，
+不下载权重），在 CPU 上端到端检查流程
 """
 
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, replace
 from PIL import Image, ImageEnhance
+import numpy as np
 import random
 import argparse
+import json
 import os
+import sys
+import time
+
+from texture_cache import TextureCache, cache_from_env, cache_key, file_digest, job_seed, model_fingerprint, release_output
+from texture_ops import apply_color_matrix, hue_matrix, iter_color_variants, jitter_matrix, load_rgba, png_compress_level, save_rgba_png
+from texture_shm import load_rgba_shared, shared_rgba
+from texture_tiles import PngBandWriter, TileConfig, process_atlas_tiled
+from texture_occupancy import OccupancyConfig, apply_in_rects, occupied_rects, rects_fraction
+from texture_lut import apply_lut, get_lut, load_style, style_key
 
 
 def jitter_texture(src: Path, dst: Path, hue_delta: float = 0.0, sat: float = 1.1, bright: float = 1.05):
-    img = Image.open(src).convert("RGBA")
-    # 亮度
-    img = ImageEnhance.Brightness(img).enhance(bright)
-    # 饱和度
-    img = ImageEnhance.Color(img).enhance(sat)
+    with shared_rgba(src) as rgba:
+        img = Image.frombuffer("RGBA", (rgba.shape[1], rgba.shape[0]), rgba, "raw", "RGBA", 0, 1)
+        # 亮度
+        img = ImageEnhance.Brightness(img).enhance(bright)
+        # 饱和度
+        img = ImageEnhance.Color(img).enhance(sat)
+    if hue_delta:
+        # 色相：PIL 无对应增强器，用与 jitter_numpy 相同的色相矩阵处理不透明像素
+        arr = np.array(img)
+        apply_color_matrix(arr, hue_matrix(hue_delta))
+        img = Image.fromarray(arr, "RGBA")
     dst.parent.mkdir(parents=True, exist_ok=True)
     img.save(dst, "PNG")
 
 
-def process_textures_jitter(src_textures: List[Path], out_dir: Path) -> List[str]:
+def jitter_texture_numpy(src: Path, dst: Path, hue_delta: float = 0.0, sat: float = 1.1, bright: float = 1.05,
+                         compress_level: Optional[int] = None, crop: bool = False):
+    """jitter_texture 的 NumPy 实现：三种调整融合为一个颜色矩阵，单遍作用于 uint8 缓冲。
+    crop=True 时只处理占用分析得到的不透明矩形。"""
+    rgba = load_rgba_shared(src)
+    matrix = jitter_matrix(bright, sat, hue_delta)
+    if crop:
+        apply_in_rects(rgba, occupied_rects(rgba[..., 3]), lambda c: apply_color_matrix(c, matrix))
+    else:
+        apply_color_matrix(rgba, matrix)
+    save_rgba_png(rgba, dst, compress_level)
+
+
+def jitter_texture_tiled(src: Path, dst: Path, hue_delta: float = 0.0, sat: float = 1.1, bright: float = 1.05,
+                         tile_cfg: Optional[TileConfig] = None, compress_level: Optional[int] = None):
+    """分块流式版本：逐像素运算无需重叠，峰值内存与图集高度无关"""
+    matrix = jitter_matrix(bright, sat, hue_delta)
+
+    def tile_fn(tile):
+        out = tile.copy()
+        apply_color_matrix(out, matrix)
+        return out[..., :3]
+
+    cfg = replace(tile_cfg or TileConfig(), overlap=0, tile_fn_bytes_per_px=24)
+    return process_atlas_tiled(src, dst, tile_fn, cfg, compress_level)
+
+
+def jitter_factors(seed: int, hue_range: float = 0.0) -> Tuple[float, float, float]:
+    """由任务种子抽取 (sat, bright, hue)"""
+    rng = random.Random(seed)
+    sat = 1.05 + rng.uniform(-0.05, 0.1)
+    bright = 1.0 + rng.uniform(-0.05, 0.1)
+    hue = rng.uniform(-hue_range, hue_range) if hue_range > 0 else 0.0
+    return sat, bright, hue
+
+
+# 多变体路径的行块：K 份 (rows, W, 4) 输出同时驻留
+VARIANT_CHUNK_ROWS = 64
+
+
+def _write_color_variants(rgba: np.ndarray, matrices: List[np.ndarray], dsts: List[Path],
+                          compress_level: Optional[int] = None):
+    h, w = rgba.shape[:2]
+    writers = [PngBandWriter(dst, w, h, compress_level) for dst in dsts]
+    try:
+        for _, bands in iter_color_variants(rgba, matrices, VARIANT_CHUNK_ROWS):
+            for writer, band in zip(writers, bands):
+                writer.write_rows(band)
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.close()
+
+
+def preview_levels_of(rgba: np.ndarray, levels: List[int]) -> Dict[int, np.ndarray]:
+    """预乘 alpha 下逐级 BOX 降采样（与 scripts/build_texture_pyramid.py 一致）；只保留小于原图长边的层级"""
+    h, w = rgba.shape[:2]
+    cur = Image.fromarray(rgba, "RGBA").convert("RGBa")
+    out: Dict[int, np.ndarray] = {}
+    for size in sorted(levels, reverse=True):
+        if size >= max(w, h):
+            continue
+        scale = size / max(w, h)
+        cur = cur.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BOX, reducing_gap=2.0)
+        out[size] = np.asarray(cur.convert("RGBA"))
+    return out
+
+
+def jitter_variants_numpy(src: Path, dsts: List[Path], factors: List[Tuple[float, float, float]],
+                          compress_level: Optional[int] = None, level_dsts: Optional[Dict[int, List[Path]]] = None):
+    """同一源纹理的 K 个抖动变体：只解码一次，行块级批量计算并流式写出 K 个 PNG。
+    level_dsts 给出时同时写出预览层级：颜色矩阵是线性的，与预乘 alpha 面积平均可交换，
+    因此只需对模板降采样一次，再在小图上批量套用 K 个矩阵（仅舍入/截断处与逐变体降采样不同）。"""
+    matrices = [jitter_matrix(bright, sat, hue) for sat, bright, hue in factors]
+    # 只读：直接使用共享解码缓存的零拷贝视图
+    with shared_rgba(src) as rgba:
+        _write_color_variants(rgba, matrices, dsts, compress_level)
+        if level_dsts:
+            for size, small in preview_levels_of(rgba, list(level_dsts)).items():
+                _write_color_variants(small, matrices, level_dsts[size], compress_level)
+        del rgba
+
+
+def process_textures_jitter_variants(src_textures: List[Path], out_dirs: List[Path], hue_range: float = 0.0,
+                                     compress_level: Optional[int] = None, base_seed: int = 0,
+                                     preview_levels: Optional[List[int]] = None) -> List[str]:
+    """K 个输出目录各得到一套纹理；第 k 个变体与 --seed base_seed+k 的 jitter_numpy 结果一致（舍入误差 ≤1）。
+    preview_levels 给出时同时写出 <out_dir>/textures_<size>/<纹理文件名>（供纹理金字塔阶段直接复用）。"""
+    rels: List[str] = []
+    for i, tex in enumerate(src_textures):
+        rel = f"textures_ai/texture_{i:02d}.png"
+        digest = file_digest(tex)
+        factors = [jitter_factors(job_seed(base_seed + k, digest), hue_range) for k in range(len(out_dirs))]
+        dsts = [d / rel for d in out_dirs]
+        level_dsts = {s: [d / f"textures_{s}" / Path(rel).name for d in out_dirs] for s in (preview_levels or [])}
+        for dst in dsts + [p for ps in level_dsts.values() for p in ps]:
+            release_output(dst)
+        jitter_variants_numpy(tex, dsts, factors, compress_level, level_dsts)
+        rels.append(rel)
+    return rels
+
+
+def process_textures_jitter(src_textures: List[Path], out_dir: Path, impl: str = "pil", hue_range: float = 0.0,
+                            compress_level: Optional[int] = None, tile_cfg: Optional[TileConfig] = None,
+                            crop: bool = False, base_seed: int = 0, cache: Optional[TextureCache] = None) -> List[str]:
     rels: List[str] = []
     for i, tex in enumerate(src_textures):
         rel = f"textures_ai/texture_{i:02d}.png"
         dst = out_dir / rel
-        jitter_texture(tex, dst, sat=1.05 + random.uniform(-0.05, 0.1), bright=1.0 + random.uniform(-0.05, 0.1))
+        digest = file_digest(tex)
+        seed = job_seed(base_seed, digest)
+        sat, bright, hue = jitter_factors(seed, hue_range)
+
+        def produce(d: Path, tex=tex, sat=sat, bright=bright, hue=hue):
+            if impl == "numpy" and tile_cfg is not None:
+                jitter_texture_tiled(tex, d, hue_delta=hue, sat=sat, bright=bright, tile_cfg=tile_cfg, compress_level=compress_level)
+            elif impl == "numpy":
+                jitter_texture_numpy(tex, d, hue_delta=hue, sat=sat, bright=bright, compress_level=compress_level, crop=crop)
+            else:
+                jitter_texture(tex, d, hue_delta=hue, sat=sat, bright=bright)
+
+        if cache is None:
+            release_output(dst)
+            produce(dst)
+        else:
+            params = {"impl": impl, "sat": sat, "bright": bright, "hue": hue, "crop": crop and impl == "numpy",
+                      "compress_level": png_compress_level(compress_level) if impl == "numpy" else None}
+            cache.get_or_create(cache_key(digest, "jitter", params, seed), dst, produce)
+        rels.append(rel)
+    return rels
+
+
+def recolor_texture(src: Path, dst: Path, lut: np.ndarray, compress_level: Optional[int] = None, crop: bool = False):
+    """LUT 重着色：每个不透明像素一次查表，alpha 不变；crop=True 时只处理不透明矩形"""
+    rgba = load_rgba_shared(src)
+    if crop:
+        apply_in_rects(rgba, occupied_rects(rgba[..., 3]), lambda c: apply_lut(c, lut))
+    else:
+        apply_lut(rgba, lut)
+    save_rgba_png(rgba, dst, compress_level)
+
+
+def process_textures_recolor(src_textures: List[Path], out_dir: Path, style: str,
+                             compress_level: Optional[int] = None, crop: bool = False,
+                             cache: Optional[TextureCache] = None, lut_dir: Optional[str] = None) -> List[str]:
+    spec = load_style(style)
+    lut = get_lut(spec, lut_dir)
+    rels: List[str] = []
+    for i, tex in enumerate(src_textures):
+        rel = f"textures_ai/texture_{i:02d}.png"
+        dst = out_dir / rel
+
+        def produce(d: Path, tex=tex):
+            recolor_texture(tex, d, lut, compress_level=compress_level, crop=crop)
+
+        if cache is None:
+            release_output(dst)
+            produce(dst)
+        else:
+            # 结果与种子无关，只取决于源纹理与风格
+            params = {"style": style_key(spec), "crop": crop, "compress_level": png_compress_level(compress_level)}
+            cache.get_or_create(cache_key(file_digest(tex), "recolor", params, None), dst, produce)
         rels.append(rel)
     return rels
 
@@ -42,69 +230,399 @@ def maybe_import_diffusers():
         return None, None
 
 
-def process_textures_diffusers(src_textures: List[Path], out_dir: Path) -> List[str]:
+def diffusers_settings() -> Dict[str, Any]:
+    """从环境变量读取 img2img 推理参数"""
+    return {
+        "model_id": os.environ.get("DIFFUSERS_MODEL_ID", "stabilityai/sd-turbo"),
+        "prompt": os.environ.get("DIFFUSERS_PROMPT", "high quality texture, cel shading, clean edges"),
+        "negative": os.environ.get("DIFFUSERS_NEGATIVE", "blurry, lowres, jpeg artifacts"),
+        "strength": float(os.environ.get("DIFFUSERS_STRENGTH", "0.35")),
+        "guidance": float(os.environ.get("DIFFUSERS_GUIDANCE", "1.5")),
+        "steps": int(os.environ.get("DIFFUSERS_STEPS", "10")),
+        "lora_path": os.environ.get("DIFFUSERS_LORA_PATH"),
+    }
+
+
+def seeded_generator(pipe, seed: Optional[int]):
+    """按种子创建 torch.Generator（与管线同设备）；未安装 torch 或无种子时返回 None"""
+    if seed is None:
+        return None
+    _, torch = maybe_import_diffusers()
+    if torch is None:
+        return None
+    return torch.Generator(device=getattr(pipe, "device", "cpu")).manual_seed(seed)
+
+
+def diffusers_params(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """参与缓存键的推理参数"""
+    return {k: cfg[k] for k in ("prompt", "negative", "strength", "guidance", "steps")}
+
+
+# 进程内管线缓存：(model_id, lora_path, device) -> pipeline，避免每个模型重复 from_pretrained
+_PIPELINE_CACHE: Dict[Tuple[str, Optional[str], str], Any] = {}
+
+
+def load_img2img_pipeline(model_id: str, lora_path: Optional[str] = None):
+    """加载（或复用已加载的）img2img 管线，返回 (pipe, torch)"""
     StableDiffusionImg2ImgPipeline, torch = maybe_import_diffusers()
     if StableDiffusionImg2ImgPipeline is None:
         raise RuntimeError("未安装 diffusers/torch，或不可用")
-
-    model_id = os.environ.get("DIFFUSERS_MODEL_ID", "stabilityai/sd-turbo")
-    prompt = os.environ.get("DIFFUSERS_PROMPT", "high quality texture, cel shading, clean edges")
-    negative = os.environ.get("DIFFUSERS_NEGATIVE", "blurry, lowres, jpeg artifacts")
-    strength = float(os.environ.get("DIFFUSERS_STRENGTH", "0.35"))
-    guidance = float(os.environ.get("DIFFUSERS_GUIDANCE", "1.5"))
-    steps = int(os.environ.get("DIFFUSERS_STEPS", "10"))
     device = "cuda" if torch.cuda.is_available() else "cpu"
+    key = (model_id, lora_path, device)
+    if key in _PIPELINE_CACHE:
+        return _PIPELINE_CACHE[key], torch
 
     pipe = StableDiffusionImg2ImgPipeline.from_pretrained(model_id, torch_dtype=torch.float16 if device=="cuda" else torch.float32)
     pipe = pipe.to(device)
 
-    # 可选加载 LoRA（需 diffusers>=0.16）
-    lora_path = os.environ.get("DIFFUSERS_LORA_PATH")
+    # 可选加载 LoRA（需 diffusers>=0.16）；load_lora_weights 不可用（新版 diffusers 需 peft）时，
+    # 将 train_diffusers_lora.py 写出的权重直接合并进 UNet
     if lora_path and Path(lora_path).exists():
         try:
             pipe.load_lora_weights(lora_path)
-        except Exception:
-            pass
+        except Exception as e:
+            from train_diffusers_lora import merge_lora_weights
+            merged = merge_lora_weights(pipe.unet, Path(lora_path))
+            print(f"diffusers: load_lora_weights 不可用（{e}），已直接合并 {merged} 个 LoRA 层: {lora_path}",
+                  file=sys.stderr)
+    _PIPELINE_CACHE[key] = pipe
+    return pipe, torch
+
+
+def tiny_img2img_pipeline(seed: int = 0):
+    """微型 img2img 管线（CPU 自检）：随机初始化的微型 VAE/UNet/文本编码器 + ASCII 字符级 CLIP 分词器，返回 (pipe, torch)"""
+    StableDiffusionImg2ImgPipeline, torch = maybe_import_diffusers()
+    if StableDiffusionImg2ImgPipeline is None:
+        raise RuntimeError("未安装 diffusers/torch，或不可用")
+    key = (f"tiny:{seed}", None, "cpu")
+    if key in _PIPELINE_CACHE:
+        return _PIPELINE_CACHE[key], torch
+
+    import tempfile
+    from diffusers import DDIMScheduler
+    from transformers import CLIPTokenizer
+    from train_diffusers_lora import build_tiny_models
+    models = build_tiny_models(seed)
+    # 词表只含特殊 token 与可打印 ASCII 字符（无合并规则），id 不超过微型文本编码器的 vocab_size
+    vocab = {"<|startoftext|>": 0, "<|pad|>": 1, "<|endoftext|>": 2}
+    chars = [chr(c) for c in range(33, 127)]
+    for c in chars + [c + "</w>" for c in chars]:
+        vocab.setdefault(c, len(vocab))
+    with tempfile.TemporaryDirectory() as d:
+        (Path(d) / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+        (Path(d) / "merges.txt").write_text("#version: 0.2\n", encoding="utf-8")
+        tokenizer = CLIPTokenizer(str(Path(d) / "vocab.json"), str(Path(d) / "merges.txt"),
+                                  pad_token="<|pad|>", model_max_length=77)
+    pipe = StableDiffusionImg2ImgPipeline(
+        vae=models["vae"], text_encoder=models["text_encoder"], tokenizer=tokenizer, unet=models["unet"],
+        scheduler=DDIMScheduler(num_train_timesteps=1000, clip_sample=False, steps_offset=1),
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+    )
+    pipe.set_progress_bar_config(disable=True)
+    _PIPELINE_CACHE[key] = pipe
+    return pipe, torch
+
+
+def diffusers_tile_fn(pipe, cfg: Dict[str, Any], align: int = 8, seed: Optional[int] = None):
+    """将 img2img 包装为 tile_fn：tile 边缘复制填充到 align 的倍数，推理后裁回原尺寸（每个 tile 使用同一种子）"""
+    def tile_fn(tile):
+        h, w = tile.shape[:2]
+        ph, pw = -h % align, -w % align
+        rgb = np.pad(tile[..., :3], ((0, ph), (0, pw), (0, 0)), mode="edge")
+        result = pipe(
+            prompt=cfg["prompt"],
+            image=Image.fromarray(rgb, "RGB"),
+            negative_prompt=cfg["negative"],
+            strength=cfg["strength"],
+            guidance_scale=cfg["guidance"],
+            num_inference_steps=cfg["steps"],
+            generator=seeded_generator(pipe, seed)
+        ).images[0].convert("RGB")
+        if result.size != (w + pw, h + ph):
+            result = result.resize((w + pw, h + ph), Image.BICUBIC)
+        return np.asarray(result)[:h, :w]
+
+    return tile_fn
+
+
+def diffusers_full_texture(pipe, cfg: Dict[str, Any], src: Path, dst: Path, seed: Optional[int] = None) -> None:
+    init_image = Image.open(src).convert("RGBA")
+    # 将 alpha 作为蒙版，送入管线时转为RGB
+    rgb = init_image.convert("RGB")
+    result = pipe(
+        prompt=cfg["prompt"],
+        image=rgb,
+        negative_prompt=cfg["negative"],
+        strength=cfg["strength"],
+        guidance_scale=cfg["guidance"],
+        num_inference_steps=cfg["steps"],
+        generator=seeded_generator(pipe, seed)
+    ).images[0]
+    # 恢复 alpha：将生成图与原 alpha 合成
+    result = result.convert("RGBA")
+    result.putalpha(init_image.split()[-1])
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    result.save(dst, "PNG")
+
+
+def diffusers_crop_texture(pipe, cfg: Dict[str, Any], src: Path, dst: Path,
+                           occ: Optional[OccupancyConfig] = None, seed: Optional[int] = None) -> float:
+    """只对不透明区域的处理矩形做 img2img，合成回原图后恢复 alpha；返回处理面积占比"""
+    occ = occ or OccupancyConfig()
+    rgba = load_rgba_shared(src)
+    rects = occupied_rects(rgba[..., 3], occ)
+    tile_fn = diffusers_tile_fn(pipe, cfg, occ.align, seed)
+    apply_in_rects(rgba, rects, lambda c: np.dstack([tile_fn(c), c[..., 3]]))
+    save_rgba_png(rgba, dst)
+    return rects_fraction(rects, rgba.shape[1], rgba.shape[0])
+
+
+def process_textures_diffusers(src_textures: List[Path], out_dir: Path, tile_cfg: Optional[TileConfig] = None,
+                               crop: bool = False, base_seed: int = 0, cache: Optional[TextureCache] = None,
+                               pipe=None, model_id: Optional[str] = None) -> List[str]:
+    """pipe/model_id 同 process_texture_jobs_diffusers_batched"""
+    cfg = diffusers_settings()
+    if pipe is None:
+        pipe, _ = load_img2img_pipeline(cfg["model_id"], cfg["lora_path"])
+    params = diffusers_params(cfg)
+    if tile_cfg is not None:
+        params["tile"] = [tile_cfg.tile_size, tile_cfg.overlap, tile_cfg.memory_budget]
+    else:
+        params["crop"] = crop
+    model = model_fingerprint(model_id or cfg["model_id"], cfg["lora_path"]) if cache is not None else None
 
     rels: List[str] = []
     for i, tex in enumerate(src_textures):
-        init_image = Image.open(tex).convert("RGBA")
-        # 将 alpha 作为蒙版，送入管线时转为RGB
-        rgb = init_image.convert("RGB")
-        result = pipe(
-            prompt=prompt,
-            image=rgb,
-            negative_prompt=negative,
-            strength=strength,
-            guidance_scale=guidance,
-            num_inference_steps=steps
-        ).images[0]
-        # 恢复 alpha：将生成图与原 alpha 合成
-        result = result.convert("RGBA")
-        result.putalpha(init_image.split()[-1])
         rel = f"textures_ai/texture_{i:02d}.png"
         dst = out_dir / rel
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        result.save(dst, "PNG")
+        digest = file_digest(tex)
+        seed = job_seed(base_seed, digest)
+
+        def produce(d: Path, tex=tex, seed=seed):
+            if tile_cfg is not None:
+                process_atlas_tiled(tex, d, diffusers_tile_fn(pipe, cfg, tile_cfg.align, seed), tile_cfg)
+            elif crop:
+                frac = diffusers_crop_texture(pipe, cfg, tex, d, seed=seed)
+                print(f"diffusers: {tex.name} 处理面积占比 {frac:.1%}", file=sys.stderr)
+            else:
+                diffusers_full_texture(pipe, cfg, tex, d, seed)
+
+        if cache is None:
+            release_output(dst)
+            produce(dst)
+        else:
+            cache.get_or_create(cache_key(digest, "diffusers", params, seed, model), dst, produce)
         rels.append(rel)
     return rels
 
 
+@dataclass
+class TextureJob:
+    """单张纹理的生成任务（可来自不同模型）"""
+    src: Path
+    out_dir: Path
+    rel: str
+    seed: Optional[int] = None
+    base_seed: Optional[int] = None  # 任务自带的基础种子（如变体序号），未设置时使用调用方的 base_seed
+
+
+def texture_jobs_for_model(src_textures: List[Path], out_dir: Path) -> List[TextureJob]:
+    return [TextureJob(tex, out_dir, f"textures_ai/texture_{i:02d}.png") for i, tex in enumerate(src_textures)]
+
+
+def group_jobs_by_resolution(jobs: List[TextureJob], batch_size: int) -> List[List[TextureJob]]:
+    """按分辨率分组并切成 micro-batch（同一 batch 内尺寸一致，才能堆叠为一个张量）"""
+    by_size: Dict[Tuple[int, int], List[TextureJob]] = {}
+    for job in jobs:
+        with Image.open(job.src) as img:
+            by_size.setdefault(img.size, []).append(job)
+    batches: List[List[TextureJob]] = []
+    for size in sorted(by_size):
+        items = by_size[size]
+        for k in range(0, len(items), max(1, batch_size)):
+            batches.append(items[k:k + max(1, batch_size)])
+    return batches
+
+
+def process_texture_jobs_diffusers_batched(jobs: List[TextureJob], batch_size: int = 4, threads: Optional[int] = None,
+                                           pipe=None, base_seed: int = 0,
+                                           cache: Optional[TextureCache] = None,
+                                           model_id: Optional[str] = None) -> Dict[str, Any]:
+    """批量 img2img：管线只加载一次，按分辨率组成 micro-batch 做一次前向；alpha 逐图恢复。
+    每张图使用独立的种子生成器；命中缓存的任务在组 batch 之前即被物化，不参与推理。
+    pipe 可由调用方注入（如 tiny_img2img_pipeline），便于在 CPU 上测试；model_id 为缓存键中的模型标识（默认取环境配置）。
+    返回吞吐统计。"""
+    cfg = diffusers_settings()
+    torch = None
+    if pipe is None:
+        pipe, torch = load_img2img_pipeline(cfg["model_id"], cfg["lora_path"])
+    else:
+        _, torch = maybe_import_diffusers()
+    if threads and torch is not None:
+        torch.set_num_threads(threads)
+
+    t0 = time.perf_counter()
+    params = diffusers_params(cfg)
+    model = model_fingerprint(model_id or cfg["model_id"], cfg["lora_path"]) if cache is not None else None
+    keys: Dict[Path, str] = {}
+    followers: Dict[str, List[Path]] = {}  # 同一次运行内内容相同的任务：只推理一次，其余从缓存物化
+    pending: List[TextureJob] = []
+    for job in jobs:
+        digest = file_digest(job.src)
+        job = replace(job, seed=job_seed(base_seed if job.base_seed is None else job.base_seed, digest))
+        dst = job.out_dir / job.rel
+        if cache is not None:
+            key = keys[dst] = cache_key(digest, "diffusers_batch", params, job.seed, model)
+            if key in followers:
+                followers[key].append(dst)
+                continue
+            if cache.fetch(key, dst):
+                continue
+            followers[key] = []
+        pending.append(job)
+    batches = group_jobs_by_resolution(pending, batch_size)
+    done = 0
+    for batch in batches:
+        inits = [Image.open(job.src).convert("RGBA") for job in batch]
+        rgbs = [img.convert("RGB") for img in inits]
+        n = len(batch)
+        results = pipe(
+            prompt=[cfg["prompt"]] * n,
+            image=rgbs,
+            negative_prompt=[cfg["negative"]] * n,
+            strength=cfg["strength"],
+            guidance_scale=cfg["guidance"],
+            num_inference_steps=cfg["steps"],
+            generator=[seeded_generator(pipe, job.seed) for job in batch] if torch is not None else None
+        ).images
+        for job, init_image, result in zip(batch, inits, results):
+            result = result.convert("RGBA")
+            if result.size != init_image.size:
+                result = result.resize(init_image.size, Image.BICUBIC)
+            result.putalpha(init_image.split()[-1])
+            dst = job.out_dir / job.rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            release_output(dst)
+            result.save(dst, "PNG")
+            if cache is not None:
+                cache.store(keys[dst], dst)
+                for other in followers[keys[dst]]:
+                    cache.fetch(keys[dst], other)
+            done += 1
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "images": done,
+        "batches": len(batches),
+        "batch_size": batch_size,
+        "threads": threads,
+        "elapsed_seconds": elapsed,
+        "images_per_sec": (done / elapsed) if elapsed > 0 else 0.0,
+    }
+    if cache is not None:
+        stats.update(cache.stats())
+    return stats
+
+
+def process_textures_diffusers_batched(src_textures: List[Path], out_dir: Path, batch_size: int = 4,
+                                       threads: Optional[int] = None, base_seed: int = 0,
+                                       cache: Optional[TextureCache] = None, pipe=None,
+                                       model_id: Optional[str] = None) -> List[str]:
+    jobs = texture_jobs_for_model(src_textures, out_dir)
+    stats = process_texture_jobs_diffusers_batched(jobs, batch_size, threads, pipe=pipe, base_seed=base_seed, cache=cache,
+                                                   model_id=model_id)
+    print(f"diffusers_batch: {stats['images']} 张, {stats['images_per_sec']:.3f} 张/秒", file=sys.stderr)
+    return [job.rel for job in jobs]
+
+
+def load_jobs_file(jobs_file: Path) -> List[TextureJob]:
+    """读取多模型任务清单：[{"template_model_dir": ..., "textures": [...], "out_dir": ..., "seed": 可选基础种子}, ...]"""
+    entries = json.loads(jobs_file.read_text(encoding="utf-8"))
+    jobs: List[TextureJob] = []
+    for e in entries:
+        base = Path(e["template_model_dir"])
+        jobs.extend(replace(job, base_seed=e.get("seed"))
+                    for job in texture_jobs_for_model([base / t for t in e.get("textures", [])], Path(e["out_dir"])))
+    return jobs
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--template-model-dir", required=True, help="模板模型目录，包含原纹理")
-    ap.add_argument("--textures", nargs="*", required=True, help="相对路径的纹理列表，如 model.1024/texture_00.png ...")
-    ap.add_argument("--out-dir", required=True, help="输出根目录（模型输出目录）")
-    ap.add_argument("--backend", choices=["jitter", "diffusers"], default=os.environ.get("TEXTURE_BACKEND", "jitter"))
+    ap.add_argument("--template-model-dir", help="模板模型目录，包含原纹理")
+    ap.add_argument("--textures", nargs="*", help="相对路径的纹理列表，如 model.1024/texture_00.png ...")
+    ap.add_argument("--out-dir", help="输出根目录（模型输出目录）")
+    ap.add_argument("--backend", choices=["jitter", "jitter_numpy", "recolor", "diffusers", "diffusers_batch"], default=os.environ.get("TEXTURE_BACKEND", "jitter"))
+    ap.add_argument("--batch-size", type=int, default=int(os.environ.get("DIFFUSERS_BATCH_SIZE", "4")), help="diffusers_batch 的 micro-batch 大小")
+    ap.add_argument("--threads", type=int, default=int(os.environ.get("DIFFUSERS_THREADS", "0")) or None, help="torch CPU 线程数")
+    ap.add_argument("--hue-range", type=float, default=float(os.environ.get("TEXTURE_HUE_RANGE", "0.0")), help="色相随机偏移范围（整圈比例，jitter 后端）")
+    ap.add_argument("--style", default=os.environ.get("TEXTURE_STYLE", "warm"), help="recolor 后端的风格：预设名或风格 JSON 路径")
+    ap.add_argument("--lut-dir", default=None, help="编译后 LUT 的缓存目录，默认读取 TEXTURE_LUT_DIR 或 cache/luts")
+    ap.add_argument("--png-compress-level", type=int, default=None, help="PNG 压缩级别 0-9（jitter_numpy/recolor），默认读取 TEXTURE_PNG_COMPRESS_LEVEL 或 6")
+    ap.add_argument("--tiled", action="store_true", default=os.environ.get("TEXTURE_TILED", "0") == "1", help="使用分块流式引擎（jitter_numpy/diffusers）")
+    ap.add_argument("--tile-size", type=int, default=int(os.environ.get("TEXTURE_TILE_SIZE", "512")))
+    ap.add_argument("--tile-overlap", type=int, default=int(os.environ.get("TEXTURE_TILE_OVERLAP", "32")), help="tile 重叠宽度，重叠区做羽化融合")
+    ap.add_argument("--memory-budget-mb", type=int, default=int(os.environ.get("TEXTURE_MEMORY_BUDGET_MB", "256")), help="每个 worker 的引擎内存预算（MB）")
+    ap.add_argument("--crop-opaque", action="store_true", default=os.environ.get("TEXTURE_CROP_OPAQUE", "0") == "1",
+                    help="只处理 alpha 不透明区域的包围矩形（jitter_numpy/diffusers）")
+    ap.add_argument("--seed", type=int, default=int(os.environ.get("TEXTURE_SEED", "0")), help="基础随机种子（与源纹理内容共同派生每张纹理的种子）")
+    ap.add_argument("--cache-dir", default=None, help="生成纹理缓存目录，默认读取 TEXTURE_CACHE_DIR（未设置则不缓存）")
+    ap.add_argument("--cache-max-mb", type=int, default=None, help="缓存容量上限（MB），默认读取 TEXTURE_CACHE_MAX_MB 或 2048")
+    ap.add_argument("--variant-out-dirs", nargs="+", default=None,
+                    help="多变体：每个目录一个变体（jitter/jitter_numpy），模板纹理只解码一次")
+    ap.add_argument("--preview-levels", type=int, nargs="*", default=[], help="与 --variant-out-dirs 同时写出的预览层级（长边像素）")
+    ap.add_argument("--jobs-file", help="多模型任务清单（JSON），一次加载管线处理全部纹理（diffusers_batch）")
+    ap.add_argument("--tiny", action="store_true", default=os.environ.get("DIFFUSERS_TINY", "0") == "1",
+                    help="diffusers/diffusers_batch 使用本地微型管线（CPU 端到端检查，不下载权重）")
     args = ap.parse_args()
+    cache = cache_from_env(args.cache_dir, args.cache_max_mb)
+    pipe, model_id = None, None
+    if args.tiny and (args.jobs_file or args.backend in ("diffusers", "diffusers_batch")):
+        pipe, _ = tiny_img2img_pipeline()
+        model_id = "tiny:0"
+
+    if args.jobs_file:
+        stats = process_texture_jobs_diffusers_batched(load_jobs_file(Path(args.jobs_file)), args.batch_size, args.threads,
+                                                       pipe=pipe, base_seed=args.seed, cache=cache, model_id=model_id)
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+    if args.variant_out_dirs:
+        if not args.template_model_dir or args.textures is None:
+            ap.error("--variant-out-dirs 需要 --template-model-dir/--textures")
+        if args.backend not in ("jitter", "jitter_numpy"):
+            ap.error("--variant-out-dirs 仅支持 jitter/jitter_numpy 后端")
+        base = Path(args.template_model_dir)
+        rels = process_textures_jitter_variants([base / t for t in args.textures], [Path(d) for d in args.variant_out_dirs],
+                                                hue_range=args.hue_range, compress_level=args.png_compress_level,
+                                                base_seed=args.seed, preview_levels=args.preview_levels)
+        print("\n".join(rels))
+        return
+    if not args.template_model_dir or args.textures is None or not args.out_dir:
+        ap.error("需要 --template-model-dir/--textures/--out-dir，或使用 --jobs-file")
 
     base = Path(args.template_model_dir)
     srcs = [base / t for t in args.textures]
     out = Path(args.out_dir)
+    tile_cfg = None
+    if args.tiled:
+        tile_cfg = TileConfig(tile_size=args.tile_size, overlap=args.tile_overlap,
+                              memory_budget=args.memory_budget_mb * 1024 * 1024)
     if args.backend == "diffusers":
-        rels = process_textures_diffusers(srcs, out)
+        rels = process_textures_diffusers(srcs, out, tile_cfg, crop=args.crop_opaque, base_seed=args.seed, cache=cache,
+                                          pipe=pipe, model_id=model_id)
+    elif args.backend == "diffusers_batch":
+        rels = process_textures_diffusers_batched(srcs, out, args.batch_size, args.threads, base_seed=args.seed, cache=cache,
+                                                  pipe=pipe, model_id=model_id)
+    elif args.backend == "recolor":
+        rels = process_textures_recolor(srcs, out, args.style, compress_level=args.png_compress_level,
+                                        crop=args.crop_opaque, cache=cache, lut_dir=args.lut_dir)
+    elif args.backend == "jitter_numpy":
+        rels = process_textures_jitter(srcs, out, impl="numpy", hue_range=args.hue_range,
+                                       compress_level=args.png_compress_level, tile_cfg=tile_cfg, crop=args.crop_opaque,
+                                       base_seed=args.seed, cache=cache)
     else:
-        rels = process_textures_jitter(srcs, out)
+        rels = process_textures_jitter(srcs, out, hue_range=args.hue_range, base_seed=args.seed, cache=cache)
+    if cache is not None:
+        st = cache.stats()
+        print(f"texture cache: 命中 {st['cache_hits']}，未命中 {st['cache_misses']}", file=sys.stderr)
     print("\n".join(rels))
 
 
@@ -0,0 +1,283 @@
+"""
+动作张量缓存（一次编译，训练/统计直接切片读取）：
+- 编译：遍历 index.json 中所有模型的 Motions，按文件并行（进程池）解析 motion3.json，
+  把每条 Parameter 曲线按固定 fps 重采样（motion_curves.resample_motion：线性/贝塞尔/阶梯/反阶梯段均精确求值）
+- 全局参数词表（所有动作出现过的参数 Id，排序）；所有动作的帧首尾相接写入单个内存映射 float16 数组
+  frames.f16，形状 [total_frames, num_params]；motions.npz 保存每个动作的 offset / length / mask（该动作动画了哪些参数），
+  motion_cache.json 记录词表、fps、逐动作元数据（model_id、分组、名称、时长、Loop、淡入淡出）与解析失败的文件
+- 指纹 = 缓存版本 + fps + index.json 内容 + 每个动作文件的大小/mtime；不变时直接复用，变化时重新编译
+- 编译时各进程的结果先按局部列顺序追加到临时文件，词表确定后再逐动作散布到全局列：父进程内存与数据集大小无关
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from dataset import local_path
+from motion_curves import resample_motion
+
+CACHE_INDEX = "motion_cache.json"
+FRAMES_FILE = "frames.f16"
+ARRAYS_FILE = "motions.npz"
+CACHE_VERSION = 1
+DEFAULT_FPS = 30.0
+STATS_CHUNK_ROWS = 1 << 16
+
+
+def default_cache_dir() -> Path:
+    return Path(os.environ.get("MOTION_CACHE_DIR", "cache/motions"))
+
+
+def motion_entries(index_file: Path, root: Optional[Path] = None) -> List[Dict]:
+    """index.json 中所有动作文件：{model_id, group, name, file, path}（model_path 可为 Windows 风格相对路径）"""
+    data = json.loads(Path(index_file).read_text(encoding="utf-8"))
+    entries: List[Dict] = []
+    for m in data.get("models", []):
+        base = local_path(m["model_path"], root)
+        for group, items in m.get("motions", {}).items():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                f = item.get("File")
+                if f:
+                    entries.append({"model_id": m["model_id"], "group": group, "name": item.get("Name", Path(f).stem),
+                                    "file": f, "path": str(base / local_path(f))})
+    return entries
+
+
+def cache_fingerprint(index_file: Path, entries: List[Dict], fps: float) -> str:
+    h = hashlib.sha256(f"v{CACHE_VERSION}|fps={fps}|".encode())
+    h.update(Path(index_file).read_bytes())
+    for e in entries:
+        try:
+            st = os.stat(e["path"])
+            h.update(f"{e['path']}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            h.update(f"{e['path']}|missing\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _compile_one(path: str, fps: float) -> Optional[Dict]:
+    """子进程：解析并重采样一个动作；float16 局部矩阵 (frames, len(ids))。无法解析时返回 None"""
+    try:
+        motion = json.loads(Path(path).read_text(encoding="utf-8"))
+        r = resample_motion(motion, fps)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    meta = motion.get("Meta", {})
+    r["values"] = r["values"].astype(np.float16)
+    r["fade_in"] = float(meta.get("FadeInTime", -1.0))
+    r["fade_out"] = float(meta.get("FadeOutTime", -1.0))
+    return r
+
+
+def compile_motions(index_file: Path, cache_dir: Path, root: Optional[Path] = None, fps: float = DEFAULT_FPS,
+                    workers: Optional[int] = None) -> Dict:
+    """编译缓存，返回 motion_cache.json 的内容"""
+    t0 = time.perf_counter()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entries = motion_entries(index_file, root)
+    fingerprint = cache_fingerprint(index_file, entries, fps)
+    paths = [e["path"] for e in entries]
+
+    local_tmp = cache_dir / f"local.{os.getpid()}.part"
+    blocks: List[Tuple[int, int, List[str]]] = []
+    motions: List[Dict] = []
+    failed: List[str] = []
+    pos = 0
+    with open(local_tmp, "wb") as fh:
+        if workers == 1 or len(paths) <= 1:
+            results: Iterator = (_compile_one(p, fps) for p in paths)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(_compile_one, paths, [fps] * len(paths), chunksize=16)
+        try:
+            for e, r in zip(entries, results):
+                if r is None:
+                    failed.append(e["path"])
+                    continue
+                fh.write(r["values"].tobytes())
+                blocks.append((pos, r["values"].shape[0], r["ids"]))
+                pos += r["values"].size
+                motions.append({**{k: e[k] for k in ("model_id", "group", "name", "file")},
+                                "duration": r["duration"], "loop": r["loop"], "fade_in": r["fade_in"],
+                                "fade_out": r["fade_out"]})
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    vocab = sorted({pid for _, _, ids in blocks for pid in ids})
+    col = {pid: j for j, pid in enumerate(vocab)}
+    lengths = np.array([n for _, n, _ in blocks], dtype=np.int32)
+    offsets = np.zeros(len(blocks), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    mask = np.zeros((len(blocks), len(vocab)), dtype=bool)
+    total = int(lengths.sum())
+
+    frames_tmp = cache_dir / f"{FRAMES_FILE}.{os.getpid()}.part"
+    if total and vocab:
+        frames = np.memmap(frames_tmp, dtype=np.float16, mode="w+", shape=(total, len(vocab)))
+        local = np.memmap(local_tmp, dtype=np.float16, mode="r", shape=(pos,)) if pos else np.zeros(0, np.float16)
+        for i, (start, n, ids) in enumerate(blocks):
+            cols = np.array([col[pid] for pid in ids], dtype=np.int64)
+            mask[i, cols] = True
+            if len(cols):
+                frames[offsets[i]:offsets[i] + n, cols] = local[start:start + n * len(cols)].reshape(n, len(cols))
+        frames.flush()
+        del frames, local
+    else:
+        frames_tmp.write_bytes(b"")
+    local_tmp.unlink()
+    os.replace(frames_tmp, cache_dir / FRAMES_FILE)
+    arrays_tmp = cache_dir / f"motions.{os.getpid()}.part.npz"
+    np.savez(arrays_tmp, offsets=offsets, lengths=lengths, mask=mask)
+    os.replace(arrays_tmp, cache_dir / ARRAYS_FILE)
+
+    index = {"version": CACHE_VERSION, "fingerprint": fingerprint, "fps": fps, "index_file": str(index_file),
+             "params": vocab, "shape": [total, len(vocab)], "motions": motions, "failed": failed,
+             "compile_seconds": time.perf_counter() - t0}
+    (cache_dir / CACHE_INDEX).write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    return index
+
+
+class MotionCache:
+    """只读缓存视图：frames 为 [total_frames, num_params] float16 内存映射；motion(i) 为第 i 个动作的切片（零拷贝）"""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.index = json.loads((self.cache_dir / CACHE_INDEX).read_text(encoding="utf-8"))
+        self.fps = self.index["fps"]
+        self.params: List[str] = self.index["params"]
+        self.motions: List[Dict] = self.index["motions"]
+        with np.load(self.cache_dir / ARRAYS_FILE) as arrays:
+            self.offsets = arrays["offsets"]
+            self.lengths = arrays["lengths"]
+            self.mask = arrays["mask"]
+        total, num_params = self.index["shape"]
+        self.frames = (np.memmap(self.cache_dir / FRAMES_FILE, dtype=np.float16, mode="r", shape=(total, num_params))
+                       if total and num_params else np.zeros((total, num_params), dtype=np.float16))
+        self._col = {pid: j for j, pid in enumerate(self.params)}
+
+    def __len__(self) -> int:
+        return len(self.motions)
+
+    def column(self, param_id: str) -> Optional[int]:
+        return self._col.get(param_id)
+
+    def motion(self, i: int) -> np.ndarray:
+        o = int(self.offsets[i])
+        return self.frames[o:o + int(self.lengths[i])]
+
+    def param_stats(self, chunk_rows: int = STATS_CHUNK_ROWS) -> Dict[str, Dict]:
+        """逐参数 帧数/均值/标准差/最小/最大（只统计动画了该参数的动作的帧），按行块读取"""
+        p = len(self.params)
+        count = np.zeros(p, dtype=np.int64)
+        s1 = np.zeros(p)
+        s2 = np.zeros(p)
+        lo = np.full(p, np.inf)
+        hi = np.full(p, -np.inf)
+        total = self.index["shape"][0]
+        for a in range(0, total, chunk_rows):
+            rows = np.arange(a, min(total, a + chunk_rows))
+            owners = np.searchsorted(self.offsets, rows, side="right") - 1
+            m = self.mask[owners]
+            x = np.asarray(self.frames[a:a + len(rows)], dtype=np.float64)
+            count += m.sum(axis=0)
+            s1 += np.where(m, x, 0.0).sum(axis=0)
+            s2 += np.where(m, x * x, 0.0).sum(axis=0)
+            lo = np.minimum(lo, np.where(m, x, np.inf).min(axis=0))
+            hi = np.maximum(hi, np.where(m, x, -np.inf).max(axis=0))
+        stats: Dict[str, Dict] = {}
+        for j, pid in enumerate(self.params):
+            n = int(count[j])
+            if n == 0:
+                continue
+            mean = s1[j] / n
+            stats[pid] = {"frames": n, "motions": int(self.mask[:, j].sum()), "mean": float(mean),
+                          "std": float(np.sqrt(max(s2[j] / n - mean * mean, 0.0))),
+                          "min": float(lo[j]), "max": float(hi[j])}
+        return stats
+
+
+def ensure_cache(index_file: Path, cache_dir: Optional[Path] = None, root: Optional[Path] = None,
+                 fps: float = DEFAULT_FPS, workers: Optional[int] = None, force: bool = False) -> MotionCache:
+    """指纹一致时直接打开已有缓存，否则（重新）编译"""
+    cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+    if not force and (cache_dir / CACHE_INDEX).exists():
+        index = json.loads((cache_dir / CACHE_INDEX).read_text(encoding="utf-8"))
+        entries = motion_entries(index_file, root)
+        if index.get("fingerprint") == cache_fingerprint(index_file, entries, fps):
+            return MotionCache(cache_dir)
+    compile_motions(index_file, cache_dir, root, fps, workers)
+    return MotionCache(cache_dir)
+
+
+def naive_load(index_file: Path, root: Optional[Path] = None, fps: float = DEFAULT_FPS) -> int:
+    """对照：每次都逐文件 json.loads 并重采样（编译前 collect_motion_stats/sample_param_sequences 的读取方式）；返回帧数"""
+    frames = 0
+    for e in motion_entries(index_file, root):
+        r = _compile_one(e["path"], fps)
+        frames += 0 if r is None else len(r["values"])
+    return frames
+
+
+def main():
+    ap = argparse.ArgumentParser(description="动作张量缓存（固定 fps 重采样 + 内存映射）")
+    ap.add_argument("--index", default="data/processed/index.json")
+    ap.add_argument("--root", default=None, help="index 中相对 model_path 的根目录（数据集根）")
+    ap.add_argument("--cache", default=None, help="缓存目录（默认 MOTION_CACHE_DIR 或 cache/motions）")
+    ap.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compile", help="编译（指纹未变时复用）")
+    c.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 数）")
+    c.add_argument("--force", action="store_true")
+    sub.add_parser("stats", help="逐参数统计（从缓存读取）")
+    b = sub.add_parser("bench", help="缓存读取 vs 逐文件解析")
+    b.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    root = Path(args.root) if args.root else None
+    index_file = Path(args.index)
+    cache_dir = Path(args.cache) if args.cache else default_cache_dir()
+    if args.cmd == "compile":
+        t0 = time.perf_counter()
+        cache = ensure_cache(index_file, cache_dir, root, args.fps, args.workers, args.force)
+        print(json.dumps({"motions": len(cache), "failed": len(cache.index["failed"]), "params": len(cache.params),
+                          "frames": cache.index["shape"][0], "fps": cache.fps,
+                          "bytes": (cache_dir / FRAMES_FILE).stat().st_size,
+                          "compile_seconds": cache.index["compile_seconds"],
+                          "seconds": time.perf_counter() - t0}, ensure_ascii=False))
+    elif args.cmd == "stats":
+        cache = ensure_cache(index_file, cache_dir, root, args.fps)
+        print(json.dumps(cache.param_stats(), ensure_ascii=False, indent=2))
+    else:
+        t0 = time.perf_counter()
+        naive_frames = naive_load(index_file, root, args.fps)
+        naive = time.perf_counter() - t0
+        cache = ensure_cache(index_file, cache_dir, root, args.fps, args.workers, force=True)
+        t0 = time.perf_counter()
+        cache = ensure_cache(index_file, cache_dir, root, args.fps)
+        reopen = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        cached_frames = sum(int(np.asarray(cache.motion(i), dtype=np.float32).shape[0]) for i in range(len(cache)))
+        read = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        cache.param_stats()
+        stats = time.perf_counter() - t0
+        print(json.dumps({"motions": len(cache), "frames": cached_frames, "naive_frames": naive_frames,
+                          "naive_parse_seconds": naive, "compile_seconds": cache.index["compile_seconds"],
+                          "reopen_seconds": reopen, "read_all_seconds": read, "param_stats_seconds": stats},
+                         ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+motion3 运行时求值（Python 端的“参数在 t 时刻的值”）：
+- MotionEvaluator 构建时为每条曲线预建段起始时间索引（motion_curves.parse_segments），
+  单个时刻用 bisect 二分定位段后纯 Python 标量求值，时间数组用 np.searchsorted 一次向量化求值全部曲线
+- 时间为“动作开始后经过的秒数”：Loop 时对 Duration 取模，否则限制在 [0, Duration]
+- 淡入/淡出与 Cubism 一致：权重为正弦缓动 0.5 - 0.5cos(pi x)，曲线自带 FadeInTime/FadeOutTime 时覆盖动作级设置；
+  淡出以 end_time（动作被停止的时刻）为终点，非循环动作默认为 Duration，循环动作默认不淡出；
+  Parameter 曲线按 base + (曲线值 - base) x 权重 混合，PartOpacity/Model 曲线不参与淡入淡出
+- naive_value 为对原始 Segments 从头线性扫描的朴素实现，用于 bench 对比与结果核对
+"""
+
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from motion_curves import BEZIER, INVERSE_STEPPED, STEPPED, SEGMENT_WIDTH, parse_segments, sample_curves
+
+TimeLike = Union[float, Sequence[float], np.ndarray]
+
+
+def ease_sine(x: np.ndarray) -> np.ndarray:
+    """Cubism 淡入淡出缓动：x<=0 为 0，x>=1 为 1"""
+    return 0.5 - 0.5 * np.cos(np.pi * np.clip(x, 0.0, 1.0))
+
+
+def _bezier1(p0: float, p1: float, p2: float, p3: float, s: float) -> float:
+    r = 1.0 - s
+    return r * r * r * p0 + 3 * r * r * s * p1 + 3 * r * s * s * p2 + s * s * s * p3
+
+
+def _cbrt(x: float) -> float:
+    return math.copysign(abs(x) ** (1.0 / 3.0), x)
+
+
+def bezier_param(t0: float, c1t: float, c2t: float, t1: float, t: float) -> float:
+    """非受限贝塞尔：x(s) = t 在 [0, 1] 内的根（Cardano 公式闭式求解，与 Cubism 运行时一致）"""
+    a = t1 - t0 + 3 * (c1t - c2t)
+    b = 3 * (t0 - 2 * c1t + c2t)
+    c = 3 * (c1t - t0)
+    d = t0 - t
+    eps = 1e-9
+    if abs(a) < eps:
+        if abs(b) < eps:
+            return min(max(-d / c, 0.0), 1.0) if abs(c) > eps else 0.0
+        disc = max(c * c - 4 * b * d, 0.0) ** 0.5
+        roots = ((-c + disc) / (2 * b), (-c - disc) / (2 * b))
+    else:
+        b, c, d = b / a, c / a, d / a
+        p = (3 * c - b * b) / 3
+        q = (2 * b ** 3 - 9 * b * c + 27 * d) / 27
+        disc = q * q / 4 + p ** 3 / 27
+        shift = -b / 3
+        if disc > 0:
+            sq = disc ** 0.5
+            roots = (_cbrt(-q / 2 + sq) + _cbrt(-q / 2 - sq) + shift,)
+        else:
+            r = (-p / 3) ** 0.5 if p < 0 else 0.0
+            phi = math.acos(min(max(-q / (2 * r ** 3), -1.0), 1.0)) if r > 0 else 0.0
+            roots = tuple(2 * r * math.cos((phi + 2 * math.pi * k) / 3) + shift for k in range(3))
+    best = min(roots, key=lambda x: abs(min(max(x, 0.0), 1.0) - x))
+    return min(max(best, 0.0), 1.0)
+
+
+class MotionEvaluator:
+    def __init__(self, motion: Dict):
+        meta = motion.get("Meta", {})
+        self.restricted = bool(meta.get("AreBeziersRestricted", False))
+        self.loop = bool(meta.get("Loop", False))
+        self.fade_in = float(meta.get("FadeInTime", 0.0) or 0.0)
+        self.fade_out = float(meta.get("FadeOutTime", 0.0) or 0.0)
+        self.targets: List[str] = []
+        self.ids: List[str] = []
+        self.curves: List[Dict[str, np.ndarray]] = []
+        self.curve_fades: List[tuple] = []
+        for c in motion.get("Curves", []):
+            curve = parse_segments(c.get("Segments", []))
+            if not len(curve["t0"]):
+                continue
+            self.targets.append(c.get("Target", "Parameter"))
+            self.ids.append(c.get("Id", ""))
+            self.curves.append(curve)
+            self.curve_fades.append((c.get("FadeInTime"), c.get("FadeOutTime")))
+        ends = [float(c["t1"][-1]) for c in self.curves]
+        self.duration = float(meta.get("Duration") or max(ends, default=0.0))
+        self._index = {(tg, pid): k for k, (tg, pid) in enumerate(zip(self.targets, self.ids))}
+        # 标量路径用的 Python 列表（避免逐次访问 numpy 标量）
+        self._starts = [c["t0"].tolist() for c in self.curves]
+        self._rows = [list(zip(*(c[key].tolist() for key in ("type", "t0", "v0", "t1", "v1", "c1t", "c1v", "c2t", "c2v"))))
+                      for c in self.curves]
+
+    @classmethod
+    def from_file(cls, path: Path) -> "MotionEvaluator":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def curve_index(self, param_id: str, target: str = "Parameter") -> int:
+        return self._index[(target, param_id)]
+
+    def local_time(self, t: TimeLike) -> np.ndarray:
+        """动作开始后经过的时间 -> 曲线时间（Loop 取模，否则限制在 [0, Duration]）"""
+        t = np.asarray(t, dtype=np.float64)
+        if self.loop and self.duration > 0:
+            return np.mod(np.maximum(t, 0.0), self.duration)
+        return np.clip(t, 0.0, self.duration)
+
+    def _local1(self, t: float) -> float:
+        if self.loop and self.duration > 0:
+            return math.fmod(max(t, 0.0), self.duration)
+        return min(max(t, 0.0), self.duration)
+
+    def curve_value(self, k: int, t: float) -> float:
+        """第 k 条曲线在曲线时间 t 的值：段起始时间上 bisect 定位 + 标量求值"""
+        starts, rows = self._starts[k], self._rows[k]
+        i = min(max(bisect_right(starts, t) - 1, 0), len(starts) - 1)
+        kind, t0, v0, t1, v1, c1t, c1v, c2t, c2v = rows[i]
+        t = min(max(t, t0), t1)
+        if kind == STEPPED:
+            return v0
+        if kind == INVERSE_STEPPED:
+            return v1
+        u = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        if kind != BEZIER:
+            return v0 + u * (v1 - v0)
+        if not self.restricted:
+            u = bezier_param(t0, c1t, c2t, t1, t)
+        return _bezier1(v0, c1v, c2v, v1, u)
+
+    def value(self, param_id: str, t: float, target: str = "Parameter") -> float:
+        """单个参数在动作时间 t 的曲线值（未混合淡入淡出）"""
+        return self.curve_value(self.curve_index(param_id, target), self._local1(float(t)))
+
+    def values_at(self, t: float, target: str = "Parameter") -> Dict[str, float]:
+        """t 时刻某类目标全部曲线的值 {Id: 值}"""
+        local = self._local1(float(t))
+        return {pid: self.curve_value(k, local) for k, (tg, pid) in enumerate(zip(self.targets, self.ids))
+                if tg == target}
+
+    def sample(self, times: TimeLike, ids: Optional[Sequence[str]] = None, target: str = "Parameter") -> np.ndarray:
+        """(K, T) 曲线值：所有（或指定 ids 的）曲线在时间数组上一次向量化求值"""
+        rows = ([k for k, tg in enumerate(self.targets) if tg == target] if ids is None
+                else [self.curve_index(pid, target) for pid in ids])
+        return sample_curves([self.curves[k] for k in rows], self.local_time(np.atleast_1d(times)), self.restricted)
+
+    def fade_weights(self, times: TimeLike, ids: Optional[Sequence[str]] = None,
+                     end_time: Optional[float] = None) -> np.ndarray:
+        """(K, T) 淡入淡出权重；end_time 为动作结束时刻（非循环默认 Duration，循环默认 None 即不淡出）"""
+        t = np.atleast_1d(np.asarray(times, dtype=np.float64))
+        rows = ([k for k, tg in enumerate(self.targets) if tg == "Parameter"] if ids is None
+                else [self.curve_index(pid) for pid in ids])
+        if end_time is None and not self.loop:
+            end_time = self.duration
+        out = np.ones((len(rows), len(t)))
+        for r, k in enumerate(rows):
+            fin, fout = self.curve_fades[k]
+            fin = self.fade_in if fin is None else float(fin)
+            fout = self.fade_out if fout is None else float(fout)
+            if fin > 0:
+                out[r] *= ease_sine(t / fin)
+            if fout > 0 and end_time is not None:
+                out[r] *= ease_sine((end_time - t) / fout)
+        return out
+
+    def blend(self, times: TimeLike, base: Optional[Dict[str, float]] = None, ids: Optional[Sequence[str]] = None,
+              weight: float = 1.0, end_time: Optional[float] = None) -> np.ndarray:
+        """(K, T) 应用到模型后的参数值：base + (曲线值 - base) x 权重 x 淡入淡出；base 缺省为 0"""
+        ids = list(ids) if ids is not None else [pid for tg, pid in zip(self.targets, self.ids) if tg == "Parameter"]
+        values = self.sample(times, ids)
+        b = np.array([(base or {}).get(pid, 0.0) for pid in ids])[:, None]
+        return b + (values - b) * weight * self.fade_weights(times, ids, end_time)
+
+
+def naive_value(segments: Sequence[float], t: float, restricted: bool = True) -> float:
+    """朴素实现：从头线性扫描原始 Segments 直到包含 t 的段（段内求值与 MotionEvaluator 相同）"""
+    t0, v0 = float(segments[0]), float(segments[1])
+    i = 2
+    while i < len(segments):
+        kind = int(segments[i])
+        width = SEGMENT_WIDTH[kind]
+        t1, v1 = float(segments[i + width - 1]), float(segments[i + width])
+        if t <= t1 or i + 1 + width >= len(segments):
+            if kind == STEPPED:
+                return v0
+            if kind == INVERSE_STEPPED:
+                return v1
+            u = min(max((t - t0) / (t1 - t0), 0.0), 1.0) if t1 > t0 else 1.0
+            if kind == BEZIER:
+                c1t, c1v, c2t, c2v = (float(x) for x in segments[i + 1:i + 5])
+                if not restricted:
+                    u = bezier_param(t0, c1t, c2t, t1, min(max(t, t0), t1))
+                return _bezier1(v0, c1v, c2v, v1, u)
+            return v0 + u * (v1 - v0)
+        t0, v0 = t1, v1
+        i += 1 + width
+    return v0
+
+
+def bench(paths: Sequence[Path], queries: int = 2000, seed: int = 0) -> Dict:
+    """每条曲线 queries 个时刻：逐点 bisect / 逐点线性扫描 / 整个数组向量化 三种求值的耗时，以及结果最大差值"""
+    rng = np.random.default_rng(seed)
+    stats = {"motions": 0, "curves": 0, "segments": 0, "queries": 0, "max_abs_diff": 0.0,
+             "bisect_seconds": 0.0, "naive_seconds": 0.0, "vector_seconds": 0.0}
+    for path in paths:
+        motion = json.loads(Path(path).read_text(encoding="utf-8"))
+        ev = MotionEvaluator(motion)
+        raw = [c["Segments"] for c in motion.get("Curves", []) if len(c.get("Segments", [])) >= 2]
+        if len(raw) != len(ev.curves):
+            continue
+        times = np.sort(rng.uniform(0, ev.duration, queries))
+        tl = times.tolist()
+        stats["motions"] += 1
+        stats["curves"] += len(raw)
+        stats["segments"] += sum(len(c["t0"]) for c in ev.curves)
+        stats["queries"] += len(tl) * len(raw)
+        t0 = time.perf_counter()
+        fast = [[ev.curve_value(k, t) for t in tl] for k in range(len(raw))]
+        stats["bisect_seconds"] += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        slow = [[naive_value(seg, t, ev.restricted) for t in tl] for seg in raw]
+        stats["naive_seconds"] += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        vec = sample_curves(ev.curves, times, ev.restricted)
+        stats["vector_seconds"] += time.perf_counter() - t0
+        fast = np.array(fast)
+        stats["max_abs_diff"] = max(stats["max_abs_diff"], float(np.abs(fast - vec).max()),
+                                    float(np.abs(fast - np.array(slow)).max()))
+    q = max(stats["queries"], 1)
+    stats.update({
+        "bisect_us_per_query": stats["bisect_seconds"] / q * 1e6,
+        "naive_us_per_query": stats["naive_seconds"] / q * 1e6,
+        "vector_us_per_query": stats["vector_seconds"] / q * 1e6,
+        "single_speedup": stats["naive_seconds"] / max(stats["bisect_seconds"], 1e-12),
+        "array_speedup": stats["naive_seconds"] / max(stats["vector_seconds"], 1e-12),
+    })
+    return stats
+
+
+def longest_motions(index_file: Path, root: Optional[Path], top: int) -> List[Path]:
+    """index 中段数最多的 top 个动作文件"""
+    from motion_cache import motion_entries
+    sized = []
+    for e in motion_entries(index_file, root):
+        try:
+            motion = json.loads(Path(e["path"]).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        sized.append((int(motion.get("Meta", {}).get("TotalSegmentCount") or
+                          sum(len(c.get("Segments", [])) for c in motion.get("Curves", []))), e["path"]))
+    sized.sort(reverse=True)
+    return [Path(p) for _, p in sized[:top]]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="motion3 运行时求值")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("eval", help="输出指定时刻的参数值")
+    e.add_argument("motion", help="motion3.json 路径")
+    e.add_argument("--time", type=float, nargs="+", required=True, help="动作开始后经过的秒数")
+    e.add_argument("--ids", nargs="*", default=None, help="参数 Id（默认全部）")
+    e.add_argument("--blend", action="store_true", help="应用淡入淡出（base 为 0）")
+    e.add_argument("--end-time", type=float, default=None, help="动作停止时刻（淡出终点）")
+    b = sub.add_parser("bench", help="数据集中最长动作上的 bisect/向量化 vs 线性扫描基准")
+    b.add_argument("--index", default="data/processed/index.json")
+    b.add_argument("--root", default=None, help="index 中相对 model_path 的根目录（数据集根）")
+    b.add_argument("--top", type=int, default=20, help="取段数最多的动作数")
+    b.add_argument("--queries", type=int, default=2000, help="每条曲线的查询时刻数")
+    args = ap.parse_args()
+
+    if args.cmd == "eval":
+        ev = MotionEvaluator.from_file(Path(args.motion))
+        ids = args.ids or [pid for tg, pid in zip(ev.targets, ev.ids) if tg == "Parameter"]
+        values = (ev.blend(args.time, ids=ids, end_time=args.end_time) if args.blend
+                  else ev.sample(args.time, ids))
+        print(json.dumps({"duration": ev.duration, "loop": ev.loop,
+                          "values": [{"time": t, **{pid: round(float(values[k, j]), 6) for k, pid in enumerate(ids)}}
+                                     for j, t in enumerate(args.time)]}, ensure_ascii=False, indent=2))
+    else:
+        paths = longest_motions(Path(args.index), Path(args.root) if args.root else None, args.top)
+        print(json.dumps(bench(paths, args.queries), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+纹理清单的 tar 分片导出与流式读取（WebDataset 风格）：
+- write：将 lora_texture_manifest.json 的 train/val 纹理按清单顺序打包为顺序 tar 分片 <split>-000000.tar ...
+  每个样本两个成员：<key>.png（原始 PNG 字节，不重新编码）与 <key>.json（model_id、模型内相对路径、尺寸、split），
+  分片大小可配置；<split>.json 记录分片列表、样本数与缺失文件。产物不再依赖原始绝对路径，可直接拷贝到其他机器
+- TarShardDataset / iter_samples：按 (seed, epoch) 打乱分片顺序，分片内顺序流式读取（tarfile 流模式），
+  可选样本级洗牌缓冲；多 DataLoader worker 时按分片划分，保证每个样本每轮只读一次
+  默认变换产出 {"__key__", "image": uint8 (H,W,4), model_id/texture/width/height/split}（不含 PNG 字节），
+  纹理尺寸各异，DataLoader 成批时使用 collate_samples（同尺寸堆叠为张量，否则保留列表）
+- read：遍历一轮，报告 样本/秒 与 MB/秒
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+import argparse
+import io
+import json
+import random
+import tarfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from dataset import load_split_manifest, maybe_import_torch
+
+SHARD_BYTES = 256 << 20
+
+torch, _ = maybe_import_torch()
+_IterableDataset = torch.utils.data.IterableDataset if torch is not None else object
+
+
+class ShardWriter:
+    """顺序写出 tar 分片：当前分片超过 shard_bytes 时在样本边界切换到下一个"""
+
+    def __init__(self, out_dir: Path, prefix: str, shard_bytes: int = SHARD_BYTES):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.shard_bytes = shard_bytes
+        self.shards: List[Dict] = []
+        self._tar: Optional[tarfile.TarFile] = None
+
+    def _open_next(self) -> None:
+        self.close()
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._tar = tarfile.open(self.out_dir / name, "w")
+        self.shards.append({"name": name, "samples": 0, "bytes": 0})
+
+    def _add(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def write(self, key: str, files: Dict[str, bytes]) -> None:
+        if self._tar is None or self.shards[-1]["bytes"] >= self.shard_bytes:
+            self._open_next()
+        for ext, data in files.items():
+            self._add(f"{key}.{ext}", data)
+        cur = self.shards[-1]
+        cur["samples"] += 1
+        cur["bytes"] += sum(len(d) + 512 for d in files.values())
+
+    def close(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+            cur = self.shards[-1]
+            cur["bytes"] = (self.out_dir / cur["name"]).stat().st_size
+
+
+def write_split(manifest_file: Path, split: str, out_dir: Path, root: Optional[Path] = None,
+                shard_bytes: int = SHARD_BYTES) -> Dict:
+    writer = ShardWriter(out_dir, split, shard_bytes)
+    missing: List[str] = []
+    samples = 0
+    for e in load_split_manifest(manifest_file, split, root):
+        src = Path(e["path"])
+        try:
+            data = src.read_bytes()
+            with Image.open(io.BytesIO(data)) as img:
+                w, h = img.size
+        except (OSError, ValueError):
+            missing.append(e["path"])
+            continue
+        meta = {"model_id": e["model_id"], "texture": e["texture"], "width": w, "height": h, "split": split}
+        writer.write(f"{samples:07d}", {"png": data, "json": json.dumps(meta, ensure_ascii=False).encode("utf-8")})
+        samples += 1
+    writer.close()
+    index = {"split": split, "samples": samples, "shards": writer.shards, "missing": missing}
+    (Path(out_dir) / f"{split}.json").write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    return index
+
+
+def iter_tar(path: Path) -> Iterator[Dict]:
+    """流式读取一个分片，按 key 聚合相邻成员：{"__key__": key, "png": bytes, "json": dict}"""
+    sample: Dict = {}
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, _, ext = member.name.partition(".")
+            if sample and sample["__key__"] != key:
+                yield sample
+                sample = {}
+            data = tar.extractfile(member).read()
+            sample["__key__"] = key
+            sample[ext] = json.loads(data) if ext == "json" else data
+    if sample:
+        yield sample
+
+
+def shard_order(shards: Sequence[str], seed: int, epoch: int, shuffle: bool = True) -> List[str]:
+    order = list(shards)
+    if shuffle:
+        random.Random(f"{seed}:{epoch}").shuffle(order)
+    return order
+
+
+def iter_samples(shard_dir: Path, split: str = "train", seed: int = 0, epoch: int = 0, shuffle_shards: bool = True,
+                 buffer: int = 0, worker: int = 0, num_workers: int = 1) -> Iterator[Dict]:
+    """一轮样本流：分片顺序按 (seed, epoch) 打乱后按 worker 轮流划分；buffer>0 时做样本级洗牌缓冲"""
+    index = json.loads((Path(shard_dir) / f"{split}.json").read_text(encoding="utf-8"))
+    order = shard_order([s["name"] for s in index["shards"]], seed, epoch, shuffle_shards)[worker::num_workers]
+    rng = random.Random(f"{seed}:{epoch}:{worker}")
+    pool: List[Dict] = []
+    for name in order:
+        for sample in iter_tar(Path(shard_dir) / name):
+            if buffer <= 0:
+                yield sample
+                continue
+            pool.append(sample)
+            if len(pool) >= buffer:
+                yield pool.pop(rng.randrange(len(pool)))
+    rng.shuffle(pool)
+    yield from pool
+
+
+def decode_rgba(sample: Dict) -> Dict:
+    """默认变换：PNG 字节解码为 uint8 (H,W,4) 数组，元数据展开为普通字段，丢弃 PNG 字节"""
+    with Image.open(io.BytesIO(sample["png"])) as img:
+        image = np.array(img.convert("RGBA"))  # 可写副本（torch.from_numpy 需要）
+    return {"__key__": sample["__key__"], "image": image, **sample.get("json", {})}
+
+
+def collate_samples(batch: List[Dict]) -> Dict:
+    """DataLoader 的 collate_fn：image 尺寸一致时堆叠为 (N,H,W,4) uint8 张量，否则保留数组列表；其余字段为列表"""
+    out: Dict = {k: [b[k] for b in batch] for k in batch[0]}
+    images = out.get("image")
+    if images and isinstance(images[0], np.ndarray) and all(im.shape == images[0].shape for im in images):
+        out["image"] = torch.from_numpy(np.stack(images)) if torch is not None else np.stack(images)
+    return out
+
+
+class TarShardDataset(_IterableDataset):
+    """PyTorch IterableDataset：多 worker 时每个 worker 读取不同分片；set_epoch 切换分片顺序"""
+
+    def __init__(self, shard_dir: Path, split: str = "train", seed: int = 0, shuffle_shards: bool = True,
+                 buffer: int = 64, transform: Optional[Callable[[Dict], Dict]] = decode_rgba):
+        self.shard_dir = Path(shard_dir)
+        self.split = split
+        self.seed, self.epoch = seed, 0
+        self.shuffle_shards = shuffle_shards
+        self.buffer = buffer
+        self.transform = transform
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[Dict]:
+        info = torch.utils.data.get_worker_info() if torch is not None else None
+        worker, num_workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        for sample in iter_samples(self.shard_dir, self.split, self.seed, self.epoch, self.shuffle_shards,
+                                   self.buffer, worker, num_workers):
+            yield self.transform(sample) if self.transform else sample
+
+
+def main():
+    ap = argparse.ArgumentParser(description="纹理清单的 tar 分片导出与读取")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("write", help="按清单写出 tar 分片")
+    w.add_argument("--manifest", default="experiments/lora_texture_manifest.json")
+    w.add_argument("--root", default=None, help="清单中相对路径的根目录（数据集根）")
+    w.add_argument("--out", default="data/tar_shards")
+    w.add_argument("--splits", nargs="+", default=["train", "val"])
+    w.add_argument("--shard-mb", type=int, default=SHARD_BYTES >> 20)
+    r = sub.add_parser("read", help="流式读取一轮并报告吞吐")
+    r.add_argument("--shards", default="data/tar_shards")
+    r.add_argument("--split", default="train")
+    r.add_argument("--buffer", type=int, default=0, help="样本级洗牌缓冲大小")
+    r.add_argument("--decode", action="store_true", help="同时解码 PNG")
+    args = ap.parse_args()
+
+    if args.cmd == "write":
+        for split in args.splits:
+            index = write_split(Path(args.manifest), split, Path(args.out), Path(args.root) if args.root else None,
+                                args.shard_mb << 20)
+            print(json.dumps({"split": split, "samples": index["samples"], "shards": len(index["shards"]),
+                              "bytes": sum(s["bytes"] for s in index["shards"]), "missing": len(index["missing"])},
+                             ensure_ascii=False))
+    else:
+        t0 = time.perf_counter()
+        n = nbytes = 0
+        for sample in iter_samples(Path(args.shards), args.split, buffer=args.buffer):
+            n += 1
+            nbytes += len(sample["png"])
+            if args.decode:
+                decode_rgba(sample)
+        secs = time.perf_counter() - t0
+        print(json.dumps({"samples": n, "seconds": secs, "samples_per_sec": n / secs if secs else 0.0,
+                          "mb_per_sec": nbytes / (1 << 20) / secs if secs else 0.0}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
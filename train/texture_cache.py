@@ -0,0 +1,182 @@
+"""
+生成纹理的内容寻址缓存：
+- 键 = sha256(源纹理内容哈希, 后端, 后端参数, 种子, 模型/LoRA 标识) 的规范化 JSON
+- 命中时以硬链接物化到输出路径（跨设备或不支持硬链接时退回复制），不再重新计算
+- 按总字节数做 LRU 淘汰（以文件 mtime 作为最近使用时间，命中时刷新）；进程内维护累计大小，
+  只有超出容量时才扫描目录，写入 N 个条目不再是 O(N × 缓存条目数) 次文件系统调用
+- 每个任务的随机种子由 (基础种子, 源纹理哈希) 派生：同一内容 + 同一基础种子 -> 同一结果，可复现也可命中缓存
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+HASH_CHUNK = 1 << 20
+# 超出容量后淘汰到该比例，满载时不必每次写入都扫描
+EVICT_LOW_WATER = 0.9
+
+# 进程内文件哈希备忘：(路径, 大小, mtime_ns) -> sha256，同一模板纹理在一个进程内只读一次
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_digest(path: Path) -> str:
+    st = path.stat()
+    memo_key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    digest = _DIGESTS.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        digest = _DIGESTS[memo_key] = h.hexdigest()
+    return digest
+
+
+def model_fingerprint(model_id: Optional[str], lora_path: Optional[str]) -> Dict[str, Optional[str]]:
+    """模型标识：model_id 原样；LoRA 为文件时取内容哈希（同名覆盖训练后自动失效），否则取路径"""
+    lora = None
+    if lora_path:
+        p = Path(lora_path)
+        lora = file_digest(p) if p.is_file() else str(p)
+    return {"model_id": model_id, "lora": lora}
+
+
+def job_seed(base_seed: int, src_digest: str) -> int:
+    """派生 32 位任务种子（适用于 random.Random 与 torch.Generator.manual_seed）"""
+    return int.from_bytes(hashlib.sha256(f"{base_seed}:{src_digest}".encode()).digest()[:4], "little")
+
+
+def cache_key(src_digest: str, backend: str, params: Dict[str, Any], seed: Optional[int],
+              model: Optional[Dict[str, Any]] = None) -> str:
+    payload = {"src": src_digest, "backend": backend, "params": params, "seed": seed, "model": model}
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def release_output(dst: Path) -> None:
+    """写输出前删除已有文件：它可能是缓存条目的硬链接，原地覆盖会同时改写缓存内容"""
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+
+
+def _materialize(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    release_output(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class TextureCache:
+    """磁盘缓存目录结构：<root>/<key[:2]>/<key>.png"""
+
+    def __init__(self, root: Path, max_bytes: int = 2 << 30):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None  # 估计的缓存总字节数（其他进程的写入在下次扫描时校正）
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.png"
+
+    def fetch(self, key: str, dst: Path) -> bool:
+        """命中则硬链接到 dst 并刷新 LRU 时间，返回 True"""
+        entry = self.path_for(key)
+        try:
+            os.utime(entry)
+            _materialize(entry, dst)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key: str, produced: Path) -> None:
+        """将刚生成的 dst 链接进缓存（临时名 + os.replace，并发写入同一键时保持原子），随后按容量淘汰"""
+        entry = self.path_for(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            os.link(produced, tmp)
+        except OSError:
+            shutil.copyfile(produced, tmp)
+        try:
+            replaced = entry.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, entry)
+        size = entry.stat().st_size
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan()[1]
+            else:
+                self._total += size - replaced
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan(self) -> Tuple[list, int]:
+        entries = []
+        total = 0
+        for p in self.root.glob("*/*.png"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, p))
+            total += st.st_size
+        return entries, total
+
+    def evict(self) -> int:
+        """总大小超过 max_bytes 时按 mtime 从旧到新删除到 max_bytes × EVICT_LOW_WATER；返回删除的条目数"""
+        entries, total = self._scan()
+        removed = 0
+        if total <= self.max_bytes:
+            with self._lock:
+                self._total = total
+            return 0
+        target = int(self.max_bytes * EVICT_LOW_WATER)
+        for _, size, p in sorted(entries):
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._total = total
+        return removed
+
+    def get_or_create(self, key: str, dst: Path, produce: Callable[[Path], Any]) -> bool:
+        """命中则物化并返回 True；否则调用 produce(dst) 生成后写入缓存，返回 False"""
+        if self.fetch(key, dst):
+            return True
+        release_output(dst)
+        produce(dst)
+        self.store(key, dst)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_dir": str(self.root)}
+
+
+def cache_from_env(cache_dir: Optional[str] = None, max_mb: Optional[int] = None) -> Optional[TextureCache]:
+    """显式参数优先，其次环境变量 TEXTURE_CACHE_DIR / TEXTURE_CACHE_MAX_MB；未配置目录时不启用缓存"""
+    cache_dir = cache_dir or os.environ.get("TEXTURE_CACHE_DIR")
+    if not cache_dir:
+        return None
+    if max_mb is None:
+        max_mb = int(os.environ.get("TEXTURE_CACHE_MAX_MB", "2048"))
+    return TextureCache(Path(cache_dir), max_mb << 20)
@@ -0,0 +1,171 @@
+"""
+基于 3D 颜色查找表（LUT）的重着色：
+- 风格 = 一组顺序执行的颜色运算（色相旋转、亮度/饱和度、3x3 矩阵、色调曲线、调色板替换），
+  以 JSON 描述（内置预设名或 JSON 文件路径）
+- 编译：在全部 2^24 个 RGB 取值上分块求值，得到稠密 LUT（uint32，按 R | G<<8 | B<<16 索引，值为打包的 RGB），
+  以风格内容哈希为键缓存到磁盘（.npy），再次使用时直接内存映射加载
+- 应用：每个像素一次查表（RGBA 缓冲的 uint32 视图去掉 alpha 字节即为索引），只写回 alpha>0 的像素，alpha 逐位不变
+新风格的代价是一次 LUT 编译，而不是一次模型推理。
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from texture_ops import CHUNK_ROWS, brightness_matrix, hue_matrix, saturation_matrix
+
+# LUT 格式版本：编译逻辑变化时递增，使旧缓存失效
+LUT_VERSION = 1
+LUT_ENTRIES = 1 << 24
+# 编译时每块求值的颜色数（float32 临时缓冲约 12 字节/色）
+COMPILE_CHUNK = 1 << 20
+ALPHA_MASK = np.uint32(0xFF000000)
+RGB_MASK = np.uint32(0x00FFFFFF)
+
+PRESETS: Dict[str, List[Dict[str, Any]]] = {
+    "warm": [
+        {"op": "curve", "channel": "r", "points": [[0, 0], [0.5, 0.56], [1, 1]]},
+        {"op": "curve", "channel": "b", "points": [[0, 0], [0.5, 0.44], [1, 0.95]]},
+    ],
+    "cool": [
+        {"op": "curve", "channel": "r", "points": [[0, 0], [0.5, 0.45], [1, 0.96]]},
+        {"op": "curve", "channel": "b", "points": [[0, 0], [0.5, 0.56], [1, 1]]},
+    ],
+    "pastel": [
+        {"op": "saturation", "value": 0.7},
+        {"op": "curve", "channel": "rgb", "points": [[0, 0.08], [0.5, 0.6], [1, 1]]},
+    ],
+    "noir": [
+        {"op": "saturation", "value": 0.0},
+        {"op": "curve", "channel": "rgb", "points": [[0, 0], [0.25, 0.18], [0.75, 0.85], [1, 1]]},
+    ],
+    "hue_shift_60": [{"op": "hue", "delta": 1 / 6}],
+    "hue_shift_180": [{"op": "hue", "delta": 0.5}],
+}
+
+
+def load_style(style: str) -> Dict[str, Any]:
+    """风格：内置预设名，或 JSON 文件（{"name": ..., "ops": [...]} 或直接为 ops 列表）"""
+    if style in PRESETS:
+        return {"name": style, "ops": PRESETS[style]}
+    path = Path(style)
+    if not path.exists():
+        raise ValueError(f"未知风格: {style}（可用预设: {', '.join(sorted(PRESETS))}，或提供 JSON 文件路径）")
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, list):
+        data = {"name": path.stem, "ops": data}
+    data.setdefault("name", path.stem)
+    return data
+
+
+def style_key(style: Dict[str, Any]) -> str:
+    blob = json.dumps({"v": LUT_VERSION, "ops": style["ops"]}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _hex_rgb(value) -> np.ndarray:
+    if isinstance(value, str):
+        v = value.lstrip("#")
+        return np.array([int(v[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+_CHANNELS = {"r": [0], "g": [1], "b": [2], "rgb": [0, 1, 2]}
+
+
+def _apply_op(rgb: np.ndarray, op: Dict[str, Any]) -> np.ndarray:
+    """对 (N,3) float32（0..255）执行单个运算"""
+    kind = op["op"]
+    if kind in ("hue", "saturation", "brightness", "matrix"):
+        if kind == "hue":
+            m = hue_matrix(float(op["delta"]))
+        elif kind == "saturation":
+            m = saturation_matrix(float(op["value"]))
+        elif kind == "brightness":
+            m = brightness_matrix(float(op["value"]))
+        else:
+            m = np.asarray(op["m"], dtype=np.float32)
+        return rgb @ m.T
+    if kind == "curve":
+        # 控制点为 0..1 的 (输入, 输出)，分段线性插值
+        pts = np.asarray(op["points"], dtype=np.float32)
+        xs, ys = pts[:, 0] * 255.0, pts[:, 1] * 255.0
+        np.clip(rgb, 0.0, 255.0, out=rgb)
+        for c in _CHANNELS[op.get("channel", "rgb")]:
+            rgb[:, c] = np.interp(rgb[:, c], xs, ys)
+        return rgb
+    if kind == "palette":
+        # 调色板替换：与源色距离在 radius（0..1，按 RGB 对角线归一）内的颜色平移 (dst - src)，
+        # 权重随距离平滑衰减，保留原有明暗层次；多组权重之和超过 1 时归一
+        radius = float(op.get("radius", 0.2)) * 255.0 * np.sqrt(3.0)
+        shift = np.zeros_like(rgb)
+        total = np.zeros(len(rgb), dtype=np.float32)
+        for src, dst in op["pairs"]:
+            s, d = _hex_rgb(src), _hex_rgb(dst)
+            dist = np.sqrt(((rgb - s) ** 2).sum(axis=1))
+            w = np.clip(1.0 - dist / radius, 0.0, 1.0) ** 2
+            shift += w[:, None] * (d - s)
+            total += w
+        norm = np.maximum(total, 1.0)
+        return rgb + shift / norm[:, None]
+    raise ValueError(f"未知的颜色运算: {kind}")
+
+
+def apply_style(rgb: np.ndarray, style: Dict[str, Any]) -> np.ndarray:
+    """直接对 (N,3) 颜色求值风格（LUT 编译与精度校验共用），返回 0..255 的 uint8"""
+    rgb = rgb.astype(np.float32)
+    for op in style["ops"]:
+        rgb = _apply_op(rgb, op)
+    rgb += 0.5
+    np.clip(rgb, 0.0, 255.0, out=rgb)
+    return rgb.astype(np.uint8)
+
+
+def compile_lut(style: Dict[str, Any]) -> np.ndarray:
+    """在全部 2^24 个 RGB 上求值风格，返回 uint32 LUT（值为 R | G<<8 | B<<16）"""
+    lut = np.empty(LUT_ENTRIES, dtype=np.uint32)
+    for start in range(0, LUT_ENTRIES, COMPILE_CHUNK):
+        idx = np.arange(start, start + COMPILE_CHUNK, dtype=np.uint32)
+        rgb = np.stack([idx & 0xFF, (idx >> 8) & 0xFF, (idx >> 16) & 0xFF], axis=1)
+        q = apply_style(rgb, style).astype(np.uint32)
+        lut[start:start + COMPILE_CHUNK] = q[:, 0] | (q[:, 1] << 8) | (q[:, 2] << 16)
+    return lut
+
+
+def lut_cache_dir(path: Optional[str] = None) -> Path:
+    """显式参数优先，其次环境变量 TEXTURE_LUT_DIR，默认 cache/luts"""
+    return Path(path or os.environ.get("TEXTURE_LUT_DIR", "cache/luts"))
+
+
+def get_lut(style: Dict[str, Any], cache_dir: Optional[Path] = None) -> np.ndarray:
+    """读取（内存映射）或编译并缓存 LUT"""
+    cache_dir = lut_cache_dir(str(cache_dir) if cache_dir else None)
+    path = cache_dir / f"{style_key(style)}.npy"
+    if path.exists():
+        return np.load(path, mmap_mode="r")
+    lut = compile_lut(style)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.part.npy")
+    np.save(tmp, lut)
+    os.replace(tmp, path)
+    (cache_dir / f"{path.stem}.json").write_text(json.dumps(style, ensure_ascii=False, indent=2), encoding="utf-8")
+    return lut
+
+
+def apply_lut(rgba: np.ndarray, lut: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """就地对 HxWx4 uint8 缓冲的不透明像素查表重着色；全透明行块跳过"""
+    px = rgba.reshape(rgba.shape[0], -1).view(np.uint32)
+    for y in range(0, px.shape[0], chunk_rows):
+        band = px[y:y + chunk_rows]
+        alpha = band & ALPHA_MASK
+        mask = alpha != 0
+        if not mask.any():
+            continue
+        out = lut[band & RGB_MASK]
+        out |= alpha
+        np.copyto(band, out, where=mask)
+    return rgba
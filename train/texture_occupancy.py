@@ -0,0 +1,146 @@
+"""
+图集占用分析：
+- 将 alpha 通道按 cell 做块归约（向量化 reshape + max），得到占用网格
+- 基于行程（run）的并查集求连通的不透明区域，得到各区域包围盒
+- 将包围盒合并为少量处理矩形（优先合并增加面积最少的一对），交给纹理后端只处理这些区域
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+Rect = Tuple[int, int, int, int]  # (x0, y0, x1, y1)，右/下边界不含
+
+
+@dataclass
+class OccupancyConfig:
+    """cell：网格粒度（像素）；margin：矩形外扩（为 img2img 提供上下文）；max_rects：合并后的矩形上限；
+    align：矩形尺寸对齐（diffusers 需 8 的倍数）；merge_slack：合并后新增空白面积不超过该比例时直接合并"""
+    cell: int = 16
+    margin: int = 16
+    max_rects: int = 8
+    align: int = 8
+    merge_slack: float = 0.25
+
+
+def occupancy_grid(alpha: np.ndarray, cell: int) -> np.ndarray:
+    """alpha (H,W) -> bool 网格 (ceil(H/cell), ceil(W/cell))，cell 内任一像素不透明即为占用"""
+    h, w = alpha.shape
+    gh, gw = -(-h // cell), -(-w // cell)
+    padded = np.zeros((gh * cell, gw * cell), dtype=alpha.dtype)
+    padded[:h, :w] = alpha
+    return padded.reshape(gh, cell, gw, cell).max(axis=(1, 3)) > 0
+
+
+def _row_runs(row: np.ndarray) -> List[Tuple[int, int]]:
+    d = np.diff(np.concatenate([[0], row.astype(np.int8), [0]]))
+    starts = np.flatnonzero(d == 1)
+    ends = np.flatnonzero(d == -1)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def connected_boxes(grid: np.ndarray) -> List[Rect]:
+    """4 连通分量的包围盒（网格坐标）。按行提取行程，与上一行重叠的行程在并查集中合并。"""
+    parent: List[int] = []
+    boxes: List[List[int]] = []
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    prev: List[Tuple[int, int, int]] = []
+    for y in range(grid.shape[0]):
+        cur: List[Tuple[int, int, int]] = []
+        for s, e in _row_runs(grid[y]):
+            idx = len(parent)
+            parent.append(idx)
+            boxes.append([s, y, e, y + 1])
+            for ps, pe, pidx in prev:
+                if ps < e and s < pe:
+                    a, b = find(idx), find(pidx)
+                    if a != b:
+                        parent[b] = a
+            cur.append((s, e, idx))
+        prev = cur
+
+    merged: Dict[int, List[int]] = {}
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        r = find(i)
+        if r in merged:
+            m = merged[r]
+            m[0], m[1], m[2], m[3] = min(m[0], x0), min(m[1], y0), max(m[2], x1), max(m[3], y1)
+        else:
+            merged[r] = [x0, y0, x1, y1]
+    return [tuple(b) for b in merged.values()]
+
+
+def _area(r: np.ndarray) -> np.ndarray:
+    return (r[..., 2] - r[..., 0]) * (r[..., 3] - r[..., 1])
+
+
+def merge_rects(rects: List[Rect], max_rects: int, slack: float = 0.25) -> List[Rect]:
+    """反复合并“合并后新增面积”最小的一对矩形：相交/新增面积不超过 slack 比例的对直接合并，
+    之后继续合并直到数量不超过 max_rects"""
+    r = np.array(rects, dtype=np.int64).reshape(-1, 4)
+    while len(r) > 1:
+        u = np.stack([
+            np.minimum(r[:, None, 0], r[None, :, 0]), np.minimum(r[:, None, 1], r[None, :, 1]),
+            np.maximum(r[:, None, 2], r[None, :, 2]), np.maximum(r[:, None, 3], r[None, :, 3]),
+        ], axis=-1)
+        ua = _area(u)
+        a = _area(r)
+        # 新增面积（允许为负：表示两矩形重叠）
+        waste = ua - a[:, None] - a[None, :]
+        np.fill_diagonal(waste, np.iinfo(np.int64).max)
+        i, j = np.unravel_index(np.argmin(waste), waste.shape)
+        if len(r) <= max_rects and waste[i, j] > slack * ua[i, j]:
+            break
+        keep = np.ones(len(r), dtype=bool)
+        keep[[i, j]] = False
+        r = np.vstack([r[keep], u[i, j][None, :]])
+    return [tuple(int(v) for v in row) for row in r]
+
+
+def _align_rect(rect: Rect, align: int, width: int, height: int) -> Rect:
+    x0, y0, x1, y1 = rect
+    w = min(width, -(-(x1 - x0) // align) * align)
+    h = min(height, -(-(y1 - y0) // align) * align)
+    x0 = max(0, min(x0, width - w))
+    y0 = max(0, min(y0, height - h))
+    return (x0, y0, x0 + w, y0 + h)
+
+
+def occupied_rects(alpha: np.ndarray, cfg: OccupancyConfig = OccupancyConfig()) -> List[Rect]:
+    """从 alpha 计算处理矩形（像素坐标，已外扩、对齐并裁剪到图像内）"""
+    h, w = alpha.shape
+    grid = occupancy_grid(alpha, cfg.cell)
+    boxes = connected_boxes(grid)
+    if not boxes:
+        return []
+    pad = cfg.margin
+    px = [(max(0, x0 * cfg.cell - pad), max(0, y0 * cfg.cell - pad),
+           min(w, x1 * cfg.cell + pad), min(h, y1 * cfg.cell + pad)) for x0, y0, x1, y1 in boxes]
+    merged = merge_rects(px, cfg.max_rects, cfg.merge_slack)
+    return [_align_rect(r, cfg.align, w, h) for r in merged]
+
+
+def rects_fraction(rects: List[Rect], width: int, height: int) -> float:
+    """处理矩形占整图面积的比例（矩形可能重叠，按并集计）"""
+    if not rects:
+        return 0.0
+    covered = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in rects:
+        covered[y0:y1, x0:x1] = True
+    return float(covered.mean())
+
+
+def apply_in_rects(img: np.ndarray, rects: List[Rect], fn: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """对每个矩形区域的副本调用 fn（输入/输出形状一致），全部计算完成后再合成回 img（就地）。
+    所有区域都基于原图计算，矩形即使重叠也不会被重复处理。"""
+    outs = [fn(img[y0:y1, x0:x1].copy()) for x0, y0, x1, y1 in rects]
+    for (x0, y0, x1, y1), out in zip(rects, outs):
+        img[y0:y1, x0:x1] = out
+    return img
@@ -0,0 +1,115 @@
+"""
+纹理像素运算（NumPy）：
+将亮度/饱和度/色相三种调整融合为一个 3x3 颜色矩阵，在 uint8 RGBA 缓冲上按行块单遍处理，
+只触及 alpha>0 的像素，alpha 通道保持逐位不变。
+"""
+
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+# ITU-R 601-2 亮度权重（与 PIL 的 "L" 转换一致，ImageEnhance.Color 以此为退化图）
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# 行块大小：限制单次 float32 临时缓冲的大小
+CHUNK_ROWS = 32
+
+
+def brightness_matrix(bright: float) -> np.ndarray:
+    return np.eye(3, dtype=np.float32) * np.float32(bright)
+
+
+def saturation_matrix(sat: float) -> np.ndarray:
+    """out = L + sat * (x - L)，L 为亮度"""
+    return (np.float32(sat) * np.eye(3, dtype=np.float32)
+            + np.float32(1.0 - sat) * np.outer(np.ones(3, dtype=np.float32), LUMA))
+
+
+def hue_matrix(hue_delta: float) -> np.ndarray:
+    """绕灰轴的色相旋转（W3C hue-rotate 矩阵）；hue_delta 以整圈为单位（0.1 ≈ 36°）"""
+    a = 2.0 * math.pi * hue_delta
+    c, s = math.cos(a), math.sin(a)
+    return np.array([
+        [0.213 + c * 0.787 - s * 0.213, 0.715 - c * 0.715 - s * 0.715, 0.072 - c * 0.072 + s * 0.928],
+        [0.213 - c * 0.213 + s * 0.143, 0.715 + c * 0.285 + s * 0.140, 0.072 - c * 0.072 - s * 0.283],
+        [0.213 - c * 0.213 - s * 0.787, 0.715 - c * 0.715 + s * 0.715, 0.072 + c * 0.928 + s * 0.072],
+    ], dtype=np.float32)
+
+
+def jitter_matrix(bright: float = 1.0, sat: float = 1.0, hue_delta: float = 0.0) -> np.ndarray:
+    """依次应用 亮度 -> 饱和度 -> 色相 的融合矩阵（作用于列向量 RGB）"""
+    m = saturation_matrix(sat) @ brightness_matrix(bright)
+    if hue_delta:
+        m = hue_matrix(hue_delta) @ m
+    return m.astype(np.float32)
+
+
+def apply_color_matrix(rgba: np.ndarray, matrix: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """就地对 HxWx4 uint8 缓冲的不透明像素应用颜色矩阵（四舍五入并截断到 [0,255]）。
+    按行块处理：全透明行块直接跳过，其余行块只写回 alpha>0 的像素。"""
+    m = np.asarray(matrix, dtype=np.float32)
+    for y in range(0, rgba.shape[0], chunk_rows):
+        band = rgba[y:y + chunk_rows]
+        mask = band[..., 3] != 0
+        if not mask.any():
+            continue
+        f = band[..., :3].astype(np.float32)
+        r, g, b = f[..., 0], f[..., 1], f[..., 2]
+        for c in range(3):
+            o = m[c, 0] * r
+            o += m[c, 1] * g
+            o += m[c, 2] * b
+            o += 0.5
+            np.clip(o, 0.0, 255.0, out=o)
+            np.copyto(band[..., c], o, where=mask, casting="unsafe")
+    return rgba
+
+
+def iter_color_variants(rgba: np.ndarray, matrices: Sequence[np.ndarray],
+                        chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[int, np.ndarray]]:
+    """同一源缓冲的 K 个颜色矩阵变体，按行块产出 (y, (K,n,W,4) uint8)。
+    每个行块只转换一次 float；各变体用一次 (n*W,4)x(4,4) 矩阵乘（alpha 以单位行透传）直接写入连续输出，
+    透明像素再以 uint32 视图整像素拷回源值，因此 alpha 与透明像素均与源逐位一致。"""
+    k = len(matrices)
+    m4 = np.zeros((k, 4, 4), dtype=np.float32)
+    m4[:, :3, :3] = np.stack([np.asarray(m, dtype=np.float32) for m in matrices]).transpose(0, 2, 1)
+    m4[:, 3, 3] = 1.0
+    for y in range(0, rgba.shape[0], chunk_rows):
+        band = np.ascontiguousarray(rgba[y:y + chunk_rows])
+        n, w = band.shape[:2]
+        transparent = band[..., 3] == 0
+        if transparent.all():
+            yield y, np.repeat(band[None], k, axis=0)
+            continue
+        out = np.empty((k, n, w, 4), dtype=np.uint8)
+        f = band.reshape(n * w, 4).astype(np.float32)
+        buf = np.empty_like(f)
+        src32 = band.view(np.uint32).reshape(n, w)
+        for i in range(k):
+            np.matmul(f, m4[i], out=buf)
+            buf += 0.5
+            np.clip(buf, 0.0, 255.0, out=buf)
+            out[i].reshape(n * w, 4)[...] = buf
+            np.copyto(out[i].view(np.uint32).reshape(n, w), src32, where=transparent)
+        yield y, out
+
+
+def load_rgba(src: Path) -> np.ndarray:
+    with Image.open(src) as img:
+        return np.array(img.convert("RGBA"))
+
+
+def png_compress_level(level: Optional[int] = None) -> int:
+    """PNG 压缩级别（0-9）：显式参数优先，其次环境变量 TEXTURE_PNG_COMPRESS_LEVEL，默认 6（与 PIL 一致）"""
+    if level is None:
+        level = int(os.environ.get("TEXTURE_PNG_COMPRESS_LEVEL", "6"))
+    return max(0, min(9, int(level)))
+
+
+def save_rgba_png(rgba: np.ndarray, dst: Path, compress_level: Optional[int] = None) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(rgba, "RGBA").save(dst, "PNG", compress_level=png_compress_level(compress_level))
@@ -0,0 +1,305 @@
+"""
+跨进程共享的纹理解码缓存（multiprocessing.shared_memory）：
+- 同一模板纹理（按 路径+大小+mtime 命名）只由第一个需要它的进程解码为 uint8 RGBA，写入具名共享内存段
+- 其他进程直接附着同一段（零拷贝只读视图），等待首个进程写完后即可使用
+- 注册表（JSON + 文件锁）记录各段的引用计数与大小：引用计数归零的段按最近使用时间淘汰，总大小受字节预算约束
+- 预算不超过 /dev/shm 的可用空间（扣除余量）；段创建时预分配，空间不足时回退为进程内解码
+  （tmpfs 惰性分配页面，未预分配的段在写入时才失败，表现为无法捕获的 SIGBUS）
+- 由批处理父进程创建注册表目录并通过环境变量下发；批处理结束时统一 cleanup
+未设置 TEXTURE_SHM_DIR、或平台不支持 fcntl 文件锁时退化为进程内普通解码。
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import json
+import os
+import struct
+import time
+
+import numpy as np
+from PIL import Image
+
+from texture_ops import load_rgba
+
+
+def maybe_import_fcntl():
+    try:
+        import fcntl
+        return fcntl
+    except Exception:
+        return None
+
+
+def maybe_import_shared_memory():
+    try:
+        from multiprocessing import resource_tracker, shared_memory
+        return shared_memory, resource_tracker
+    except Exception:
+        return None, None
+
+
+# 段头：魔数、状态、宽、高（其余保留，数据区按 64 字节对齐）
+HEADER = struct.Struct("<8sIII")
+HEADER_BYTES = 64
+MAGIC = b"L2DTEX01"
+FILLING, READY, FAILED = 0, 1, 2
+WAIT_TIMEOUT = 120.0
+SHM_DIR = "/dev/shm"
+SHM_HEADROOM = 0.1  # 预算最多占 /dev/shm 可用空间的 90%（容器默认仅 64MB）
+
+
+def shm_free_bytes(path: str = SHM_DIR) -> Optional[int]:
+    """共享内存文件系统的可用字节数；不存在（如 macOS）时返回 None"""
+    try:
+        st = os.statvfs(path)
+    except (OSError, AttributeError):
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+def segment_name(src: Path) -> str:
+    st = src.stat()
+    key = f"{src.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+    return "l2dtex_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class SharedTextureCache:
+    """注册表目录结构：<root>/registry.json（段信息与统计）、<root>/registry.lock（flock）"""
+
+    def __init__(self, root: Path, budget_bytes: int = 1 << 30):
+        self.root = Path(root)
+        self.budget_bytes = budget_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._fcntl = maybe_import_fcntl()
+        self._shared_memory, self._tracker = maybe_import_shared_memory()
+        self._open: Dict[str, List[object]] = {}
+        free = shm_free_bytes()
+        if free is not None and self.available:
+            # 注册表中已有的段本身占用 /dev/shm，计入可用空间
+            with self._registry() as reg:
+                free += sum(e["bytes"] for e in reg["segments"].values())
+            self.budget_bytes = min(budget_bytes, int(free * (1.0 - SHM_HEADROOM)))
+
+    @property
+    def available(self) -> bool:
+        return self._fcntl is not None and self._shared_memory is not None
+
+    @contextmanager
+    def _registry(self) -> Iterator[Dict]:
+        """加锁读写注册表：{"segments": {name: {bytes, refs, last_used, src}}, "decodes": n, "attaches": n, "fallbacks": n}"""
+        with open(self.root / "registry.lock", "a+") as lock:
+            self._fcntl.flock(lock, self._fcntl.LOCK_EX)
+            path = self.root / "registry.json"
+            reg = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+            reg.setdefault("segments", {})
+            for k in ("decodes", "attaches", "fallbacks", "evictions"):
+                reg.setdefault(k, 0)
+            yield reg
+            tmp = path.with_name("registry.json.part")
+            tmp.write_text(json.dumps(reg, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+
+    def _segment(self, name: str, create: bool = False, size: int = 0):
+        shm = self._shared_memory.SharedMemory(name=name, create=create, size=size)
+        # 段的生命周期由注册表管理：不交给本进程的 resource_tracker（否则进程退出时会被自动 unlink）
+        try:
+            self._tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+    def _create(self, name: str, size: int):
+        """创建段并预分配全部页面；空间不足时抛出 OSError"""
+        try:
+            shm = self._segment(name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出遗留的同名段（注册表中无记录）：清除后重建
+            self._unlink(name)
+            shm = self._segment(name, create=True, size=size)
+        fd = getattr(shm, "_fd", -1)
+        if fd >= 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                shm.close()
+                self._unlink(name)
+                raise
+        return shm
+
+    def _unlink(self, name: str) -> None:
+        # 直接附着（保留 resource_tracker 登记），unlink 时会随之注销
+        try:
+            shm = self._shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    def _evict(self, reg: Dict, need: int) -> None:
+        """淘汰引用计数为 0 的段（最久未用优先），直到能容纳 need 字节"""
+        segs = reg["segments"]
+        total = sum(e["bytes"] for e in segs.values())
+        for name, e in sorted(segs.items(), key=lambda kv: kv[1]["last_used"]):
+            if total + need <= self.budget_bytes:
+                break
+            if e["refs"] > 0:
+                continue
+            self._unlink(name)
+            del segs[name]
+            total -= e["bytes"]
+            reg["evictions"] += 1
+
+    def acquire(self, src: Path) -> Optional[np.ndarray]:
+        """返回共享段上的只读 (H,W,4) 视图；超出预算、等待超时或解码失败时返回 None（调用方自行解码）"""
+        if not self.available:
+            return None
+        name = segment_name(src)
+        with self._registry() as reg:
+            entry = reg["segments"].get(name)
+            if entry is not None:
+                entry["refs"] += 1
+                entry["last_used"] = time.time()
+                reg["attaches"] += 1
+                creator = False
+            else:
+                with Image.open(src) as img:
+                    w, h = img.size
+                nbytes = HEADER_BYTES + w * h * 4
+                self._evict(reg, nbytes)
+                if sum(e["bytes"] for e in reg["segments"].values()) + nbytes > self.budget_bytes:
+                    reg["fallbacks"] += 1
+                    return None
+                try:
+                    shm = self._create(name, nbytes)
+                except OSError:
+                    # /dev/shm 空间不足（预算之外的占用）：调用方自行解码
+                    reg["fallbacks"] += 1
+                    return None
+                HEADER.pack_into(shm.buf, 0, MAGIC, FILLING, w, h)
+                reg["segments"][name] = {"bytes": nbytes, "refs": 1, "last_used": time.time(), "src": str(src)}
+                reg["decodes"] += 1
+                creator = True
+
+        if creator:
+            try:
+                arr = np.ndarray((h, w, 4), dtype=np.uint8, buffer=shm.buf, offset=HEADER_BYTES)
+                arr[...] = load_rgba(src)
+                del arr
+            except Exception:
+                HEADER.pack_into(shm.buf, 0, MAGIC, FAILED, w, h)
+                shm.close()
+                self.release(name, failed=True)
+                return None
+            HEADER.pack_into(shm.buf, 0, MAGIC, READY, w, h)
+        else:
+            try:
+                shm = self._segment(name)
+            except FileNotFoundError:
+                self.release(name, failed=True)
+                return None
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while True:
+                _, state, w, h = HEADER.unpack_from(shm.buf, 0)
+                if state == READY:
+                    break
+                if state == FAILED:
+                    # 解码方已将条目移出注册表，这里只需关闭映射
+                    shm.close()
+                    return None
+                if time.monotonic() > deadline:
+                    # 解码方可能已异常退出：丢弃该条目，后续请求重新解码
+                    shm.close()
+                    self.release(name, failed=True)
+                    return None
+                time.sleep(0.005)
+
+        self._open.setdefault(name, []).append(shm)
+        view = np.ndarray((h, w, 4), dtype=np.uint8, buffer=shm.buf, offset=HEADER_BYTES)
+        view.flags.writeable = False
+        return view
+
+    def release(self, name: str, failed: bool = False) -> None:
+        """引用计数减一，其余在超出预算时由后续 acquire 淘汰；failed=True 时立即移除条目并删除段
+        （已附着的进程仍持有映射，不受影响）"""
+        handles = self._open.get(name)
+        shm = handles.pop() if handles else None
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # 调用方仍持有视图：映射随对象回收释放
+                pass
+        with self._registry() as reg:
+            entry = reg["segments"].get(name)
+            if entry is None:
+                return
+            entry["refs"] = max(0, entry["refs"] - 1)
+            entry["last_used"] = time.time()
+            if failed:
+                self._unlink(name)
+                del reg["segments"][name]
+                reg["fallbacks"] += 1
+
+    def stats(self) -> Dict:
+        with self._registry() as reg:
+            return {
+                "segments": len(reg["segments"]),
+                "bytes": sum(e["bytes"] for e in reg["segments"].values()),
+                "decodes": reg["decodes"],
+                "attaches": reg["attaches"],
+                "fallbacks": reg["fallbacks"],
+                "evictions": reg["evictions"],
+            }
+
+    def cleanup(self) -> Dict:
+        """删除全部段（批处理结束时由父进程调用），返回最终统计"""
+        if not self.available:
+            return {}
+        with self._registry() as reg:
+            for name in list(reg["segments"]):
+                self._unlink(name)
+            reg["segments"] = {}
+        return self.stats()
+
+
+_CACHE: Optional[SharedTextureCache] = None
+
+
+def shm_cache_from_env() -> Optional[SharedTextureCache]:
+    """环境变量 TEXTURE_SHM_DIR（注册表目录）/ TEXTURE_SHM_BUDGET_MB（默认 1024）；未设置时不启用"""
+    global _CACHE
+    root = os.environ.get("TEXTURE_SHM_DIR")
+    if not root:
+        return None
+    if _CACHE is None or _CACHE.root != Path(root):
+        _CACHE = SharedTextureCache(Path(root), int(os.environ.get("TEXTURE_SHM_BUDGET_MB", "1024")) << 20)
+    return _CACHE if _CACHE.available else None
+
+
+@contextmanager
+def shared_rgba(src: Path) -> Iterator[np.ndarray]:
+    """只读 RGBA 视图：优先附着共享解码缓存，否则进程内解码。视图仅在 with 块内有效，不可写。"""
+    cache = shm_cache_from_env()
+    view = cache.acquire(src) if cache is not None else None
+    if view is None:
+        yield load_rgba(src)
+        return
+    name = segment_name(src)
+    try:
+        yield view
+    finally:
+        del view
+        cache.release(name)
+
+
+def load_rgba_shared(src: Path) -> np.ndarray:
+    """可写的私有 RGBA 副本（从共享缓存拷贝，或直接解码）"""
+    cache = shm_cache_from_env()
+    if cache is None:
+        return load_rgba(src)
+    with shared_rgba(src) as view:
+        out = np.array(view)
+        del view
+    return out
@@ -0,0 +1,207 @@
+"""
+生成纹理的分块去重存储（相对模板与历史输出的增量存储）：
+- 每张输出图集按固定大小 tile（默认 128）切分，tile 内容（尺寸 + RGBA 字节）取 sha256 作为对象键
+- 对象以小 PNG 存于 <store>/objects/<key[:2]>/<key>.png：与模板或此前任何输出逐字节相同的 tile 只存一份
+  （抖动/局部重绘通常保持透明区与未改动区域不变，这部分完全不占新空间）
+- 模型目录中的纹理替换为清单 <texture>.tiles.json（尺寸、tile 大小、按行排列的对象键），原 PNG 删除
+- 需要时（预览/导出）按清单流式重建 PNG，逐像素无损；读写均按 tile 行带进行，内存为 O(tile × 图宽)
+模型目录打包后不能直接加载，导出或预览前需 unpack（或对单个纹理调用 ensure_texture）。
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import argparse
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from texture_tiles import PngBandReader, PngBandWriter
+
+TILE_SIZE = 128
+MANIFEST_SUFFIX = ".tiles.json"
+MANIFEST_VERSION = 1
+
+
+def tile_key(tile: np.ndarray) -> str:
+    h = hashlib.sha256(f"{tile.shape[1]}x{tile.shape[0]}:".encode())
+    h.update(np.ascontiguousarray(tile).data)
+    return h.hexdigest()
+
+
+def manifest_path(texture: Path) -> Path:
+    return texture.with_name(texture.name + MANIFEST_SUFFIX)
+
+
+class TileStore:
+    """对象目录：<root>/objects/<key[:2]>/<key>.png（写入为临时名 + os.replace，多进程并发打包安全）"""
+
+    def __init__(self, root: Path, tile_size: int = TILE_SIZE, compress_level: int = 6):
+        self.root = Path(root)
+        self.tile_size = tile_size
+        self.compress_level = compress_level
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, key: str) -> Path:
+        return self.root / "objects" / key[:2] / f"{key}.png"
+
+    def put_tile(self, tile: np.ndarray) -> Tuple[str, int]:
+        """存入一个 tile，返回 (键, 新写入字节数)；已存在时不写"""
+        key = tile_key(tile)
+        path = self.object_path(key)
+        if path.exists():
+            return key, 0
+        buf = io.BytesIO()
+        Image.fromarray(tile, "RGBA").save(buf, "PNG", compress_level=self.compress_level)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.part")
+        tmp.write_bytes(buf.getvalue())
+        os.replace(tmp, path)
+        return key, len(buf.getvalue())
+
+    def get_tile(self, key: str) -> np.ndarray:
+        with Image.open(self.object_path(key)) as img:
+            return np.asarray(img.convert("RGBA"))
+
+    def ingest(self, src: Path) -> Dict:
+        """将一张 PNG 切分入库，返回清单（附带本次新写入的对象数与字节数）"""
+        t = self.tile_size
+        tiles: List[str] = []
+        new_objects = new_bytes = 0
+        with PngBandReader(src) as reader:
+            w, h = reader.width, reader.height
+            while reader.y < h:
+                band = reader.read_rows(t)
+                for x in range(0, w, t):
+                    key, n = self.put_tile(band[:, x:x + t])
+                    tiles.append(key)
+                    new_objects += n > 0
+                    new_bytes += n
+        return {"version": MANIFEST_VERSION, "width": w, "height": h, "tile": t, "tiles": tiles,
+                "new_objects": new_objects, "new_bytes": new_bytes}
+
+    def restore(self, manifest: Dict, dst: Path, compress_level: Optional[int] = None) -> None:
+        """按清单流式重建 PNG（逐 tile 行带解码并写出）"""
+        w, h, t = manifest["width"], manifest["height"], manifest["tile"]
+        cols = -(-w // t)
+        with PngBandWriter(dst, w, h, compress_level) as writer:
+            for row, y in enumerate(range(0, h, t)):
+                band = np.empty((min(t, h - y), w, 4), dtype=np.uint8)
+                for col, key in enumerate(manifest["tiles"][row * cols:(row + 1) * cols]):
+                    band[:, col * t:(col + 1) * t] = self.get_tile(key)
+                writer.write_rows(band)
+
+    def referenced(self, manifests: Iterable[Path]) -> Set[str]:
+        keys: Set[str] = set()
+        for m in manifests:
+            keys.update(json.loads(Path(m).read_text(encoding="utf-8"))["tiles"])
+        return keys
+
+    def gc(self, manifests: Iterable[Path]) -> int:
+        """删除不被任何给定清单引用的对象；返回删除数"""
+        keep = self.referenced(manifests)
+        removed = 0
+        for p in self.root.glob("objects/*/*.png"):
+            if p.stem not in keep:
+                p.unlink()
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict:
+        sizes = [p.stat().st_size for p in self.root.glob("objects/*/*.png")]
+        return {"objects": len(sizes), "bytes": sum(sizes), "store": str(self.root)}
+
+
+def model_textures(model_dir: Path) -> List[str]:
+    """model3.json（含预览版本）引用的纹理相对路径，去重"""
+    rels: List[str] = []
+    for m in sorted(model_dir.glob("*.model3.json")):
+        doc = json.loads(m.read_text(encoding="utf-8"))
+        for t in doc.get("FileReferences", {}).get("Textures", []):
+            if t not in rels:
+                rels.append(t)
+    return rels
+
+
+def pack_model(model_dir: Path, store: TileStore, keep_png: bool = False) -> Dict:
+    """纹理入库并写出清单；返回 {textures, png_bytes, new_bytes, manifest_bytes}"""
+    model_dir = Path(model_dir)
+    report = {"model_dir": str(model_dir), "textures": 0, "png_bytes": 0, "new_bytes": 0, "manifest_bytes": 0}
+    for rel in model_textures(model_dir):
+        png = model_dir / rel
+        if not png.exists():
+            continue
+        manifest = store.ingest(png)
+        report["png_bytes"] += png.stat().st_size
+        report["new_bytes"] += manifest.pop("new_bytes")
+        manifest.pop("new_objects")
+        mpath = manifest_path(png)
+        mpath.write_text(json.dumps(manifest, separators=(",", ":")), encoding="utf-8")
+        report["manifest_bytes"] += mpath.stat().st_size
+        report["textures"] += 1
+        if not keep_png:
+            png.unlink()
+    return report
+
+
+def ensure_texture(texture: Path, store: TileStore) -> Path:
+    """按需重建：PNG 不存在而清单存在时从存储还原"""
+    texture = Path(texture)
+    if not texture.exists():
+        mpath = manifest_path(texture)
+        store.restore(json.loads(mpath.read_text(encoding="utf-8")), texture)
+    return texture
+
+
+def unpack_model(model_dir: Path, store: TileStore, remove_manifests: bool = False) -> int:
+    """重建模型目录中所有清单对应的 PNG（导出时调用）；返回重建数"""
+    restored = 0
+    for mpath in sorted(Path(model_dir).rglob(f"*{MANIFEST_SUFFIX}")):
+        png = mpath.with_name(mpath.name[: -len(MANIFEST_SUFFIX)])
+        if not png.exists():
+            store.restore(json.loads(mpath.read_text(encoding="utf-8")), png)
+            restored += 1
+        if remove_manifests:
+            mpath.unlink()
+    return restored
+
+
+def main():
+    ap = argparse.ArgumentParser(description="生成纹理的分块去重存储")
+    ap.add_argument("--store", default=os.environ.get("TEXTURE_TILE_STORE", "cache/tile_store"), help="存储目录")
+    ap.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="纹理入库并替换为清单")
+    p.add_argument("model_dirs", nargs="+")
+    p.add_argument("--templates", nargs="*", default=[], help="先入库的模板模型目录（只写对象，不改动模板）")
+    p.add_argument("--keep-png", action="store_true")
+    u = sub.add_parser("unpack", help="按清单重建 PNG（导出）")
+    u.add_argument("model_dirs", nargs="+")
+    u.add_argument("--remove-manifests", action="store_true")
+    g = sub.add_parser("gc", help="删除未被给定模型目录中任何清单引用的对象")
+    g.add_argument("model_dirs", nargs="+")
+    sub.add_parser("stats", help="存储对象数与字节数")
+    args = ap.parse_args()
+
+    store = TileStore(Path(args.store), args.tile_size)
+    if args.cmd == "pack":
+        for d in args.templates:
+            for rel in model_textures(Path(d)):
+                store.ingest(Path(d) / rel)
+        rows = [pack_model(Path(d), store, args.keep_png) for d in args.model_dirs]
+        print(json.dumps({"models": rows, **store.stats()}, ensure_ascii=False, indent=2))
+    elif args.cmd == "unpack":
+        for d in args.model_dirs:
+            print(json.dumps({"model_dir": d, "restored": unpack_model(Path(d), store, args.remove_manifests)}, ensure_ascii=False))
+    elif args.cmd == "gc":
+        manifests = [m for d in args.model_dirs for m in Path(d).rglob(f"*{MANIFEST_SUFFIX}")]
+        print(json.dumps({"removed": store.gc(manifests), **store.stats()}, ensure_ascii=False))
+    else:
+        print(json.dumps(store.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+分块（tiled）纹理处理引擎：
+- 流式读取 PNG：逐块解压 IDAT，按行带交给 PIL 的 C 解码器做反滤波，不在内存中保留整张图
+- 以固定大小的 tile（可配置重叠）处理图集，重叠区用线性羽化权重融合以消除接缝
+- 已完成的行立即流式编码写出 PNG；alpha 始终取自源图，逐位不变
+- 每个 worker 的引擎缓冲受硬内存预算约束：峰值约为 O(tile 高度 × 图宽)，与图集高度无关
+jitter 与 diffusers 后端都通过 tile_fn 接入：tile_fn(rgba_tile uint8 HxWx4) -> rgb uint8 HxWx3。
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from texture_ops import png_compress_level
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+TileFn = Callable[[np.ndarray], np.ndarray]
+
+
+@dataclass
+class TileConfig:
+    """分块参数：tile 边长、重叠宽度（像素）与每个 worker 的内存预算（字节）"""
+    tile_size: int = 512
+    overlap: int = 32
+    memory_budget: int = 256 * 1024 * 1024
+    # tile 尺寸对齐（如 diffusers 要求 8 的倍数）
+    align: int = 8
+    # tile_fn 内部每像素的估算额外开销（字节），计入预算
+    tile_fn_bytes_per_px: int = 64
+
+
+@dataclass
+class TileStats:
+    tiles: int = 0
+    skipped_tiles: int = 0
+    tile_size: int = 0
+    engine_bytes: int = 0
+    streamed: bool = True
+
+
+def _read_chunks(f) -> Iterator[Tuple[bytes, bytes]]:
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return
+        length, ctype = struct.unpack(">I4s", hdr)
+        data = f.read(length)
+        f.read(4)  # CRC
+        yield ctype, data
+        if ctype == b"IEND":
+            return
+
+
+class PngBandReader:
+    """按行流式读取 8 位 RGB/RGBA 非隔行 PNG，返回 RGBA uint8 行带。
+    其他格式（调色板/16位/隔行）退回 PIL 整图解码，仅当整图能放入 fallback_budget 时允许。"""
+
+    def __init__(self, path: Path, fallback_budget: Optional[int] = None):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        if self._f.read(8) != PNG_SIGNATURE:
+            self._f.close()
+            raise ValueError(f"不是 PNG 文件: {self.path}")
+        self._chunks = _read_chunks(self._f)
+        ctype, ihdr = next(self._chunks)
+        if ctype != b"IHDR":
+            raise ValueError(f"PNG 缺少 IHDR: {self.path}")
+        self.width, self.height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+        self.y = 0
+        self._full: Optional[np.ndarray] = None
+        if depth == 8 and color in (2, 6) and interlace == 0:
+            self.streamed = True
+            self._rawmode = "RGBA" if color == 6 else "RGB"
+            self._bpp = 4 if color == 6 else 3
+            self._stride = self.width * self._bpp + 1
+            self._zd = zlib.decompressobj()
+            self._pending = bytearray()
+            self._prev = bytes(self._stride)  # 虚拟的上一行（滤波类型 0，全零）
+            self._eof = False
+        else:
+            self.streamed = False
+            need = self.width * self.height * 4
+            if fallback_budget is not None and need > fallback_budget:
+                self.close()
+                raise MemoryError(f"{self.path.name} 无法流式解码且整图 {need} 字节超出内存预算 {fallback_budget}")
+            with Image.open(self.path) as img:
+                self._full = np.array(img.convert("RGBA"))
+
+    def _fill(self, nbytes: int) -> None:
+        while len(self._pending) < nbytes and not self._eof:
+            try:
+                ctype, data = next(self._chunks)
+            except StopIteration:
+                ctype, data = b"IEND", b""
+            if ctype == b"IDAT":
+                self._pending += self._zd.decompress(data)
+            elif ctype == b"IEND":
+                self._pending += self._zd.flush()
+                self._eof = True
+
+    # 每次交给解码器的行数：限制解码临时缓冲的大小
+    SUB_BAND_ROWS = 64
+
+    def read_into(self, out: np.ndarray) -> int:
+        """将接下来的 len(out) 行直接解码到 out（形状 (n, W, 4)），返回实际读取的行数"""
+        n = min(out.shape[0], self.height - self.y)
+        if n <= 0:
+            return 0
+        if self._full is not None:
+            out[:n] = self._full[self.y:self.y + n]
+            self.y += n
+            return n
+        done = 0
+        while done < n:
+            m = min(self.SUB_BAND_ROWS, n - done)
+            self._fill(m * self._stride)
+            raw = self._pending[:m * self._stride]
+            del self._pending[:m * self._stride]
+            # 在行带前拼接上一行（以滤波类型 0 存放），用 zlib 存储模式包装后交给 PIL 的 C 反滤波
+            data = zlib.compress(self._prev + raw, 0)
+            band = np.asarray(Image.frombytes(self._rawmode, (self.width, m + 1), data, "zip", self._rawmode))[1:]
+            self._prev = b"\x00" + band[-1].tobytes()
+            if self._bpp == 3:
+                out[done:done + m, :, :3] = band
+                out[done:done + m, :, 3] = 255
+            else:
+                out[done:done + m] = band
+            done += m
+        self.y += n
+        return n
+
+    def read_rows(self, n: int) -> np.ndarray:
+        """读取接下来的 n 行（不足时返回剩余行），形状 (n, W, 4)"""
+        out = np.empty((max(0, min(n, self.height - self.y)), self.width, 4), dtype=np.uint8)
+        self.read_into(out)
+        return out
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _chunk(ctype: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + ctype + data + struct.pack(">I", zlib.crc32(ctype + data) & 0xFFFFFFFF)
+
+
+class PngBandWriter:
+    """按行流式写出 RGBA PNG（每行使用 Up 滤波，NumPy 向量化计算），写入临时文件后原子替换。
+    中途出错时调用 abort()（或用作上下文管理器）关闭并删除临时文件"""
+
+    IDAT_SIZE = 1 << 20
+
+    def __init__(self, path: Path, width: int, height: int, compress_level: Optional[int] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".part")
+        self._f = open(self._tmp, "wb")
+        self.width, self.height = width, height
+        self.y = 0
+        self._zc = zlib.compressobj(png_compress_level(compress_level))
+        self._out = bytearray()
+        self._prev = np.zeros((width * 4,), dtype=np.uint8)
+        self._f.write(PNG_SIGNATURE)
+        self._f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+
+    def write_rows(self, rgba: np.ndarray) -> None:
+        n = rgba.shape[0]
+        if n == 0:
+            return
+        flat = np.ascontiguousarray(rgba, dtype=np.uint8).reshape(n, self.width * 4)
+        prev = np.vstack([self._prev[None, :], flat[:-1]])
+        filtered = np.empty((n, self.width * 4 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # Up
+        np.subtract(flat, prev, out=filtered[:, 1:])
+        self._prev = flat[-1].copy()
+        self._out += self._zc.compress(filtered.tobytes())
+        self.y += n
+        self._flush_idat()
+
+    def _flush_idat(self, final: bool = False) -> None:
+        while len(self._out) >= self.IDAT_SIZE or (final and self._out):
+            part = bytes(self._out[:self.IDAT_SIZE])
+            del self._out[:self.IDAT_SIZE]
+            self._f.write(_chunk(b"IDAT", part))
+
+    def abort(self) -> None:
+        """放弃写出：关闭并删除临时文件（可重复调用）"""
+        if not self._f.closed:
+            self._f.close()
+        try:
+            os.remove(self._tmp)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "PngBandWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def close(self) -> None:
+        if self.y != self.height:
+            self.abort()
+            raise ValueError(f"写出行数 {self.y} 与高度 {self.height} 不一致")
+        self._out += self._zc.flush()
+        self._flush_idat(final=True)
+        self._f.write(_chunk(b"IEND", b""))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+
+def tile_positions(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """沿一个轴的 tile 区间 [start, end)：步长 tile-overlap，最后一块截断到边界"""
+    if length <= tile:
+        return [(0, length)]
+    step = tile - overlap
+    spans: List[Tuple[int, int]] = []
+    p = 0
+    while True:
+        spans.append((p, min(p + tile, length)))
+        if p + tile >= length:
+            return spans
+        p += step
+
+
+def feather_weights(length: int, overlap: int, first: bool, last: bool) -> np.ndarray:
+    """线性羽化权重：相邻 tile 在重叠区内的权重之和恒为 1"""
+    w = np.ones(length, dtype=np.float32)
+    if overlap > 0:
+        ramp = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+        if not first:
+            w[:overlap] = ramp
+        if not last:
+            w[length - overlap:] = ramp[::-1]
+    return w
+
+
+def engine_bytes(tile: int, width: int, cfg: TileConfig) -> int:
+    """引擎缓冲估算：源行窗口(4B/px) + 累加器(12B/px) + 定稿行(4B/px) + 写出滤波缓冲(~9B/px) + tile_fn 临时内存"""
+    return tile * width * (4 + 12 + 4 + 9) + tile * tile * cfg.tile_fn_bytes_per_px
+
+
+def fit_tile_size(width: int, cfg: TileConfig) -> int:
+    """在内存预算内选取最大的 tile 边长（不超过配置值，按 align 对齐）"""
+    align = max(1, cfg.align)
+    minimum = max(align, 2 * cfg.overlap + align)
+    tile = max(minimum, (cfg.tile_size // align) * align)
+    while tile > minimum and engine_bytes(tile, width, cfg) > cfg.memory_budget:
+        tile -= align
+    if engine_bytes(tile, width, cfg) > cfg.memory_budget:
+        raise MemoryError(f"内存预算 {cfg.memory_budget} 字节不足以处理宽度 {width} 的图集（最小 tile={tile}）")
+    return tile
+
+
+def process_atlas_tiled(src: Path, dst: Path, tile_fn: TileFn, cfg: Optional[TileConfig] = None,
+                        compress_level: Optional[int] = None, skip_transparent: bool = True) -> TileStats:
+    """以 tile 流式处理整张图集并写出 dst。全透明 tile 可跳过（保持源像素）。"""
+    cfg = cfg or TileConfig()
+    stats = TileStats()
+    with PngBandReader(src, fallback_budget=cfg.memory_budget) as reader:
+        W, H = reader.width, reader.height
+        tile = fit_tile_size(W, cfg)
+        overlap = min(cfg.overlap, tile // 2) if tile < max(W, H) else 0
+        stats.tile_size, stats.streamed = tile, reader.streamed
+        stats.engine_bytes = engine_bytes(tile, W, cfg)
+
+        rows = tile_positions(H, tile, overlap)
+        cols = tile_positions(W, tile, overlap)
+        writer = PngBandWriter(dst, W, H, compress_level)
+
+        # 预分配的源行窗口与累加器（各 tile 高度行），对应图像行 [win_y, win_y+valid)
+        window = np.empty((tile, W, 4), dtype=np.uint8)
+        acc = np.zeros((tile, W, 3), dtype=np.float32)
+        final = np.empty((tile, W, 4), dtype=np.uint8)
+        win_y, valid = 0, 0
+        try:
+            for ri, (y0, y1) in enumerate(rows):
+                n = y1 - (win_y + valid)
+                reader.read_into(window[valid:valid + n])
+                valid += n
+                wy = feather_weights(y1 - y0, overlap, ri == 0, ri == len(rows) - 1)
+                for ci, (x0, x1) in enumerate(cols):
+                    src_tile = window[y0 - win_y:y1 - win_y, x0:x1]
+                    wx = feather_weights(x1 - x0, overlap, ci == 0, ci == len(cols) - 1)
+                    weight = (wy[:, None] * wx[None, :])[..., None]
+                    if skip_transparent and not src_tile[..., 3].any():
+                        out = src_tile[..., :3]
+                        stats.skipped_tiles += 1
+                    else:
+                        out = tile_fn(src_tile)
+                        stats.tiles += 1
+                    acc[y0 - win_y:y1 - win_y, x0:x1] += out * weight
+
+                # 下一 tile 行起点之前的行已定稿：写出，并把剩余（重叠）行移到缓冲顶部
+                done_to = rows[ri + 1][0] if ri + 1 < len(rows) else y1
+                k = done_to - win_y
+                acc[:k] += 0.5
+                np.clip(acc[:k], 0, 255, out=acc[:k])
+                final[:k, :, :3] = acc[:k]
+                final[:k, :, 3] = window[:k, :, 3]
+                writer.write_rows(final[:k])
+                rest = valid - k
+                window[:rest] = window[k:valid]
+                acc[:rest] = acc[k:valid]
+                acc[rest:] = 0
+                win_y, valid = done_to, rest
+        except BaseException:
+            # tile_fn 失败（如推理 OOM）或读取出错：关闭并删除临时文件，不留下半成品 .part
+            writer.abort()
+            raise
+        writer.close()
+    return stats
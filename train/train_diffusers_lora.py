@@ -1,40 +1,502 @@
 """
-Diffusers LoRA 训练运行器（占位）：
-说明：实际LoRA训练需更多配置与数据预处理，本脚本仅演示参数与accelerate入口。
+Diffusers LoRA 训练（UNet 注意力层低秩适配，潜变量预编码）：
+- 第一阶段（一次性）：清单中每张纹理按固定视图（不透明占比达标的固定裁剪 + 固定增强，如水平翻转）缩放到训练分辨率，
+  经 VAE 编码后把潜变量分布的均值与标准差（已乘 scaling_factor）写入 float16 内存映射数组 latents.f16，
+  latents.json 记录形状与逐样本来源（model_id、纹理、裁剪、增强）；缓存键覆盖 VAE、视图参数与源文件（路径/大小/mtime），
+  参数与数据不变时直接复用，不再加载 VAE 编码
+- 第二阶段：训练步直接从内存映射读取潜变量（按均值/标准差重新采样），加噪后以 UNet 预测噪声（或 v）计算 MSE，
+  只更新注入到 to_q/to_k/to_v/to_out.0 的 LoRA 参数；VAE 与文本编码器用完即释放，训练步不再经过 VAE
+- 面向 CPU 构建机内存：梯度累积（小微批、大有效批）、UNet 梯度检查点、CPU 有原生 bf16 指令时 bf16 autocast；
+  每 --checkpoint-every 步原子写出 checkpoint.pt（LoRA、优化器、随机数状态）与当前权重，--resume 续训与不中断结果一致；
+  日志输出 steps/秒、样本/秒与峰值 RSS
+- 输出 pytorch_lora_weights.safetensors（peft 命名 unet.<模块>.lora_A/lora_B.weight）与 train_report.json；
+  推理经 DIFFUSERS_LORA_PATH 加载：优先 pipe.load_lora_weights，不可用（未安装 peft）时 merge_lora_weights 直接合并进 UNet
+- --tiny：使用本地构造的微型 VAE/UNet/CLIP 文本编码器（无需下载权重），整条流程可在 CPU 上端到端运行
 参考：https://huggingface.co/docs/diffusers/training/lora
 """
 
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 import argparse
+import contextlib
+import hashlib
 import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+from PIL import Image
+
+from dataset import load_split_manifest, patch_coords
+from texture_ops import load_rgba
+
+logger = logging.getLogger(__name__)
+
+LATENT_FILE = "latents.f16"
+LATENT_INDEX = "latents.json"
+LATENT_VERSION = 1
+LORA_TARGETS = ("to_q", "to_k", "to_v", "to_out.0")
+LORA_WEIGHTS = "pytorch_lora_weights.safetensors"
+CHECKPOINT = "checkpoint.pt"
+AUGMENTS = ("none", "hflip")
+
+
+def maybe_import_diffusers():
+    try:
+        import torch
+        import diffusers
+        return torch, diffusers
+    except Exception:
+        return None, None
+
+
+torch, diffusers = maybe_import_diffusers()
+_Module = torch.nn.Module if torch is not None else object
+
+
+class LoRALinear(_Module):
+    """base(x) + B(A(x))：B 零初始化，训练开始时与原层输出一致；alpha = rank（缩放为 1，与 peft 默认加载一致）"""
+
+    def __init__(self, base, rank: int):
+        super().__init__()
+        self.base = base
+        self.lora_A = torch.nn.Linear(base.in_features, rank, bias=False)
+        self.lora_B = torch.nn.Linear(rank, base.out_features, bias=False)
+        torch.nn.init.kaiming_uniform_(self.lora_A.weight, a=5 ** 0.5)
+        torch.nn.init.zeros_(self.lora_B.weight)
+        self.lora_A.to(base.weight.device)
+        self.lora_B.to(base.weight.device)
+
+    def forward(self, x):
+        return self.base(x) + self.lora_B(self.lora_A(x))
+
+
+def inject_lora(unet, rank: int, targets: Sequence[str] = LORA_TARGETS) -> Dict[str, "LoRALinear"]:
+    """把 UNet 注意力中名称以 targets 结尾的 Linear 替换为 LoRALinear；返回 {模块名: LoRALinear}"""
+    unet.requires_grad_(False)
+    names = [n for n, m in unet.named_modules()
+             if isinstance(m, torch.nn.Linear) and any(n.endswith(f".{t}") for t in targets)]
+    layers: Dict[str, LoRALinear] = {}
+    for name in names:
+        parent_name, _, child = name.rpartition(".")
+        parent = unet.get_submodule(parent_name)
+        layer = LoRALinear(parent._modules[child], rank)
+        parent._modules[child] = layer
+        layers[name] = layer
+    return layers
+
+
+def lora_state_dict(layers: Dict[str, "LoRALinear"]) -> Dict:
+    sd = {}
+    for name, layer in layers.items():
+        sd[f"unet.{name}.lora_A.weight"] = layer.lora_A.weight.detach().cpu().contiguous()
+        sd[f"unet.{name}.lora_B.weight"] = layer.lora_B.weight.detach().cpu().contiguous()
+    return sd
+
+
+def save_lora(layers: Dict[str, "LoRALinear"], out_dir: Path) -> Path:
+    from safetensors.torch import save_file
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / LORA_WEIGHTS
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.part")
+    save_file(lora_state_dict(layers), str(tmp))
+    os.replace(tmp, path)
+    return path
+
+
+def merge_lora_weights(unet, lora_path: Path) -> int:
+    """把 save_lora 写出的 LoRA 直接合并进 UNet 权重（W += B @ A）：pipe.load_lora_weights 不可用（未安装 peft）时的回退；
+    lora_path 可以是权重文件或其所在目录。返回合并的层数"""
+    from safetensors.torch import load_file
+    lora_path = Path(lora_path)
+    sd = load_file(str(lora_path / LORA_WEIGHTS if lora_path.is_dir() else lora_path))
+    merged = 0
+    for key, down in sd.items():
+        if not key.startswith("unet.") or not key.endswith(".lora_A.weight"):
+            continue
+        name = key[len("unet."):-len(".lora_A.weight")]
+        up = sd[f"unet.{name}.lora_B.weight"]
+        weight = unet.get_submodule(name).weight
+        with torch.no_grad():
+            weight += (up.float() @ down.float()).to(weight.device, weight.dtype)
+        merged += 1
+    return merged
+
+
+def build_tiny_models(seed: int = 0) -> Dict:
+    """微型模型（随机初始化，结构与 SD 相同）：VAE 下采样 2 倍、两级 UNet、2 层 CLIP 文本编码器"""
+    from diffusers import AutoencoderKL, DDPMScheduler, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+    torch.manual_seed(seed)
+    vae = AutoencoderKL(in_channels=3, out_channels=3, down_block_types=("DownEncoderBlock2D",) * 2,
+                        up_block_types=("UpDecoderBlock2D",) * 2, block_out_channels=(16, 32),
+                        latent_channels=4, norm_num_groups=8, sample_size=64)
+    unet = UNet2DConditionModel(sample_size=32, in_channels=4, out_channels=4, layers_per_block=1,
+                                block_out_channels=(32, 64), down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+                                up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"), cross_attention_dim=32,
+                                attention_head_dim=4, norm_num_groups=8)
+    text_encoder = CLIPTextModel(CLIPTextConfig(vocab_size=1000, hidden_size=32, intermediate_size=37,
+                                                num_hidden_layers=2, num_attention_heads=4,
+                                                max_position_embeddings=77, bos_token_id=0, eos_token_id=2,
+                                                pad_token_id=1))
+    return {"vae": vae, "unet": unet, "text_encoder": text_encoder, "tokenizer": None,
+            "scheduler": DDPMScheduler(num_train_timesteps=1000), "fingerprint": f"tiny:{seed}"}
+
+
+def load_models(model_id: str) -> Dict:
+    from diffusers import AutoencoderKL, DDPMScheduler, UNet2DConditionModel
+    from transformers import CLIPTextModel, CLIPTokenizer
+    return {
+        "vae": AutoencoderKL.from_pretrained(model_id, subfolder="vae"),
+        "unet": UNet2DConditionModel.from_pretrained(model_id, subfolder="unet"),
+        "text_encoder": CLIPTextModel.from_pretrained(model_id, subfolder="text_encoder"),
+        "tokenizer": CLIPTokenizer.from_pretrained(model_id, subfolder="tokenizer"),
+        "scheduler": DDPMScheduler.from_pretrained(model_id, subfolder="scheduler"),
+        "fingerprint": model_id,
+    }
+
+
+def encode_prompt(text_encoder, tokenizer, prompt: str, device) -> "torch.Tensor":
+    """提示词只编码一次（训练全程相同）；tokenizer 为 None（微型模型）时按字节映射 token id"""
+    if tokenizer is not None:
+        ids = tokenizer(prompt, padding="max_length", max_length=tokenizer.model_max_length, truncation=True,
+                        return_tensors="pt").input_ids
+    else:
+        n = text_encoder.config.max_position_embeddings
+        vocab = text_encoder.config.vocab_size
+        body = [3 + b % (vocab - 3) for b in prompt.encode("utf-8")][: n - 2]
+        ids = torch.tensor([[0, *body, 2] + [1] * (n - 2 - len(body))])
+    with torch.no_grad():
+        return text_encoder(ids.to(device))[0]
+
+
+def texture_views(rgba: np.ndarray, crop: int, crops: int, min_alpha: float, seed: int) -> List[Tuple[int, int, int]]:
+    """固定视图 (y, x, size)：从不透明占比 >= min_alpha 的 crop 窗口中按种子固定抽取最多 crops 个；
+    纹理小于 crop 或无满足条件的窗口时取整张纹理（size=0）"""
+    coords = patch_coords(rgba[..., 3], crop, min_alpha=min_alpha)
+    if len(coords) == 0:
+        return [(0, 0, 0)]
+    if len(coords) > crops:
+        coords = coords[np.sort(np.random.default_rng(seed).choice(len(coords), crops, replace=False))]
+    return [(int(y), int(x), crop) for y, x in coords]
+
+
+def render_view(rgba: np.ndarray, view: Tuple[int, int, int], resolution: int, augment: str) -> np.ndarray:
+    """裁剪 -> 缩放到 resolution -> alpha 合成到白底 -> 增强；返回 (3,R,R) float32 [-1,1]"""
+    y, x, size = view
+    region = rgba[y:y + size, x:x + size] if size else rgba
+    img = Image.fromarray(np.ascontiguousarray(region), "RGBA")
+    if img.width == img.height and img.width % resolution == 0:
+        img = img.reduce(img.width // resolution)
+    elif img.size != (resolution, resolution):
+        img = img.resize((resolution, resolution), Image.BILINEAR)
+    bg = Image.new("RGBA", img.size, (255, 255, 255, 255))
+    arr = np.asarray(Image.alpha_composite(bg, img).convert("RGB"), dtype=np.float32)
+    if augment == "hflip":
+        arr = arr[:, ::-1]
+    return np.ascontiguousarray(arr.transpose(2, 0, 1)) / 127.5 - 1.0
+
+
+def latent_cache_key(fingerprint: str, entries: List[Dict], params: Dict) -> str:
+    h = hashlib.sha256(json.dumps({"version": LATENT_VERSION, "vae": fingerprint, **params}, sort_keys=True).encode())
+    for e in entries:
+        p = Path(e["path"])
+        st = p.stat() if p.exists() else None
+        h.update(f"{e['path']}|{st.st_size if st else -1}|{st.st_mtime_ns if st else -1}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_latent_cache(cache_dir: Path) -> Tuple[Dict, np.memmap]:
+    index = json.loads((cache_dir / LATENT_INDEX).read_text(encoding="utf-8"))
+    lat = np.memmap(cache_dir / LATENT_FILE, dtype=np.float16, mode="r", shape=tuple(index["shape"]))
+    return index, lat
+
+
+def encode_latents(vae, entries: List[Dict], cache_dir: Path, key: str, params: Dict,
+                   batch_size: int = 4, device="cpu") -> Dict:
+    """一次性编码：逐纹理生成固定视图，按批送入 VAE，均值/标准差写入 (N,2,C,h,w) float16 内存映射；
+    样本数在枚举视图前未知，先写临时文件（按最大可能样本数预分配）再截断；索引最后写出，作为缓存有效标记"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    resolution, crop, crops = params["resolution"], params["crop"], params["crops"]
+    augments = params["augments"]
+    scale = vae.config.scaling_factor
+    factor = 2 ** (len(vae.config.block_out_channels) - 1)
+    c, h = vae.config.latent_channels, resolution // factor
+    capacity = len(entries) * max(crops, 1) * len(augments)
+    tmp = cache_dir / f"{LATENT_FILE}.{os.getpid()}.part"
+    lat = np.memmap(tmp, dtype=np.float16, mode="w+", shape=(capacity, 2, c, h, h))
+
+    samples: List[Dict] = []
+    missing: List[str] = []
+    batch: List[np.ndarray] = []
+
+    def flush():
+        with torch.no_grad():
+            dist = vae.encode(torch.from_numpy(np.stack(batch)).to(device)).latent_dist
+        n0 = len(samples) - len(batch)
+        lat[n0:len(samples), 0] = (dist.mean * scale).cpu().numpy()
+        lat[n0:len(samples), 1] = (dist.std * scale).cpu().numpy()
+        batch.clear()
+
+    t0 = time.perf_counter()
+    for i, e in enumerate(entries):
+        try:
+            rgba = load_rgba(Path(e["path"]))
+        except (OSError, ValueError):
+            missing.append(e["path"])
+            continue
+        for view in texture_views(rgba, crop, crops, params["min_alpha"], params["seed"] * 1000003 + i):
+            for aug in augments:
+                batch.append(render_view(rgba, view, resolution, aug))
+                samples.append({"model_id": e["model_id"], "texture": e["texture"], "view": list(view), "augment": aug})
+                if len(batch) >= batch_size:
+                    flush()
+        logger.info(f"潜变量编码 {i + 1}/{len(entries)}: {e['model_id']}/{e['texture']} 累计 {len(samples)} 个样本")
+    if batch:
+        flush()
+    lat.flush()
+    del lat
+    seconds = time.perf_counter() - t0
+
+    shape = [len(samples), 2, c, h, h]
+    os.truncate(tmp, int(np.prod(shape)) * 2)
+    os.replace(tmp, cache_dir / LATENT_FILE)
+    index = {"version": LATENT_VERSION, "key": key, "shape": shape, "dtype": "float16", "params": params,
+             "encode_seconds": seconds, "samples": samples, "missing": missing}
+    (cache_dir / LATENT_INDEX).write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    return index
+
+
+def prepare_latents(models: Dict, entries: List[Dict], cache_dir: Path, params: Dict, batch_size: int,
+                    device="cpu") -> Tuple[Dict, np.memmap, bool]:
+    """缓存键一致时复用已有潜变量；否则编码。返回 (索引, 内存映射, 是否命中)"""
+    key = latent_cache_key(models["fingerprint"], entries, params)
+    if (cache_dir / LATENT_INDEX).exists():
+        index, lat = load_latent_cache(cache_dir)
+        if index.get("key") == key:
+            return index, lat, True
+    vae = models["vae"].to(device).eval()
+    encode_latents(vae, entries, cache_dir, key, params, batch_size, device)
+    index, lat = load_latent_cache(cache_dir)
+    return index, lat, False
+
+
+@dataclass
+class TrainConfig:
+    rank: int = 4
+    lr: float = 1e-4
+    steps: int = 1000
+    batch_size: int = 1
+    grad_accum: int = 1
+    gradient_checkpointing: bool = True
+    precision: str = "auto"
+    checkpoint_every: int = 100
+    log_every: int = 50
+    seed: int = 0
+
+
+def cpu_supports_bf16() -> bool:
+    """CPU 是否有原生 bf16 指令（AVX512-BF16 / AMX）：没有时 bf16 autocast 走仿真，反而比 fp32 慢"""
+    try:
+        flags = Path("/proc/cpuinfo").read_text(encoding="utf-8", errors="ignore")
+    except OSError:
+        return False
+    return any(f in flags for f in ("avx512_bf16", "amx_bf16"))
+
+
+def resolve_precision(precision: str, device: str) -> str:
+    if precision != "auto":
+        return precision
+    if device == "cuda":
+        return "bf16" if torch.cuda.is_bf16_supported() else "fp32"
+    return "bf16" if cpu_supports_bf16() else "fp32"
+
+
+def autocast(device: str, precision: str):
+    if precision == "bf16":
+        return torch.autocast(device_type=device, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程峰值常驻内存（MB）；无 resource 模块（Windows）时为 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def save_checkpoint(path: Path, layers: Dict[str, "LoRALinear"], optimizer, step: int, gen, rng, losses: List[float],
+                    meta: Dict) -> None:
+    """原子写出（临时文件 + os.replace）：中断时保留上一个完整检查点"""
+    state = {"step": step, "lora": lora_state_dict(layers), "optimizer": optimizer.state_dict(),
+             "torch_rng": gen.get_state(), "np_rng": rng.bit_generator.state, "losses": losses, "meta": meta}
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.part")
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path: Path, layers: Dict[str, "LoRALinear"], optimizer, gen, rng, meta: Dict) -> Tuple[int, List[float]]:
+    """恢复 LoRA 参数、优化器与随机数状态；返回 (已完成步数, 损失记录)。rank/批设置/潜变量缓存不一致时拒绝恢复"""
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    diff = {k: (state["meta"].get(k), v) for k, v in meta.items() if state["meta"].get(k) != v}
+    if diff:
+        raise ValueError(f"检查点与当前配置不一致，无法恢复: {diff}")
+    for name, layer in layers.items():
+        layer.lora_A.weight.data.copy_(state["lora"][f"unet.{name}.lora_A.weight"])
+        layer.lora_B.weight.data.copy_(state["lora"][f"unet.{name}.lora_B.weight"])
+    optimizer.load_state_dict(state["optimizer"])
+    gen.set_state(state["torch_rng"])
+    rng.bit_generator.state = state["np_rng"]
+    return state["step"], state["losses"]
+
+
+def train_lora(models: Dict, latents: np.memmap, prompt: str, cfg: TrainConfig, out_dir: Path, device: str = "cpu",
+               resume: bool = False, latent_key: str = "") -> Tuple[Dict, Dict]:
+    """训练循环：每个优化步累积 grad_accum 个微批（内存映射取批 -> 按均值/标准差采样潜变量 -> 加噪 -> UNet -> MSE）；
+    UNet 开启梯度检查点、按需 bf16 autocast；每 checkpoint_every 步原子写出检查点与当前 LoRA 权重，resume 时从检查点继续。
+    返回 (LoRA 层, 统计)"""
+    unet, scheduler = models["unet"].to(device), models["scheduler"]
+    layers = inject_lora(unet, cfg.rank)
+    if cfg.gradient_checkpointing:
+        unet.enable_gradient_checkpointing()
+    unet.train()
+    params = [p for layer in layers.values() for p in (layer.lora_A.weight, layer.lora_B.weight)]
+    optimizer = torch.optim.AdamW(params, lr=cfg.lr)
+    cond = encode_prompt(models["text_encoder"].to(device).eval(), models["tokenizer"], prompt, device)
+    models["text_encoder"] = None
+    precision = resolve_precision(cfg.precision, device)
+
+    gen = torch.Generator().manual_seed(cfg.seed)
+    rng = np.random.default_rng(cfg.seed)
+    ckpt = out_dir / CHECKPOINT
+    meta = {"model": models["fingerprint"], "rank": cfg.rank, "batch_size": cfg.batch_size,
+            "grad_accum": cfg.grad_accum, "latent_key": latent_key}
+    start, losses = 0, []
+    if resume and ckpt.exists():
+        start, losses = load_checkpoint(ckpt, layers, optimizer, gen, rng, meta)
+        logger.info(f"从检查点恢复: step {start}/{cfg.steps}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    n, bs = latents.shape[0], cfg.batch_size
+    t0 = t_log = time.perf_counter()
+    for step in range(start, cfg.steps):
+        optimizer.zero_grad(set_to_none=True)
+        step_loss = 0.0
+        for _ in range(cfg.grad_accum):
+            idx = np.sort(rng.choice(n, bs, replace=n < bs))
+            stats = torch.from_numpy(np.asarray(latents[idx], dtype=np.float32))
+            z = stats[:, 0] + stats[:, 1] * torch.randn(stats[:, 0].shape, generator=gen)
+            noise = torch.randn(z.shape, generator=gen)
+            t = torch.randint(0, scheduler.config.num_train_timesteps, (bs,), generator=gen)
+            noisy = scheduler.add_noise(z, noise, t).to(device)
+            target = scheduler.get_velocity(z, noise, t) if scheduler.config.prediction_type == "v_prediction" else noise
+            with autocast(device, precision):
+                pred = unet(noisy, t.to(device), encoder_hidden_states=cond.expand(bs, -1, -1)).sample
+            loss = torch.nn.functional.mse_loss(pred.float(), target.to(device).float()) / cfg.grad_accum
+            loss.backward()
+            step_loss += loss.item()
+        optimizer.step()
+        losses.append(step_loss)
+        done = step + 1
+        if done % cfg.log_every == 0 or done == cfg.steps:
+            now = time.perf_counter()
+            window = min(cfg.log_every, done - start) or 1
+            rss = peak_rss_mb()
+            logger.info(f"step {done}/{cfg.steps} loss {np.mean(losses[-window:]):.4f} "
+                        f"{window / (now - t_log):.2f} steps/s "
+                        f"{window * bs * cfg.grad_accum / (now - t_log):.1f} samples/s"
+                        + (f" peak RSS {rss:.0f} MB" if rss is not None else ""))
+            t_log = now
+        if cfg.checkpoint_every and (done % cfg.checkpoint_every == 0 or done == cfg.steps):
+            save_checkpoint(ckpt, layers, optimizer, done, gen, rng, losses, meta)
+            save_lora(layers, out_dir)
+    seconds = time.perf_counter() - t0
+    ran = cfg.steps - start
+    tail = losses[-min(len(losses), cfg.log_every):]
+    return layers, {"steps": cfg.steps, "resumed_from": start, "train_seconds": seconds,
+                    "steps_per_sec": ran / seconds if seconds else 0.0, "precision": precision,
+                    "gradient_checkpointing": cfg.gradient_checkpointing, "grad_accum": cfg.grad_accum,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "loss_first": losses[0] if losses else None, "loss_last": float(np.mean(tail)) if tail else None,
+                    "lora_layers": len(layers), "lora_params": sum(p.numel() for p in params)}
 
 
 def main():
-    ap = argparse.ArgumentParser()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ap = argparse.ArgumentParser(description="Diffusers LoRA 训练（VAE 潜变量一次性预编码）")
     ap.add_argument('--manifest', default='experiments/lora_texture_manifest.json')
+    ap.add_argument('--root', default=None, help="清单中相对路径的根目录（数据集根）")
+    ap.add_argument('--split', default='train')
     ap.add_argument('--output', default='experiments/lora_out')
-    ap.add_argument('--model-id', default='stabilityai/sd-turbo')
+    ap.add_argument('--model-id', default=os.environ.get("DIFFUSERS_MODEL_ID", 'stabilityai/sd-turbo'))
+    ap.add_argument('--tiny', action='store_true', help="使用本地微型模型（CPU 端到端测试，不下载权重）")
+    ap.add_argument('--prompt', default=os.environ.get("DIFFUSERS_PROMPT", "high quality texture, cel shading, clean edges"))
     ap.add_argument('--rank', type=int, default=4)
     ap.add_argument('--lr', type=float, default=1e-4)
     ap.add_argument('--steps', type=int, default=1000)
+    ap.add_argument('--batch-size', type=int, default=1)
+    ap.add_argument('--grad-accum', type=int, default=4, help="梯度累积微批数（有效批 = batch-size x grad-accum）")
+    ap.add_argument('--no-gradient-checkpointing', action='store_true', help="关闭 UNet 梯度检查点（更快但更占内存）")
+    ap.add_argument('--precision', choices=["auto", "bf16", "fp32"], default=os.environ.get("LORA_PRECISION", "auto"),
+                    help="auto：CPU 有原生 bf16 指令（或 GPU 支持 bf16）时使用 bf16 autocast")
+    ap.add_argument('--checkpoint-every', type=int, default=100, help="每 N 步原子写出检查点与 LoRA 权重（0 关闭）")
+    ap.add_argument('--resume', action='store_true', help="从 <output>/checkpoint.pt 继续训练")
+    ap.add_argument('--log-every', type=int, default=10)
+    ap.add_argument('--resolution', type=int, default=512, help="训练分辨率（视图缩放后的边长）")
+    ap.add_argument('--crop', type=int, default=1024, help="固定裁剪窗口边长（像素，原纹理尺度）")
+    ap.add_argument('--crops', type=int, default=4, help="每张纹理的固定裁剪数")
+    ap.add_argument('--min-alpha', type=float, default=0.5, help="裁剪窗口最低不透明占比")
+    ap.add_argument('--augment', nargs='+', choices=AUGMENTS, default=list(AUGMENTS), help="固定增强（每个视图各编码一份）")
+    ap.add_argument('--latent-cache', default=None, help="潜变量缓存目录（默认 <output>/latents）")
+    ap.add_argument('--encode-batch', type=int, default=4)
+    ap.add_argument('--seed', type=int, default=0)
     args = ap.parse_args()
 
     mf = Path(args.manifest)
     if not mf.exists():
         raise SystemExit(f'Manifest 不存在: {mf}')
-    data = json.loads(mf.read_text(encoding='utf-8'))
-    train_list = data.get('train', [])
-    val_list = data.get('val', [])
+    if torch is None:
+        raise SystemExit('需要安装 torch 与 diffusers：pip install diffusers transformers accelerate torch')
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    entries = load_split_manifest(mf, args.split, Path(args.root) if args.root else None)
+    if not entries:
+        raise SystemExit(f'清单 {args.split} 为空: {mf}')
+
+    models = build_tiny_models(args.seed) if args.tiny else load_models(args.model_id)
+    out_dir = Path(args.output)
+    cache_dir = Path(args.latent_cache) if args.latent_cache else out_dir / "latents"
+    params = {"resolution": args.resolution, "crop": args.crop, "crops": args.crops, "min_alpha": args.min_alpha,
+              "augments": args.augment, "seed": args.seed}
+    index, latents, hit = prepare_latents(models, entries, cache_dir, params, args.encode_batch, device)
+    models["vae"] = None
+    if latents.shape[0] == 0:
+        raise SystemExit(f'没有可用样本（缺失 {len(index["missing"])} 个文件）')
+    logger.info(f"潜变量{'缓存命中' if hit else '编码完成'}: {latents.shape[0]} 个样本, 形状 {tuple(latents.shape[1:])}, "
+                f"{latents.nbytes / (1 << 20):.1f} MB")
 
-    print('=== LoRA 训练占位 ===')
-    print('模型:', args.model_id)
-    print('样本数: train', len(train_list), 'val', len(val_list))
-    print('rank:', args.rank, 'lr:', args.lr, 'steps:', args.steps)
-    print('输出目录:', args.output)
-    print('提示：请接入具体的LoRA训练逻辑，并调用 accelerate.launch 运行训练。')
+    cfg = TrainConfig(rank=args.rank, lr=args.lr, steps=args.steps, batch_size=args.batch_size,
+                      grad_accum=args.grad_accum, gradient_checkpointing=not args.no_gradient_checkpointing,
+                      precision=args.precision, checkpoint_every=args.checkpoint_every, log_every=args.log_every,
+                      seed=args.seed)
+    layers, stats = train_lora(models, latents, args.prompt, cfg, out_dir, device, args.resume, index["key"])
+    weights = save_lora(layers, out_dir)
+    report = {"model": models["fingerprint"], "textures": len(entries), "missing": len(index["missing"]),
+              "samples": latents.shape[0], "latent_cache": str(cache_dir), "latent_cache_hit": hit,
+              "encode_seconds": index["encode_seconds"],
+              "encode_seconds_per_sample": index["encode_seconds"] / latents.shape[0],
+              "weights": str(weights), "config": asdict(cfg), **stats}
+    (out_dir / "train_report.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
 
 
 if __name__ == '__main__':
     main()
-
-
@@ -1,89 +1,321 @@
 """
-动作模型训练占位：
-提供曲线统计与简单序列样本抽取的骨架，便于后续替换为RNN/Transformer训练。
+动作模型训练：
+- stats：曲线统计与简单序列样本（读取动作张量缓存）；未给出子命令时的默认，索引也可作为位置参数（train_motion_model.py <index>）
+- train：逐帧参数向量上的小型 GRU（自回归，预测下一帧各参数的高斯分布：均值 + 对数方差，按参数 mask 计算 NLL）
+  - 数据来自动作张量缓存（motion_cache.py：固定 fps 重采样后的 [total_frames, num_params] 内存映射），
+    首次使用时编译，index 指纹不变时直接复用，不再逐文件 json.loads
+  - 长度分桶采样（LengthBucketSampler）：每轮随机取大块样本池，池内按长度排序后按 token 预算切批，批次顺序再打乱；
+    动作时长从约 1 秒到 30 秒以上，随机成批时大部分算力耗在填充上
+  - 变长序列用 pack_padded_sequence 打包送入 GRU（填充帧不参与计算），损失再按时间/参数 mask 计算
+  - 多线程 CPU（--threads 设置 torch 线程数）；日志输出 tokens/秒（真实帧数）与填充占比
+  - 检查点包含权重、结构、参数词表、归一化统计与参数出现频率，infer_motion_model.py 据此采样新动作
 """
 
 from pathlib import Path
+import argparse
 import json
-from typing import Dict, List
-
-
-def collect_motion_stats(index_file: Path) -> Dict:
-    data = json.loads(index_file.read_text(encoding="utf-8"))
-    counts = 0
-    params = set()
-    for m in data.get("models", []):
-        motions = m.get("motions", {})
-        base = Path(m["model_path"])
-        for group in motions.values():
-            if not isinstance(group, list):
-                continue
-            for item in group:
-                f = item.get("File")
-                if not f:
-                    continue
-                p = base / f
-                try:
-                    motion = json.loads(p.read_text(encoding="utf-8"))
-                    for c in motion.get("Curves", []):
-                        if c.get("Target") == "Parameter" and c.get("Id"):
-                            params.add(c["Id"])
-                    counts += 1
-                except Exception:
-                    pass
-    return {"motion_files": counts, "unique_params": sorted(list(params))}
-
-
-def sample_param_sequences(index_file: Path, target_params: List[str], seq_len: int = 60) -> List[Dict]:
-    data = json.loads(index_file.read_text(encoding="utf-8"))
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dataset import maybe_import_torch
+from motion_cache import DEFAULT_FPS, MotionCache, ensure_cache
+
+logger = logging.getLogger(__name__)
+
+torch, _ = maybe_import_torch()
+_Module = torch.nn.Module if torch is not None else object
+
+MAX_FRAMES = 600
+MAX_TOKENS = 16384
+POOL_BATCHES = 50
+
+
+def collect_motion_stats(index_file: Path, cache_dir: Optional[Path] = None, root: Optional[Path] = None,
+                         fps: float = DEFAULT_FPS) -> Dict:
+    cache = ensure_cache(index_file, cache_dir, root, fps)
+    return {
+        "motion_files": len(cache),
+        "failed_files": len(cache.index["failed"]),
+        "unique_params": [p for j, p in enumerate(cache.params) if cache.mask[:, j].any()],
+        "fps": cache.fps,
+        "total_frames": int(cache.lengths.sum()),
+        "param_stats": cache.param_stats(),
+    }
+
+
+def sample_param_sequences(index_file: Path, target_params: List[str], seq_len: int = 60,
+                           cache_dir: Optional[Path] = None, root: Optional[Path] = None,
+                           fps: float = DEFAULT_FPS) -> List[Dict]:
+    """每个动作中被动画的目标参数取前 seq_len 帧（固定 fps 重采样值）"""
+    cache = ensure_cache(index_file, cache_dir, root, fps)
+    cols = {tp: cache.column(tp) for tp in target_params}
     samples: List[Dict] = []
-    for m in data.get("models", []):
-        base = Path(m["model_path"])
-        motions = m.get("motions", {})
-        for group in motions.values():
-            if not isinstance(group, list):
-                continue
-            for item in group:
-                f = item.get("File")
-                if not f:
-                    continue
-                p = base / f
-                try:
-                    motion = json.loads(p.read_text(encoding="utf-8"))
-                except Exception:
-                    continue
-                curves = motion.get("Curves", [])
-                # 建立 param -> timeline
-                param_to_points = {tp: [] for tp in target_params}
-                for c in curves:
-                    if c.get("Target") == "Parameter" and c.get("Id") in param_to_points:
-                        seg = c.get("Segments", [])
-                        # 解析线性段 (简化)
-                        if len(seg) >= 2:
-                            t0, v0 = float(seg[0]), float(seg[1])
-                            param_to_points[c["Id"]].append((t0, v0))
-                        i = 2
-                        while i + 2 < len(seg):
-                            # [1, t, v]
-                            if int(seg[i]) == 1:
-                                t, v = float(seg[i+1]), float(seg[i+2])
-                                param_to_points[c["Id"]].append((t, v))
-                                i += 3
-                            else:
-                                break
-                # 采样固定长度（插值省略）
-                for tp in target_params:
-                    pts = param_to_points.get(tp, [])
-                    if len(pts) >= 2:
-                        samples.append({"param": tp, "points": pts[:seq_len]})
+    for i, meta in enumerate(cache.motions):
+        if cache.lengths[i] < 2:
+            continue
+        frames = cache.motion(i)[:seq_len]
+        for tp, j in cols.items():
+            if j is not None and cache.mask[i, j]:
+                samples.append({"param": tp, "model_id": meta["model_id"], "motion": meta["file"], "fps": cache.fps,
+                                "values": frames[:, j].astype(float).tolist()})
     return samples
 
 
-if __name__ == "__main__":
-    import sys
-    index = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data/processed/index.json")
-    stats = collect_motion_stats(index)
-    seqs = sample_param_sequences(index, ["ParamAngleX", "ParamEyeLOpen"], seq_len=60)
-    print(json.dumps({"stats": stats, "sample_sequences": seqs[:5]}, ensure_ascii=False, indent=2))
+class LengthBucketSampler:
+    """按 token 预算成批：每轮把（打乱后的）样本切成 POOL_BATCHES 个批大小的池，池内按长度排序后贪心切批
+    （批内 最长长度 x 条数 <= max_tokens），最后打乱批次顺序。长度相近的动作同批，填充很少，且仍保持随机性"""
+
+    def __init__(self, lengths: Sequence[int], max_tokens: int = MAX_TOKENS, max_batch: int = 64,
+                 pool_batches: int = POOL_BATCHES, seed: int = 0):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.max_batch = max_batch
+        self.pool = max(1, pool_batches * max_batch)
+        self.seed, self.epoch = seed, 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def batches(self) -> List[np.ndarray]:
+        rng = np.random.default_rng([self.seed, self.epoch])
+        order = rng.permutation(len(self.lengths))
+        out: List[np.ndarray] = []
+        for p in range(0, len(order), self.pool):
+            pool = order[p:p + self.pool]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            start = 0
+            while start < len(pool):
+                end = start + 1
+                while (end < len(pool) and end - start < self.max_batch
+                       and (end + 1 - start) * self.lengths[pool[end]] <= self.max_tokens):
+                    end += 1
+                out.append(pool[start:end])
+                start = end
+        rng.shuffle(out)
+        return out
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.batches())
+
+    def __len__(self) -> int:
+        return len(self.batches())
+
+
+def padding_ratio(lengths: np.ndarray, batches: Sequence[np.ndarray]) -> float:
+    """填充帧占全部（填充后）帧的比例"""
+    padded = sum(int(lengths[b].max()) * len(b) for b in batches)
+    return 1.0 - float(lengths.sum()) / padded if padded else 0.0
+
+
+class MotionGRU(_Module):
+    """输入：归一化帧值（未动画的参数置 0）与参数 mask 拼接；输出：下一帧每个参数的 (均值, 对数方差)"""
+
+    def __init__(self, num_params: int, hidden: int = 256, layers: int = 2, dropout: float = 0.0):
+        super().__init__()
+        self.num_params = num_params
+        self.inp = torch.nn.Linear(2 * num_params, hidden)
+        self.gru = torch.nn.GRU(hidden, hidden, layers, batch_first=True, dropout=dropout if layers > 1 else 0.0)
+        self.out = torch.nn.Linear(hidden, 2 * num_params)
+
+    def _embed(self, x, mask):
+        return torch.relu(self.inp(torch.cat([x * mask, mask.expand_as(x)], dim=-1)))
 
+    def _head(self, y):
+        mu, logvar = self.out(y).chunk(2, dim=-1)
+        return mu, logvar.clamp(-8.0, 4.0)
 
+    def forward(self, x, mask, lengths):
+        """x: (B, T, P)，mask: (B, 1, P)，lengths: (B,)；填充帧经打包跳过"""
+        packed = torch.nn.utils.rnn.pack_padded_sequence(self._embed(x, mask), lengths.cpu(), batch_first=True,
+                                                         enforce_sorted=False)
+        y, _ = self.gru(packed)
+        y, _ = torch.nn.utils.rnn.pad_packed_sequence(y, batch_first=True, total_length=x.shape[1])
+        return self._head(y)
+
+    def step(self, x, mask, h=None):
+        """单帧自回归：x (B, 1, P) -> (mu, logvar, h)"""
+        y, h = self.gru(self._embed(x, mask), h)
+        mu, logvar = self._head(y)
+        return mu, logvar, h
+
+
+def normalization(cache: MotionCache) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """逐参数 (均值, 标准差, 最小值, 最大值)；未出现的参数取 (0, 1, 0, 0)"""
+    stats = cache.param_stats()
+    p = len(cache.params)
+    mean, std, lo, hi = np.zeros(p), np.ones(p), np.zeros(p), np.zeros(p)
+    for j, pid in enumerate(cache.params):
+        s = stats.get(pid)
+        if s:
+            mean[j], std[j], lo[j], hi[j] = s["mean"], max(s["std"], 1e-3), s["min"], s["max"]
+    return mean, std, lo, hi
+
+
+def make_batch(cache: MotionCache, idx: np.ndarray, mean: np.ndarray, std: np.ndarray, max_frames: int,
+               rng: np.random.Generator):
+    """批张量：长于 max_frames 的动作随机截取一个窗口；返回 (x (B,T,P), mask (B,1,P), lengths (B,))"""
+    lens = np.minimum(cache.lengths[idx], max_frames)
+    t = int(lens.max())
+    x = np.zeros((len(idx), t, len(cache.params)), dtype=np.float32)
+    for b, i in enumerate(idx):
+        full = cache.motion(int(i))
+        start = int(rng.integers(0, len(full) - lens[b] + 1))
+        x[b, :lens[b]] = (full[start:start + lens[b]] - mean) / std
+    mask = cache.mask[idx].astype(np.float32)[:, None, :]
+    x *= mask
+    return torch.from_numpy(x), torch.from_numpy(mask), torch.from_numpy(lens.astype(np.int64))
+
+
+def masked_nll(mu, logvar, target, mask, lengths):
+    """下一帧高斯 NLL：只计真实帧（时间 mask）与被动画参数（参数 mask）"""
+    t = torch.arange(target.shape[1])[None, :] < lengths[:, None]
+    w = t[..., None].float() * mask
+    nll = 0.5 * (logvar + (target - mu) ** 2 * torch.exp(-logvar))
+    return (nll * w).sum() / w.sum().clamp(min=1.0)
+
+
+def train_motion_gru(cache: MotionCache, out_path: Path, hidden: int = 256, layers: int = 2, epochs: int = 10,
+                     lr: float = 1e-3, max_tokens: int = MAX_TOKENS, max_batch: int = 64,
+                     max_frames: int = MAX_FRAMES, val_fraction: float = 0.05, bucketed: bool = True,
+                     threads: Optional[int] = None, seed: int = 0) -> Dict:
+    """训练并保存检查点；返回统计（tokens/秒、填充占比、各轮训练/验证 NLL）"""
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    usable = np.nonzero(cache.lengths >= 2)[0]
+    perm = rng.permutation(usable)
+    n_val = int(len(perm) * val_fraction)
+    val_idx, train_idx = perm[:n_val], perm[n_val:]
+    mean, std, lo, hi = normalization(cache)
+    lengths = np.minimum(cache.lengths, max_frames)
+
+    sampler = LengthBucketSampler(lengths[train_idx], max_tokens, max_batch, seed=seed)
+    model = MotionGRU(len(cache.params), hidden, layers)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    history: List[Dict] = []
+    tokens = seconds = 0.0
+    for epoch in range(epochs):
+        sampler.set_epoch(epoch)
+        batches = sampler.batches() if bucketed else _random_batches(len(train_idx), sampler, rng)
+        pad = padding_ratio(lengths[train_idx], batches)
+        model.train()
+        t0 = time.perf_counter()
+        ep_tokens, ep_loss = 0, 0.0
+        for b in batches:
+            x, mask, lens = make_batch(cache, train_idx[b], mean, std, max_frames, rng)
+            mu, logvar = model(x[:, :-1], mask, lens - 1)
+            loss = masked_nll(mu, logvar, x[:, 1:], mask, lens - 1)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+            n = int((lens - 1).sum())
+            ep_tokens += n
+            ep_loss += loss.item() * n
+        dt = time.perf_counter() - t0
+        tokens += ep_tokens
+        seconds += dt
+        row = {"epoch": epoch + 1, "train_nll": ep_loss / max(ep_tokens, 1), "tokens_per_sec": ep_tokens / dt,
+               "batches": len(batches), "padding": pad}
+        if n_val:
+            row["val_nll"] = evaluate_nll(model, cache, val_idx, mean, std, max_frames, max_tokens, max_batch)
+        history.append(row)
+        logger.info(f"epoch {epoch + 1}/{epochs} train NLL {row['train_nll']:.4f}"
+                    + (f" val NLL {row['val_nll']:.4f}" if n_val else "")
+                    + f" {row['tokens_per_sec']:,.0f} tokens/s 填充占比 {pad:.1%}")
+
+    state = {"model": model.state_dict(),
+             "config": {"num_params": len(cache.params), "hidden": hidden, "layers": layers},
+             "params": cache.params, "fps": cache.fps, "mean": mean, "std": std, "min": lo, "max": hi,
+             "param_freq": cache.mask[usable].mean(axis=0),
+             "median_duration": float(np.median(cache.lengths[usable]) / cache.fps)}
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(f"{out_path.name}.{os.getpid()}.part")
+    torch.save(state, tmp)
+    os.replace(tmp, out_path)
+    return {"train_motions": len(train_idx), "val_motions": int(n_val), "epochs": epochs, "bucketed": bucketed,
+            "threads": torch.get_num_threads(), "tokens": int(tokens), "seconds": seconds,
+            "tokens_per_sec": tokens / seconds if seconds else 0.0, "history": history, "checkpoint": str(out_path)}
+
+
+def _random_batches(n: int, sampler: LengthBucketSampler, rng: np.random.Generator) -> List[np.ndarray]:
+    """对照：不分桶，随机顺序按与分桶相同的平均批大小切批"""
+    avg = max(1, round(n / max(len(sampler.batches()), 1)))
+    order = rng.permutation(n)
+    return [order[i:i + avg] for i in range(0, n, avg)]
+
+
+def evaluate_nll(model, cache: MotionCache, idx: np.ndarray, mean, std, max_frames: int, max_tokens: int,
+                 max_batch: int) -> float:
+    model.eval()
+    rng = np.random.default_rng(0)
+    lengths = np.minimum(cache.lengths[idx], max_frames)
+    total = count = 0.0
+    with torch.no_grad():
+        for b in LengthBucketSampler(lengths, max_tokens, max_batch).batches():
+            x, mask, lens = make_batch(cache, idx[b], mean, std, max_frames, rng)
+            mu, logvar = model(x[:, :-1], mask, lens - 1)
+            n = float((lens - 1).sum())
+            total += masked_nll(mu, logvar, x[:, 1:], mask, lens - 1).item() * n
+            count += n
+    return total / max(count, 1.0)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ap = argparse.ArgumentParser(description="动作曲线统计 / GRU 动作模型训练")
+    ap.add_argument("index_path", nargs="?", default=None, metavar="index",
+                    help="索引文件（兼容旧用法 train_motion_model.py <index>，--index 优先）")
+    ap.add_argument("--index", default=None, help="索引文件（默认 data/processed/index.json）")
+    ap.add_argument("--root", default=None, help="index 中相对 model_path 的根目录（数据集根）")
+    ap.add_argument("--cache", default=None, help="动作张量缓存目录（默认 MOTION_CACHE_DIR 或 cache/motions）")
+    ap.add_argument("--fps", type=float, default=DEFAULT_FPS)
+    sub = ap.add_subparsers(dest="cmd", required=False)
+    sub.add_parser("stats", help="曲线统计与序列样本（未给出子命令时的默认）")
+    t = sub.add_parser("train", help="训练 GRU 动作模型")
+    t.add_argument("--out", default=os.environ.get("MOTION_MODEL_PATH", "experiments/motion_gru.pt"))
+    t.add_argument("--hidden", type=int, default=256)
+    t.add_argument("--layers", type=int, default=2)
+    t.add_argument("--epochs", type=int, default=10)
+    t.add_argument("--lr", type=float, default=1e-3)
+    t.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="每批帧数预算（最长长度 x 条数）")
+    t.add_argument("--max-batch", type=int, default=64)
+    t.add_argument("--max-frames", type=int, default=MAX_FRAMES, help="更长的动作随机截取该长度的窗口")
+    t.add_argument("--val-fraction", type=float, default=0.05)
+    t.add_argument("--no-bucket", action="store_true", help="对照：随机成批（不分桶）")
+    t.add_argument("--threads", type=int, default=os.cpu_count(), help="torch CPU 线程数")
+    t.add_argument("--seed", type=int, default=0)
+    argv = sys.argv[1:]
+    if not any(a in sub.choices for a in argv):
+        # 未给出子命令：默认 stats（否则可选位置参数 index 会被当作子命令名解析）
+        argv.append("stats")
+    args = ap.parse_args(argv)
+
+    index = Path(args.index or args.index_path or "data/processed/index.json")
+    root = Path(args.root) if args.root else None
+    cache_dir = Path(args.cache) if args.cache else None
+    if (args.cmd or "stats") == "stats":
+        stats = collect_motion_stats(index, cache_dir, root, args.fps)
+        stats.pop("param_stats")
+        seqs = sample_param_sequences(index, ["ParamAngleX", "ParamEyeLOpen"], seq_len=60, cache_dir=cache_dir,
+                                      root=root, fps=args.fps)
+        print(json.dumps({"stats": stats, "sample_sequences": seqs[:5]}, ensure_ascii=False, indent=2))
+        return
+    if torch is None:
+        raise SystemExit("训练需要安装 torch")
+    cache = ensure_cache(index, cache_dir, root, args.fps)
+    report = train_motion_gru(cache, Path(args.out), args.hidden, args.layers, args.epochs, args.lr, args.max_tokens,
+                              args.max_batch, args.max_frames, args.val_fraction, not args.no_bucket, args.threads,
+                              args.seed)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()